@@ -0,0 +1,201 @@
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from .backends import FFmpegBackend
+from .capacity import DEFAULT_LOAD_FACTOR, CapacityProfile, degrade_step
+from .models import InputSource, InputType, MediaInfo, StreamVariant
+from .recorder import SEGMENT_SECONDS
+from .telemetry import ProgressSample
+
+# Скорость ниже этой считается отставанием. С -re ffmpeg почти никогда не
+# показывает ровно 1.0x (out_time отстает на время старта), поэтому не 1.0
+DEGRADE_SPEED = 0.97
+# Сколько секунд подряд поток должен отставать, прежде чем его урезать
+DEGRADE_AFTER = 10.0
+# Сколько секунд подряд нужен запас, чтобы вернуть уровень назад
+RECOVER_AFTER = 60.0
+RECOVER_SPEED = 0.99
+# Без профиля calibrate: восстанавливаемся, только если занято меньше этой доли ядер
+RECOVER_LOAD_FACTOR = 0.6
+# Минимальная пауза между двумя изменениями одного потока
+ADAPT_COOLDOWN = 30.0
+
+
+@dataclass
+class StreamSpec:
+    """Everything needed to rebuild a stream's ffmpeg command."""
+
+    stream_key: str
+    input_source: InputSource
+    variants: List[StreamVariant]
+    output_base_url: str
+    audio_enabled: bool = True
+    media_info: Optional[MediaInfo] = None
+    ladder: bool = False
+    cpu_budget: Optional[float] = None
+    passthrough: bool = True
+    loglevel: Optional[str] = None
+    # абсолютный путь, чтобы демон писал туда же, куда указал CLI
+    record_dir: Optional[str] = None
+    segment_seconds: float = SEGMENT_SECONDS
+
+    def build_command(
+        self, variants: List[StreamVariant], progress_url: Optional[str] = "pipe:1"
+    ) -> List[str]:
+        """Build the command for a (possibly reduced) set of variants."""
+        backend = FFmpegBackend(
+            ladder=self.ladder,
+            cpu_budget=self.cpu_budget,
+            passthrough=self.passthrough,
+            progress_url=progress_url,
+            loglevel=self.loglevel,
+            record_dir=Path(self.record_dir) if self.record_dir else None,
+            segment_seconds=self.segment_seconds,
+        )
+        return backend.build_command(
+            stream_key=self.stream_key,
+            input_source=self.input_source,
+            variants=variants,
+            output_base_url=self.output_base_url,
+            audio_enabled=self.audio_enabled,
+            media_info=self.media_info,
+        )
+
+    def is_free(self, variant: StreamVariant) -> bool:
+        """Check whether a variant's video is copied from the source."""
+        backend = FFmpegBackend(passthrough=self.passthrough)
+        return backend.can_copy_video(variant, self.media_info)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["input_source"]["type"] = self.input_source.type.value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StreamSpec":
+        source = dict(data["input_source"])
+        source["type"] = InputType(source["type"])
+        return cls(
+            **{
+                **data,
+                "input_source": InputSource(**source),
+                "variants": [StreamVariant(**v) for v in data["variants"]],
+                "media_info": (
+                    MediaInfo(**data["media_info"]) if data.get("media_info") else None
+                ),
+            }
+        )
+
+
+@dataclass
+class AdaptiveState:
+    """Degradation state of one supervised stream.
+
+    ``levels[0]`` is the requested ladder, every next level is one
+    ``degrade_step`` cheaper; ``level`` points at the one running now.
+    """
+
+    spec: StreamSpec
+    levels: List[List[StreamVariant]] = field(default_factory=list)
+    level: int = 0
+    degradations: int = 0
+    recoveries: int = 0
+    below_since: Optional[float] = None
+    headroom_since: Optional[float] = None
+    changed_at: float = 0.0
+
+    def __post_init__(self) -> None:
+        if not self.levels:
+            self.levels = [self.spec.variants]
+
+    @property
+    def variants(self) -> List[StreamVariant]:
+        return self.levels[self.level]
+
+
+class AdaptivePolicy:
+    """Decide when a stream should be degraded or restored.
+
+    A stream is degraded one step after its speed stayed below
+    ``DEGRADE_SPEED`` for ``DEGRADE_AFTER`` seconds, and restored one step
+    after ``RECOVER_AFTER`` seconds of realtime encoding while the host has
+    room for the richer ladder (per the calibrated profile if there is
+    one). ``ADAPT_COOLDOWN`` seconds must pass between changes.
+    """
+
+    def __init__(
+        self,
+        cores: int,
+        profile: Optional[CapacityProfile] = None,
+        max_load: Optional[float] = None,
+    ):
+        self.profile = profile
+        if profile is not None:
+            # Стоимость лесенки известна: проверяем, влезет ли она в бюджет
+            self.max_load = max_load or profile.cores * DEFAULT_LOAD_FACTOR
+        else:
+            self.max_load = max_load or cores * RECOVER_LOAD_FACTOR
+
+    def decide(
+        self,
+        state: AdaptiveState,
+        sample: Optional[ProgressSample],
+        host_load: float,
+        now: float,
+    ) -> Optional[str]:
+        """Return ``"degrade"``, ``"recover"`` or None."""
+        if sample is None or sample.ended or sample.speed is None:
+            state.below_since = state.headroom_since = None
+            return None
+
+        if sample.speed < DEGRADE_SPEED:
+            state.headroom_since = None
+            if state.below_since is None:
+                state.below_since = now
+        else:
+            state.below_since = None
+            if sample.speed >= RECOVER_SPEED and self._has_headroom(state, host_load):
+                if state.headroom_since is None:
+                    state.headroom_since = now
+            else:
+                state.headroom_since = None
+
+        if now - state.changed_at < ADAPT_COOLDOWN:
+            return None
+        if state.below_since is not None and now - state.below_since >= DEGRADE_AFTER:
+            if state.level + 1 < len(state.levels) or degrade_step(
+                state.variants, state.spec.is_free
+            ):
+                return "degrade"
+        if (
+            state.level > 0
+            and state.headroom_since is not None
+            and now - state.headroom_since >= RECOVER_AFTER
+        ):
+            return "recover"
+        return None
+
+    def apply(self, state: AdaptiveState, decision: str, now: float) -> None:
+        """Move the stream one level in the decided direction."""
+        if decision == "degrade":
+            if state.level + 1 == len(state.levels):
+                cheaper = degrade_step(state.variants, state.spec.is_free)
+                if cheaper is None:
+                    return
+                state.levels.append(cheaper)
+            state.level += 1
+            state.degradations += 1
+        elif decision == "recover" and state.level > 0:
+            state.level -= 1
+            state.recoveries += 1
+        state.changed_at = now
+        state.below_since = state.headroom_since = None
+
+    def _has_headroom(self, state: AdaptiveState, host_load: float) -> bool:
+        if state.level == 0:
+            return False
+        if self.profile is None:
+            return host_load <= self.max_load
+        richer = self.profile.ladder_cost(state.levels[state.level - 1])
+        extra = richer - self.profile.ladder_cost(state.variants)
+        return host_load + extra <= self.max_load
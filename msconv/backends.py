@@ -1,7 +1,29 @@
-import subprocess
+import os
 from abc import ABC, abstractmethod
-from typing import List
-from .models import InputSource, StreamVariant
+from dataclasses import astuple, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from .codecs import X264_PRESETS, get_codec
+from .models import InputSource, InputType, MediaInfo, PublishTarget, StreamVariant
+from .probe import InputProber
+from .recorder import SEGMENT_SECONDS, segment_slave
+
+# Количество пикселей в кадре 1080p, используется как единица нагрузки
+_PIXELS_1080P = 1920 * 1080
+
+# Имя кодека в ffprobe для каждого аудио-энкодера ffmpeg
+AUDIO_ENCODER_CODECS = {
+    "aac": "aac",
+    "libfdk_aac": "aac",
+    "libmp3lame": "mp3",
+    "libopus": "opus",
+}
+
+# Допуск при сравнении разрешения варианта с разрешением источника
+_UPSCALE_TOLERANCE = 1.05
+
+# Расширение файлов, которые пишет муксер (в RTMP-URL расширения нет)
+_FORMAT_SUFFIXES = {"flv": "", "matroska": ".mkv", "mpegts": ".ts", "mp4": ".mp4"}
 
 
 class StreamBackend(ABC):
@@ -16,13 +38,77 @@ class StreamBackend(ABC):
         output_base_url: str,
         original_only: bool = False,
         audio_enabled: bool = True,
-    ) -> str:
-        """Build the streaming command."""
+        media_info: Optional[MediaInfo] = None,
+    ) -> List[str]:
+        """Build the streaming command as an argv list."""
         pass
 
 
 class FFmpegBackend(StreamBackend):
-    """FFmpeg-based streaming backend."""
+    """FFmpeg-based streaming backend.
+
+    In ladder mode every rung is scaled from the previous (larger) rung
+    instead of from the source, keyframes are aligned across rungs and the
+    x264 preset/threads of each rung are derived from ``cpu_budget`` cores.
+
+    Inputs are probed once through ``prober`` (results are cached on disk)
+    unless ``media_info`` is passed in; the probe is used to skip variants
+    that would upscale the source and to copy compatible audio. With
+    ``passthrough`` enabled, variants the source already satisfies are
+    published with ``-c:v copy`` and only the remaining rungs are encoded.
+
+    ``progress_url`` (e.g. ``pipe:1``) makes ffmpeg report structured
+    ``-progress`` telemetry every ``stats_period`` seconds instead of the
+    ``\r`` stats lines on stderr; ``loglevel`` sets ffmpeg's ``-loglevel``.
+
+    With ``shared_audio`` the audio track is encoded (or copied) once and
+    muxed into every variant through ``tee``, instead of running one
+    identical audio encoder per variant.
+
+    With ``record_dir`` every published stream is also recorded there,
+    one ``<stream_key>_<variant>`` directory of segments each (see
+    ``msconv.recorder``).
+
+    ``threads`` limits the encoder threads of every variant outside ladder
+    mode (ladder mode derives them from ``cpu_budget``).
+
+    ``output_format`` is the muxer of the variant outputs: FLV for
+    nginx-rtmp, or e.g. ``matroska`` to write ``<stream_key>_<label>.mkv``
+    files into the directory given as ``output_base_url``.
+
+    Commands are argv lists meant to be run without a shell; use
+    ``shlex.join`` to print them.
+    """
+
+    def __init__(
+        self,
+        ladder: bool = False,
+        cpu_budget: Optional[float] = None,
+        keyframe_interval: float = 2.0,
+        prober: Optional[InputProber] = None,
+        passthrough: bool = True,
+        progress_url: Optional[str] = None,
+        stats_period: float = 1.0,
+        loglevel: Optional[str] = None,
+        shared_audio: bool = True,
+        record_dir: Optional[Path] = None,
+        segment_seconds: float = SEGMENT_SECONDS,
+        threads: Optional[int] = None,
+        output_format: str = "flv",
+    ):
+        self.ladder = ladder
+        self.passthrough = passthrough
+        self.progress_url = progress_url
+        self.stats_period = stats_period
+        self.loglevel = loglevel
+        self.shared_audio = shared_audio
+        self.record_dir = record_dir
+        self.segment_seconds = segment_seconds
+        self.threads = threads
+        self.output_format = output_format
+        self.cpu_budget = cpu_budget
+        self.keyframe_interval = keyframe_interval
+        self.prober = prober or InputProber()
 
     def build_command(
         self,
@@ -32,87 +118,520 @@ class FFmpegBackend(StreamBackend):
         output_base_url: str,
         original_only: bool = False,
         audio_enabled: bool = True,
-    ) -> str:
-        """Build FFmpeg command string."""
-        input_spec = input_source.to_ffmpeg_input()
+        media_info: Optional[MediaInfo] = None,
+        cache_dir: Optional[Path] = None,
+    ) -> List[str]:
+        """Build FFmpeg command arguments.
+
+        With ``cache_dir`` every variant is also written to
+        ``<cache_dir>/<label>.mp4`` (see ``msconv.ladder_cache``).
+        """
+        command = self._ffmpeg_prefix() + input_source.to_ffmpeg_input()
 
         if original_only:
             return (
-                f"ffmpeg {input_spec} " f"-c copy -f flv {output_base_url}/{stream_key}"
+                command
+                + ["-c", "copy"]
+                + self._output_spec([f"{output_base_url}/{stream_key}"])
             )
 
-        has_audio = audio_enabled and self._detect_audio(input_source.path)
+        if media_info is None:
+            media_info = self.prober.probe(input_source)
+
+        has_audio = audio_enabled and media_info is not None and media_info.has_audio
+        variants = self.select_variants(variants, media_info)
+        copied = [self.can_copy_video(v, media_info) for v in variants]
+        encoded = [v for v, copy in zip(variants, copied) if not copy]
 
-        filter_complex = self._build_filter_complex(variants)
-        mappings = self._build_mappings(
-            variants, output_base_url, stream_key, has_audio
+        if encoded:
+            if self.ladder:
+                filter_complex = self._build_ladder_filter_complex(encoded)
+            else:
+                filter_complex = self._build_filter_complex(encoded)
+            command += ["-filter_complex", filter_complex]
+
+        suffix = _FORMAT_SUFFIXES.get(self.output_format, "")
+        urls = [[f"{output_base_url}/{stream_key}_{v.label}{suffix}"] for v in variants]
+        cache_files = None
+        if cache_dir is not None:
+            cache_files = [cache_dir / f"{v.label}.mp4" for v in variants]
+        return command + self._build_mappings(
+            variants, urls, [has_audio] * len(variants), media_info, copied, cache_files
         )
 
+    def build_fanout_command(
+        self,
+        input_source: InputSource,
+        targets: List[PublishTarget],
+        media_info: Optional[MediaInfo] = None,
+    ) -> List[str]:
+        """Build one command publishing several stream keys from one input.
+
+        The input is opened and decoded once. Variants with identical
+        encoding parameters are encoded once and written to all their
+        destinations through the ``tee`` muxer, and each distinct
+        resolution is scaled once.
+        """
+        if media_info is None and not all(t.original_only for t in targets):
+            media_info = self.prober.probe(input_source)
+
+        # сигнатура кодирования -> (вариант, копируется ли видео, есть ли аудио, URL)
+        outputs: Dict[Tuple, Tuple[StreamVariant, bool, bool, List[str]]] = {}
+        original_urls = []
+        for target in targets:
+            if target.original_only:
+                original_urls.append(f"{target.output_base_url}/{target.stream_key}")
+                continue
+
+            has_audio = (
+                target.audio_enabled and media_info is not None and media_info.has_audio
+            )
+            for variant in self.select_variants(target.variants, media_info):
+                copy = self.can_copy_video(variant, media_info)
+                signature = self._encode_signature(variant, copy, has_audio, media_info)
+                if signature not in outputs:
+                    outputs[signature] = (variant, copy, has_audio, [])
+                outputs[signature][3].append(
+                    f"{target.output_base_url}/{target.stream_key}_{variant.label}"
+                )
+
+        variants = [v for v, _, _, _ in outputs.values()]
+        copied = [copy for _, copy, _, _ in outputs.values()]
+        encoded = [v for v, copy in zip(variants, copied) if not copy]
+
+        command = self._ffmpeg_prefix() + input_source.to_ffmpeg_input()
+        if encoded:
+            if self.ladder:
+                filter_complex = self._build_ladder_filter_complex(encoded)
+            else:
+                filter_complex = self._build_filter_complex(encoded)
+            command += ["-filter_complex", filter_complex]
+        if variants:
+            command += self._build_mappings(
+                variants,
+                [urls for _, _, _, urls in outputs.values()],
+                [audio for _, _, audio, _ in outputs.values()],
+                media_info,
+                copied,
+            )
+        if original_urls:
+            command += ["-map", "0:v:0?", "-map", "0:a:0?", "-c", "copy"]
+            command += self._output_spec(original_urls)
+
+        return command
+
+    def build_copy_command(
+        self,
+        stream_key: str,
+        files: Dict[str, str],
+        output_base_url: str,
+        loop: bool = True,
+    ) -> List[str]:
+        """Publish pre-encoded variant files (label -> path) without encoding.
+
+        Every file is a separate input copied as-is to its
+        ``<stream_key>_<label>`` output (see ``msconv.transcode``).
+        """
+        command = self._ffmpeg_prefix()
+        for path in files.values():
+            command += InputSource(InputType.FILE, path, loop=loop).to_ffmpeg_input()
+        for i, label in enumerate(files):
+            command += ["-map", f"{i}:v:0", "-map", f"{i}:a:0?", "-c", "copy"]
+            command += self._output_spec([f"{output_base_url}/{stream_key}_{label}"])
+        return command
+
+    def build_audio_command(
+        self,
+        input_source: InputSource,
+        variant: StreamVariant,
+        output: str,
+        media_info: Optional[MediaInfo] = None,
+    ) -> List[str]:
+        """Build a command writing only the audio track of a variant to a file."""
         return (
-            f"ffmpeg {input_spec} " f'-filter_complex "{filter_complex}" ' f"{mappings}"
+            self._ffmpeg_prefix()
+            + input_source.to_ffmpeg_input()
+            + ["-vn"]
+            + self._audio_args(variant, media_info)
+            + ["-y", output]
         )
 
-    def _detect_audio(self, input_path: str) -> bool:
-        """Detect if input has audio streams."""
-        cmd = [
-            "ffprobe",
-            "-v",
-            "error",
-            "-select_streams",
-            "a",
-            "-show_entries",
-            "stream=index",
-            "-of",
-            "csv=p=0",
-            input_path,
-        ]
-        try:
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=5,
+    def cache_signature(
+        self,
+        variants: List[StreamVariant],
+        audio_enabled: bool = True,
+        media_info: Optional[MediaInfo] = None,
+    ) -> str:
+        """Describe how ``variants`` of an input would be encoded.
+
+        It is the encoding command with placeholders for the input and
+        outputs, so any change of variants or encoder options changes it.
+        """
+        plain = FFmpegBackend(
+            ladder=self.ladder,
+            cpu_budget=self.cpu_budget,
+            keyframe_interval=self.keyframe_interval,
+            prober=self.prober,
+            passthrough=self.passthrough,
+            shared_audio=self.shared_audio,
+            threads=self.threads,
+        )
+        command = plain.build_command(
+            stream_key="",
+            input_source=InputSource(InputType.FILE, "", loop=False, realtime=False),
+            variants=variants,
+            output_base_url="",
+            audio_enabled=audio_enabled,
+            media_info=media_info,
+        )
+        return " ".join(command)
+
+    def _encode_signature(
+        self,
+        variant: StreamVariant,
+        copy: bool,
+        has_audio: bool,
+        media_info: Optional[MediaInfo],
+    ) -> Tuple:
+        """Key under which identical variant outputs are encoded only once."""
+        audio = tuple(self._audio_args(variant, media_info) if has_audio else ["-an"])
+        if copy:
+            return ("copy", audio)
+        # Все параметры кодирования, кроме метки варианта
+        return astuple(replace(variant, label="")) + audio
+
+    def _output_spec(
+        self, urls: List[str], cache_file: Optional[Path] = None
+    ) -> List[str]:
+        """Build the muxer part of an output written to one or more URLs."""
+        records = self._record_slaves(urls) + _cache_slaves(cache_file)
+        if len(urls) == 1 and not records:
+            return ["-f", self.output_format, urls[0]]
+        # onfail=ignore: упавший получатель не останавливает остальных
+        onfail = ":onfail=ignore" if len(urls) > 1 else ""
+        slaves = [f"[f={self.output_format}{onfail}]{url}" for url in urls]
+        slaves += records
+        return ["-flags", "+global_header", "-f", "tee", "|".join(slaves)]
+
+    def _record_slaves(self, urls: List[str], select: str = "") -> List[str]:
+        """Build recording ``tee`` slaves, one per published stream name."""
+        if self.record_dir is None:
+            return []
+        return [
+            segment_slave(
+                self.record_dir / url.rsplit("/", 1)[-1], self.segment_seconds, select
             )
-            return bool(result.stdout.strip())
-        except Exception:
+            for url in urls
+        ]
+
+    def _ffmpeg_prefix(self) -> List[str]:
+        """Build ffmpeg executable with global options."""
+        prefix = ["ffmpeg"]
+        if self.loglevel:
+            prefix += ["-loglevel", self.loglevel]
+        if self.progress_url:
+            # Статистика уже есть в -progress, не засоряем ею лог
+            prefix += [
+                "-nostats",
+                "-progress",
+                self.progress_url,
+                "-stats_period",
+                f"{self.stats_period:g}",
+            ]
+        return prefix
+
+    def can_copy_video(
+        self, variant: StreamVariant, media_info: Optional[MediaInfo]
+    ) -> bool:
+        """Check whether the source video can be published as-is for a variant."""
+        if not self.passthrough or media_info is None or not media_info.has_video:
             return False
 
-    def _build_filter_complex(self, variants: List[StreamVariant]) -> str:
-        """Build FFmpeg filter complex for variants."""
-        num_variants = len(variants)
-        split_labels = [f"[v{i}]" for i in range(num_variants)]
-        scale_maps = [
-            f"[v{i}]scale={v.width}:{v.height}[v{i}out]" for i, v in enumerate(variants)
+        return (
+            get_codec(variant.video_codec).codec_name == media_info.video_codec
+            and (media_info.width, media_info.height) == (variant.width, variant.height)
+            and 0 < media_info.video_bitrate <= variant.bitrate_numeric
+        )
+
+    def select_variants(
+        self, variants: List[StreamVariant], media_info: Optional[MediaInfo]
+    ) -> List[StreamVariant]:
+        """Drop variants that would upscale the source.
+
+        The smallest variant is always kept so there is something to publish.
+        """
+        if media_info is None or not media_info.width or not media_info.height:
+            return variants
+
+        source_pixels = media_info.width * media_info.height * _UPSCALE_TOLERANCE
+        selected = [v for v in variants if v.width * v.height <= source_pixels]
+        if not selected:
+            selected = [min(variants, key=lambda v: v.width * v.height)]
+        return selected
+
+    def _audio_args(
+        self, variant: StreamVariant, media_info: Optional[MediaInfo]
+    ) -> List[str]:
+        """Build audio mapping, copying the source track when it already fits."""
+        if (
+            media_info is not None
+            and media_info.audio_codec
+            and AUDIO_ENCODER_CODECS.get(variant.audio_codec) == media_info.audio_codec
+            and (
+                not media_info.audio_bitrate
+                or media_info.audio_bitrate <= int(variant.audio_bitrate.rstrip("k"))
+            )
+        ):
+            return ["-map", "0:a:0", "-c:a", "copy"]
+        # FLV несет одну дорожку; в общем выходе на нее же опираются индексы select
+        return [
+            "-map",
+            "0:a:0",
+            "-c:a",
+            variant.audio_codec,
+            "-b:a",
+            variant.audio_bitrate,
         ]
 
-        split_filter = f"[0:v]split={num_variants}{''.join(split_labels)}"
+    def _build_filter_complex(self, variants: List[StreamVariant]) -> str:
+        """Build FFmpeg filter complex for variants.
+
+        Variants of the same resolution share one scaler whose output is
+        split between them.
+        """
+        sizes: Dict[Tuple[int, int], List[int]] = {}
+        for i, v in enumerate(variants):
+            sizes.setdefault((v.width, v.height), []).append(i)
+
+        split_labels = [f"[v{indexes[0]}]" for indexes in sizes.values()]
+        scale_maps = []
+        for (width, height), indexes in sizes.items():
+            outputs = "".join(f"[v{i}out]" for i in indexes)
+            if len(indexes) == 1:
+                scale_maps.append(f"[v{indexes[0]}]scale={width}:{height}{outputs}")
+            else:
+                scale_maps.append(
+                    f"[v{indexes[0]}]scale={width}:{height},"
+                    f"split={len(indexes)}{outputs}"
+                )
+
+        split_filter = f"[0:v]split={len(sizes)}{''.join(split_labels)}"
         return f"{split_filter}; {'; '.join(scale_maps)}"
 
+    def _build_ladder_filter_complex(self, variants: List[StreamVariant]) -> str:
+        """Build a cascaded filter complex: each rung scales the previous one."""
+        order = sorted(
+            range(len(variants)),
+            key=lambda i: variants[i].width * variants[i].height,
+            reverse=True,
+        )
+
+        chains = []
+        source = "[0:v]"
+        for step, i in enumerate(order):
+            variant = variants[i]
+            scale = f"scale={variant.width}:{variant.height}"
+            if step == len(order) - 1:
+                chains.append(f"{source}{scale}[v{i}out]")
+            else:
+                chains.append(f"{source}{scale},split=2[v{i}out][c{step}]")
+                source = f"[c{step}]"
+
+        return "; ".join(chains)
+
+    def _plan_rungs(self, variants: List[StreamVariant]) -> List[Tuple[str, int]]:
+        """Pick (preset, threads) for every rung from the CPU budget.
+
+        Whole cores are shared between rungs proportionally to their pixel
+        count (floor, then largest remainder), so the threads add up to the
+        budget. A rung left without a core still runs one thread, but one
+        preset faster. The preset is never slower than the one configured
+        on the variant.
+        """
+        budget = self.cpu_budget or float(os.cpu_count() or 1)
+        total_pixels = sum(v.width * v.height for v in variants) or 1
+
+        # Ядер на один поток 1080p: чем меньше, тем быстрее пресет
+        density = budget * _PIXELS_1080P / total_pixels
+        if density >= 4:
+            budget_preset = "medium"
+        elif density >= 2:
+            budget_preset = "faster"
+        elif density >= 1:
+            budget_preset = "veryfast"
+        elif density >= 0.5:
+            budget_preset = "superfast"
+        else:
+            budget_preset = "ultrafast"
+
+        cores = max(1, int(budget))
+        shares = [cores * v.width * v.height / total_pixels for v in variants]
+        threads = [int(share) for share in shares]
+        by_remainder = sorted(
+            range(len(variants)),
+            key=lambda i: (shares[i] - threads[i], shares[i]),
+            reverse=True,
+        )
+        for i in by_remainder[: cores - sum(threads)]:
+            threads[i] += 1
+
+        plan = []
+        for variant, rung_threads in zip(variants, threads):
+            preset = variant.preset
+            if preset in X264_PRESETS:
+                index = min(
+                    X264_PRESETS.index(preset), X264_PRESETS.index(budget_preset)
+                )
+                if rung_threads == 0:
+                    # ядра не хватило: вместо лишнего потока ускоряем пресет
+                    index = max(0, index - 1)
+                preset = X264_PRESETS[index]
+            plan.append((preset, max(1, rung_threads)))
+        return plan
+
     def _build_mappings(
         self,
         variants: List[StreamVariant],
-        base_url: str,
-        stream_key: str,
-        has_audio: bool,
-    ) -> str:
-        """Build FFmpeg output mappings."""
-        mappings = []
-
-        for i, variant in enumerate(variants):
-            audio_part = (
-                f"-map 0:a -c:a {variant.audio_codec} -b:a {variant.audio_bitrate}"
-                if has_audio
-                else "-an"
-            )
+        urls: List[List[str]],
+        audio: List[bool],
+        media_info: Optional[MediaInfo] = None,
+        copied: Optional[List[bool]] = None,
+        cache_files: Optional[List[Path]] = None,
+    ) -> List[str]:
+        """Build FFmpeg output mappings.
+
+        Every variant is written to its ``urls`` (through ``tee`` if there
+        are several) and to its ``cache_files`` entry. Variants flagged in
+        ``copied`` map the source video directly; the rest consume the
+        filter graph outputs in order. With ``shared_audio``, variants with
+        the same audio settings share one audio encode (see
+        ``_build_shared_output``).
+        """
+        copied = copied or [False] * len(variants)
+        cache_files = cache_files or [None] * len(variants)
+        encoded = [v for v, copy in zip(variants, copied) if not copy]
+
+        if self.ladder:
+            plan = self._plan_rungs(encoded)
+        else:
+            plan = [(v.preset, 0) for v in encoded]
+
+        # (map, параметры видео) для каждого варианта
+        videos: List[Tuple[str, List[str]]] = []
+        out_index = 0
+        for variant, copy in zip(variants, copied):
+            if copy:
+                videos.append(("0:v:0", ["-c:v", "copy"]))
+                continue
+            i = out_index
+            out_index += 1
+            videos.append((f"[v{i}out]", self._video_args(variant, *plan[i])))
 
-            mapping = (
-                f'-map "[v{i}out]" {audio_part} '
-                f"-c:v {variant.video_codec} -preset {variant.preset} "
-                f"-crf {variant.crf} -b:v {variant.bitrate} "
-                f"-maxrate {variant.bitrate} -bufsize {variant.buffer_size} "
-                f"-f flv {base_url}/{stream_key}_{variant.label}"
+        audio_parts = [
+            self._audio_args(v, media_info) if has_audio else None
+            for v, has_audio in zip(variants, audio)
+        ]
+        with_audio = [part for part in audio_parts if part is not None]
+        if self.shared_audio and len({tuple(p) for p in with_audio}) < len(with_audio):
+            return self._build_shared_output(videos, audio_parts, urls, cache_files)
+
+        mappings: List[str] = []
+        for (source, video_part), audio_part, variant_urls, cache_file in zip(
+            videos, audio_parts, urls, cache_files
+        ):
+            mappings += (
+                ["-map", source]
+                + (audio_part or ["-an"])
+                + video_part
+                + self._output_spec(variant_urls, cache_file)
             )
-            mappings.append(mapping)
+        return mappings
+
+    def _video_args(
+        self, variant: StreamVariant, preset: str, threads: int
+    ) -> List[str]:
+        """Build encoder options of one variant as option/value pairs."""
+        codec = get_codec(variant.video_codec)
+        keyframe_interval = variant.keyframe_interval
+        ladder_part = []
+        if self.ladder:
+            ladder_part = codec.threads_args(threads) + codec.no_scenecut_args()
+            # Выравниваем ключевые кадры между всеми вариантами
+            keyframe_interval = keyframe_interval or self.keyframe_interval
+        elif self.threads:
+            ladder_part = codec.threads_args(self.threads)
+        if keyframe_interval:
+            ladder_part += [
+                "-force_key_frames",
+                f"expr:gte(t,n_forced*{keyframe_interval:g})",
+            ]
+        return codec.video_args(variant, preset) + ladder_part
+
+    def _build_shared_output(
+        self,
+        videos: List[Tuple[str, List[str]]],
+        audio_parts: List[Optional[List[str]]],
+        urls: List[List[str]],
+        cache_files: List[Optional[Path]],
+    ) -> List[str]:
+        """Build one ``tee`` output where variants share their audio encode.
+
+        ffmpeg can't feed one encoded stream to several outputs, so all
+        variants go into a single output: video streams first, then one
+        audio stream per distinct audio setting, and every ``tee`` slave
+        picks its video and audio with ``select``.
+        """
+        mappings: List[str] = []
+        for i, (source, video_part) in enumerate(videos):
+            mappings += ["-map", source] + _for_stream(video_part, "v", i)
+
+        # параметры аудио -> индекс аудиопотока
+        audio_streams: Dict[Tuple[str, ...], int] = {}
+        for part in audio_parts:
+            if part is not None and tuple(part) not in audio_streams:
+                j = len(audio_streams)
+                audio_streams[tuple(part)] = j
+                mappings += _for_stream(part, "a", j)
+
+        slaves = []
+        for i, (part, variant_urls, cache_file) in enumerate(
+            zip(audio_parts, urls, cache_files)
+        ):
+            select = str(i)
+            if part is not None:
+                select += f",{len(videos) + audio_streams[tuple(part)]}"
+            # Один получатель варианта ведет себя как отдельный выход: его
+            # ошибка останавливает ffmpeg, а в fan-out не мешает остальным
+            onfail = ":onfail=ignore" if len(variant_urls) > 1 else ""
+            slaves += [
+                f"[f={self.output_format}{onfail}:select={select}]{url}"
+                for url in variant_urls
+            ]
+            slaves += self._record_slaves(variant_urls, select)
+            slaves += _cache_slaves(cache_file, select)
+        return mappings + ["-flags", "+global_header", "-f", "tee", "|".join(slaves)]
+
+
+def _cache_slaves(cache_file: Optional[Path], select: str = "") -> List[str]:
+    """Build the ``tee`` slave writing a variant to the ladder cache."""
+    if cache_file is None:
+        return []
+    # faststart: moov в начале, публикация из кэша стартует сразу;
+    # onfail=ignore: ошибка диска не мешает живому потоку
+    options = ["f=mp4", "movflags=+faststart", "onfail=ignore"]
+    if select:
+        options.append(f"select={select}")
+    return [f"[{':'.join(options)}]{cache_file}"]
+
 
-        return " ".join(mappings)
+def _for_stream(args: List[str], stream_type: str, index: int) -> List[str]:
+    """Qualify per-stream options with a stream specifier (-b:v -> -b:v:1)."""
+    qualified = []
+    for option, value in zip(args[::2], args[1::2]):
+        if option != "-map":
+            if option.endswith(f":{stream_type}"):
+                option += f":{index}"
+            else:
+                option += f":{stream_type}:{index}"
+        qualified += [option, value]
+    return qualified
@@ -0,0 +1,413 @@
+import csv
+import os
+import signal
+import shutil
+import socket
+import statistics
+import subprocess
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from .backends import FFmpegBackend
+from .capacity import busy_cores, read_cpu_times
+from .listers import NginxRtmpLister
+from .models import InputSource, InputType, MediaInfo, StreamVariant
+from .telemetry import ProgressParser, ProgressSample
+
+# Первые секунды каждой ступени не учитываем: ffmpeg и MediaMTX разгоняются
+BENCH_WARMUP = 5.0
+# Сколько ждать появления новых публикаторов в nginx-rtmp
+BENCH_LIVE_TIMEOUT = 30.0
+# Ступень провалена, если самый медленный публикатор медленнее этого
+REALTIME_THRESHOLD = 0.95
+
+
+@dataclass
+class BenchConfig:
+    """Parameters of a load test run."""
+
+    publishers: int
+    readers: int
+    variants: List[StreamVariant]
+    duration: float = 30.0
+    interval: float = 1.0
+    # Шаг нарастания числа публикаторов; 0 -- сразу все
+    ramp_step: int = 0
+    ladder: bool = False
+    width: int = 1920
+    height: int = 1080
+    rate: int = 30
+    nginx_rtmp_url: str = "rtmp://localhost:1935/live"
+    rtsp_url: str = "rtsp://localhost:8554"
+    nginx_host: str = "localhost"
+    nginx_stat_port: str = "8080"
+    stream_prefix: str = "bench"
+
+
+@dataclass
+class BenchSample:
+    """Host and ffmpeg state at one point of a run."""
+
+    time: float
+    publishers: int
+    readers: int
+    publishers_alive: int
+    readers_alive: int
+    cpu_cores: float
+    memory_mb: float
+    ffmpeg_rss_mb: float
+    publish_speed_min: Optional[float]
+    publish_speed_median: Optional[float]
+    publish_kbps: float
+    read_kbps: float
+
+
+@dataclass
+class BenchStage:
+    """Summary of one ramp step."""
+
+    publishers: int
+    readers: int
+    ok: bool = True
+    failure: str = ""
+    cpu_cores: float = 0.0
+    memory_mb: float = 0.0
+    publish_speed_min: Optional[float] = None
+    publish_kbps: float = 0.0
+    read_kbps: float = 0.0
+    samples: List[BenchSample] = field(default_factory=list)
+
+
+class BenchProcess:
+    """An ffmpeg child reporting ``-progress`` on stdout."""
+
+    def __init__(self, name: str, command: List[str]):
+        self.name = name
+        self.command = command
+        self.sample: Optional[ProgressSample] = None
+        self.process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        self._thread = threading.Thread(target=self._read_progress, daemon=True)
+        self._thread.start()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def rss_mb(self) -> float:
+        try:
+            with open(f"/proc/{self.process.pid}/statm") as f:
+                pages = int(f.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            return 0.0
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+    def stop(self) -> None:
+        if not self.alive:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+        except ProcessLookupError:
+            pass
+
+    def _read_progress(self) -> None:
+        parser = ProgressParser()
+        assert self.process.stdout is not None
+        for line in self.process.stdout:
+            sample = parser.feed(line.decode(errors="replace"))
+            if sample is not None:
+                self.sample = sample
+
+
+def _memory_used_mb() -> float:
+    info = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                info[key] = int(value.split()[0])
+    except (OSError, ValueError, IndexError):
+        return 0.0
+    return (info.get("MemTotal", 0) - info.get("MemAvailable", 0)) / 1024
+
+
+def wait_for_port(host: str, port: int, timeout: float) -> bool:
+    """Wait until a TCP port accepts connections."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1.0):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def compose_command() -> List[str]:
+    """Get the available docker compose invocation."""
+    if shutil.which("docker-compose"):
+        return ["docker-compose"]
+    return ["docker", "compose"]
+
+
+class LoadBench:
+    """Load test of the whole publish -> nginx-rtmp -> MediaMTX path.
+
+    Publishers encode a synthetic ``testsrc``/``sine`` source through
+    FFmpegBackend; readers pull variants over RTSP from MediaMTX without
+    decoding, round-robin across streams and variants. With
+    ``ramp_step`` publishers (and proportionally readers) are added step
+    by step, each step running ``duration`` seconds, until one fails.
+    """
+
+    def __init__(self, config: BenchConfig):
+        self.config = config
+        self.backend = FFmpegBackend(
+            ladder=config.ladder,
+            passthrough=False,
+            progress_url="pipe:1",
+            loglevel="error",
+        )
+        self.publishers: List[BenchProcess] = []
+        self.readers: List[BenchProcess] = []
+        self.samples: List[BenchSample] = []
+        self.lister = NginxRtmpLister(
+            config.nginx_host, config.nginx_stat_port, cache_ttl=0
+        )
+        self._started = 0.0
+
+    def run(
+        self, on_sample: Optional[Callable[[BenchStage, BenchSample], None]] = None
+    ) -> Dict[str, Any]:
+        """Run all stages and return the report."""
+        config = self.config
+        step = config.ramp_step or config.publishers
+        targets = list(range(step, config.publishers, step)) + [config.publishers]
+
+        stages: List[BenchStage] = []
+        self._started = time.monotonic()
+        try:
+            for publishers in targets:
+                readers = round(config.readers * publishers / config.publishers)
+                stage = self._run_stage(publishers, readers, on_sample)
+                stages.append(stage)
+                if not stage.ok:
+                    break
+        finally:
+            for process in self.readers + self.publishers:
+                process.stop()
+
+        passed = [s for s in stages if s.ok]
+        failed = next((s for s in stages if not s.ok), None)
+        return {
+            "config": {
+                **asdict(config),
+                "variants": [v.label for v in config.variants],
+            },
+            "max_sustained": (
+                {"publishers": passed[-1].publishers, "readers": passed[-1].readers}
+                if passed
+                else None
+            ),
+            "failure_point": (
+                {
+                    "publishers": failed.publishers,
+                    "readers": failed.readers,
+                    "reason": failed.failure,
+                }
+                if failed
+                else None
+            ),
+            "stages": [
+                {k: v for k, v in asdict(s).items() if k != "samples"} for s in stages
+            ],
+        }
+
+    def _run_stage(
+        self,
+        publishers: int,
+        readers: int,
+        on_sample: Optional[Callable[[BenchStage, BenchSample], None]],
+    ) -> BenchStage:
+        stage = BenchStage(publishers=publishers, readers=readers)
+        while len(self.publishers) < publishers:
+            self.publishers.append(self._start_publisher(len(self.publishers)))
+        # Читатели подключаются только к уже опубликованным потокам
+        if not self._wait_live():
+            stage.ok, stage.failure = False, "publishers did not go live"
+            return stage
+        while len(self.readers) < readers:
+            self.readers.append(self._start_reader(len(self.readers)))
+
+        stage_started = time.monotonic()
+        cpu_before = read_cpu_times()
+        while time.monotonic() - stage_started < self.config.duration:
+            time.sleep(self.config.interval)
+            cpu_after = read_cpu_times()
+            sample = self._sample(cpu_before, cpu_after)
+            cpu_before = cpu_after
+            if time.monotonic() - stage_started >= BENCH_WARMUP:
+                stage.samples.append(sample)
+            if on_sample:
+                on_sample(stage, sample)
+
+            if sample.publishers_alive < len(self.publishers):
+                stage.ok, stage.failure = False, "publisher exited"
+                break
+            if sample.readers_alive < len(self.readers):
+                stage.ok, stage.failure = False, "reader exited"
+                break
+
+        if stage.samples:
+            stage.cpu_cores = max(s.cpu_cores for s in stage.samples)
+            stage.memory_mb = max(s.memory_mb for s in stage.samples)
+            stage.publish_kbps = statistics.median(
+                s.publish_kbps for s in stage.samples
+            )
+            stage.read_kbps = statistics.median(s.read_kbps for s in stage.samples)
+            speeds = [
+                s.publish_speed_min
+                for s in stage.samples
+                if s.publish_speed_min is not None
+            ]
+            if speeds:
+                stage.publish_speed_min = statistics.median(speeds)
+                if stage.ok and stage.publish_speed_min < REALTIME_THRESHOLD:
+                    stage.ok = False
+                    stage.failure = (
+                        f"publishers below realtime "
+                        f"({stage.publish_speed_min:.2f}x)"
+                    )
+        self.samples.extend(stage.samples)
+        return stage
+
+    def _wait_live(self) -> bool:
+        expected = {p.name for p in self.publishers}
+        labels = {v.label for v in self._published_variants()}
+        deadline = time.monotonic() + BENCH_LIVE_TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                streams = self.lister.get_active_streams()
+            except RuntimeError:
+                streams = {}
+            if all(
+                name in streams and labels <= streams[name]["variants"]
+                for name in expected
+            ):
+                return True
+            if not all(p.alive for p in self.publishers):
+                return False
+            time.sleep(0.5)
+        return False
+
+    def _start_publisher(self, index: int) -> BenchProcess:
+        config = self.config
+        source = InputSource(
+            InputType.LAVFI,
+            f"testsrc=size={config.width}x{config.height}:rate={config.rate}[out0];"
+            f"sine=frequency={440 + index}[out1]",
+        )
+        command = self.backend.build_command(
+            stream_key=f"{config.stream_prefix}{index}",
+            input_source=source,
+            variants=config.variants,
+            output_base_url=config.nginx_rtmp_url,
+            media_info=self._media_info(),
+        )
+        return BenchProcess(f"{config.stream_prefix}{index}", command)
+
+    def _media_info(self) -> MediaInfo:
+        # Источник известен заранее, ffprobe не нужен
+        return MediaInfo(
+            width=self.config.width,
+            height=self.config.height,
+            fps=self.config.rate,
+            video_codec="rawvideo",
+            audio_codec="pcm_f64le",
+        )
+
+    def _published_variants(self) -> List[StreamVariant]:
+        # Варианты выше разрешения источника публикаторы пропускают
+        return self.backend.select_variants(self.config.variants, self._media_info())
+
+    def _start_reader(self, index: int) -> BenchProcess:
+        config = self.config
+        publisher = index % len(self.publishers)
+        variants = self._published_variants()
+        variant = variants[(index // len(self.publishers)) % len(variants)]
+        path = f"{config.stream_prefix}{publisher}_{variant.label}"
+        # Без декодирования; mpegts в /dev/null вместо -f null, чтобы
+        # ffmpeg считал принятые байты (битрейт в -progress)
+        command = [
+            "ffmpeg",
+            "-nostdin",
+            "-v",
+            "error",
+            "-progress",
+            "pipe:1",
+            "-stats_period",
+            "1",
+            "-rtsp_transport",
+            "tcp",
+            "-i",
+            f"{config.rtsp_url}/{path}",
+            "-c",
+            "copy",
+            "-f",
+            "mpegts",
+            "-y",
+            "/dev/null",
+        ]
+        return BenchProcess(f"reader{index}:{path}", command)
+
+    def _sample(
+        self, cpu_before: Optional[List[int]], cpu_after: Optional[List[int]]
+    ) -> BenchSample:
+        processes = self.publishers + self.readers
+        speeds = [
+            p.sample.speed
+            for p in self.publishers
+            if p.alive
+            and p.sample is not None
+            and p.sample.speed is not None
+            and p.sample.out_time >= BENCH_WARMUP
+        ]
+        return BenchSample(
+            time=round(time.monotonic() - self._started, 2),
+            publishers=len(self.publishers),
+            readers=len(self.readers),
+            publishers_alive=sum(p.alive for p in self.publishers),
+            readers_alive=sum(p.alive for p in self.readers),
+            cpu_cores=(
+                busy_cores(cpu_before, cpu_after) if cpu_before and cpu_after else 0.0
+            ),
+            memory_mb=_memory_used_mb(),
+            ffmpeg_rss_mb=sum(p.rss_mb() for p in processes if p.alive),
+            publish_speed_min=min(speeds) if speeds else None,
+            publish_speed_median=statistics.median(speeds) if speeds else None,
+            publish_kbps=sum(
+                p.sample.bitrate_kbps for p in self.publishers if p.sample and p.alive
+            ),
+            read_kbps=sum(
+                p.sample.bitrate_kbps for p in self.readers if p.sample and p.alive
+            ),
+        )
+
+
+def write_csv(samples: List[BenchSample], path: Path) -> None:
+    """Write the sample time series as CSV."""
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(BenchSample.__dataclass_fields__))
+        writer.writeheader()
+        for sample in samples:
+            writer.writerow(asdict(sample))
@@ -0,0 +1,268 @@
+import json
+import os
+import resource
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from .codecs import X264_PRESETS, get_codec
+from .models import StreamVariant
+
+CALIBRATION_FPS = 30
+# Доля ядер, которую по умолчанию можно занять кодированием
+DEFAULT_LOAD_FACTOR = 0.85
+# При деградации сначала ускоряем пресет до этого, потом выкидываем варианты
+DEGRADE_PRESET_FLOOR = "veryfast"
+
+
+def _profile_key(width: int, height: int, preset: str) -> str:
+    return f"{width}x{height}:{preset}"
+
+
+def children_cpu_seconds() -> float:
+    """CPU time used by waited-for child processes, user plus system."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _faster_preset(preset: str) -> Optional[str]:
+    if preset not in X264_PRESETS:
+        return None
+    index = X264_PRESETS.index(preset)
+    return X264_PRESETS[index - 1] if index > 0 else None
+
+
+@dataclass
+class CapacityProfile:
+    """Measured encode cost of this host.
+
+    ``costs`` maps ``"WxH:preset"`` to CPU-seconds spent per second of
+    ``fps`` video, i.e. the number of cores one rung keeps busy.
+    """
+
+    cores: int
+    fps: float = CALIBRATION_FPS
+    costs: Dict[str, float] = field(default_factory=dict)
+    calibrated_at: float = 0.0
+
+    def variant_cost(self, variant: StreamVariant, fps: float = 0.0) -> float:
+        """Estimate cores needed to encode a variant in realtime."""
+        pixels = variant.width * variant.height
+        cost = self.costs.get(
+            _profile_key(variant.width, variant.height, variant.preset)
+        )
+
+        if cost is None:
+            # Ищем ближайшую откалиброванную точку и масштабируем по пикселям
+            candidates = []
+            for key, value in self.costs.items():
+                size, _, preset = key.partition(":")
+                w, _, h = size.partition("x")
+                preset_distance = (
+                    abs(X264_PRESETS.index(preset) - X264_PRESETS.index(variant.preset))
+                    if preset in X264_PRESETS and variant.preset in X264_PRESETS
+                    else len(X264_PRESETS)
+                )
+                point_pixels = int(w) * int(h)
+                candidates.append(
+                    (preset_distance, abs(point_pixels - pixels), value, point_pixels)
+                )
+            if not candidates:
+                return 0.0
+            _, _, value, point_pixels = min(candidates)
+            cost = value * pixels / point_pixels
+
+        if fps:
+            cost *= fps / self.fps
+        # профиль снят на libx264, остальные кодеки пересчитываем
+        return cost * get_codec(variant.video_codec).cpu_factor
+
+    def ladder_cost(self, variants: List[StreamVariant], fps: float = 0.0) -> float:
+        """Estimate cores needed to encode a whole ladder."""
+        return sum(self.variant_cost(v, fps) for v in variants)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(asdict(self), indent=2))
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["CapacityProfile"]:
+        try:
+            return cls(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+
+
+def get_profile_path() -> Path:
+    """Get path of the persisted capacity profile."""
+    return Path("cache/capacity.json")
+
+
+def calibrate(
+    variants: List[StreamVariant],
+    presets: List[str],
+    duration: int = 5,
+    fps: int = CALIBRATION_FPS,
+    on_result: Optional[Callable[[str, float], None]] = None,
+) -> CapacityProfile:
+    """Benchmark encode cost of every variant resolution with every preset.
+
+    Each point encodes ``duration`` seconds of ``testsrc`` to ``-f null``;
+    the cost of generating the test pattern alone is measured separately
+    and subtracted.
+    """
+    profile = CapacityProfile(cores=os.cpu_count() or 1, fps=fps)
+
+    def run(args: List[str]) -> float:
+        cpu_before = children_cpu_seconds()
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-nostdin"] + args + ["-f", "null", "-"],
+            check=True,
+        )
+        return children_cpu_seconds() - cpu_before
+
+    sizes = sorted({(v.width, v.height, v.bitrate) for v in variants}, reverse=True)
+    for width, height, bitrate in sizes:
+        source = [
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc=size={width}x{height}:rate={fps}:duration={duration}",
+        ]
+        baseline = run(source)
+        for preset in presets:
+            cpu = run(source + ["-c:v", "libx264", "-preset", preset, "-b:v", bitrate])
+            cost = max(cpu - baseline, 0.0) / duration
+            key = _profile_key(width, height, preset)
+            profile.costs[key] = cost
+            if on_result:
+                on_result(key, cost)
+
+    profile.calibrated_at = time.time()
+    return profile
+
+
+def read_cpu_times() -> Optional[List[int]]:
+    """Read aggregate CPU jiffies from ``/proc/stat``."""
+    try:
+        with open("/proc/stat") as f:
+            return [int(x) for x in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+
+
+def busy_cores(before: List[int], after: List[int]) -> float:
+    """Number of busy cores between two ``read_cpu_times`` readings."""
+    deltas = [b - a for a, b in zip(before, after)]
+    total = sum(deltas) or 1
+    # idle + iowait
+    idle = deltas[3] + (deltas[4] if len(deltas) > 4 else 0)
+    return (os.cpu_count() or 1) * (total - idle) / total
+
+
+def measure_cpu_load(interval: float = 0.5) -> float:
+    """Measure how many cores are busy right now."""
+    before = read_cpu_times()
+    if before is None:
+        return os.getloadavg()[0]
+    time.sleep(interval)
+    after = read_cpu_times()
+    if after is None:
+        return os.getloadavg()[0]
+    return busy_cores(before, after)
+
+
+def degrade_step(
+    variants: List[StreamVariant],
+    is_free: Optional[Callable[[StreamVariant], bool]] = None,
+) -> Optional[List[StreamVariant]]:
+    """Make a ladder one step cheaper, or return None if it can't be.
+
+    Presets are sped up to ``DEGRADE_PRESET_FLOOR`` first, then the most
+    expensive rung is dropped, and only a single remaining rung goes below
+    the floor. Rungs marked by ``is_free`` (copied from the source) cost
+    nothing, so they are never touched.
+    """
+    floor = X264_PRESETS.index(DEGRADE_PRESET_FLOOR)
+    encoded = [v for v in variants if not (is_free and is_free(v))]
+    if not encoded:
+        return None
+
+    def speed_up(allow_below_floor: bool) -> Optional[List[StreamVariant]]:
+        changed = False
+        result = []
+        for v in variants:
+            preset = _faster_preset(v.preset) if v in encoded else None
+            if preset and (allow_below_floor or X264_PRESETS.index(preset) >= floor):
+                result.append(replace(v, preset=preset))
+                changed = True
+            else:
+                result.append(v)
+        return result if changed else None
+
+    faster = speed_up(allow_below_floor=False)
+    if faster:
+        return faster
+    if len(variants) > 1:
+        # стоимость кодирования растет с числом пикселей и ценой кодека
+        top = max(
+            encoded,
+            key=lambda v: v.width * v.height * get_codec(v.video_codec).cpu_factor,
+        )
+        return [v for v in variants if v is not top]
+    return speed_up(allow_below_floor=True)
+
+
+@dataclass
+class AdmissionResult:
+    """Outcome of an admission check."""
+
+    admitted: bool
+    variants: List[StreamVariant]
+    projected_load: float
+    budget: float
+    degraded: bool = False
+
+
+class AdmissionController:
+    """Decide whether a ladder fits into the host's CPU budget."""
+
+    def __init__(self, profile: CapacityProfile, max_load: Optional[float] = None):
+        self.profile = profile
+        self.max_load = max_load or profile.cores * DEFAULT_LOAD_FACTOR
+
+    def check(
+        self,
+        variants: List[StreamVariant],
+        current_load: float,
+        degrade: bool = True,
+        fps: float = 0.0,
+        is_free: Optional[Callable[[StreamVariant], bool]] = None,
+    ) -> AdmissionResult:
+        """Check (and optionally degrade) a ladder against the budget.
+
+        ``is_free`` marks variants that cost nothing to publish, e.g. ones
+        whose video is copied from the source.
+        """
+
+        def projected(ladder: List[StreamVariant]) -> float:
+            encoded = [v for v in ladder if not (is_free and is_free(v))]
+            return current_load + self.profile.ladder_cost(encoded, fps)
+
+        current = variants
+        load = projected(current)
+        degraded = False
+        while degrade and load > self.max_load:
+            cheaper = degrade_step(current, is_free)
+            if cheaper is None:
+                break
+            current, load, degraded = cheaper, projected(cheaper), True
+
+        return AdmissionResult(
+            admitted=load <= self.max_load,
+            variants=current,
+            projected_load=load,
+            budget=self.max_load,
+            degraded=degraded,
+        )
@@ -1,19 +1,37 @@
 import os
+import shlex
 import sys
-import curses
+import fnmatch
+import tempfile
 import time
 import click
-from typing import List
-from .models import InputSource, InputType
-from .backends import FFmpegBackend
-from .listers import NginxRtmpLister
-from .players import VLCPlayer, FFplayPlayer
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Тяжелые модули (requests, curses, asyncio) импортируются внутри команд,
+# чтобы `msconv stop` и `msconv --help` не платили за них при запуске
+from .client import DaemonClient
+from .log_options import FFMPEG_LOGLEVELS, LOG_BACKUPS, LOG_MAX_BYTES
+from .recorder import (
+    RECORD_MAX_AGE,
+    RECORD_MAX_BYTES,
+    SEGMENT_SECONDS,
+    get_record_dir,
+    prune_recordings,
+)
+from .profiles import PROFILE_DEFAULT, PROFILE_LOW_LATENCY, PROFILES, apply_profile
 from .utils import (
+    KILL_TIMEOUT,
+    STOP_TIMEOUT,
     get_default_variants,
     parse_variants,
     get_log_file,
+    find_local_stream,
     is_stream_active,
+    list_local_streams,
+    split_group_key,
     start_ffmpeg_process,
+    stop_processes,
     stop_stream_process,
     tail_logs,
 )
@@ -24,29 +42,30 @@ def interactive_select(stream_descriptions: List[str]) -> int:
     Use curses to let the user navigate up/down through `stream_keys` (a list of strings)
     and press ENTER to choose one. Returns the selected key (string).
     """
+    import curses
+    from .dashboard import DiffRenderer
 
     def _inner(stdscr):
         curses.curs_set(0)
         curses.start_color()
         curses.use_default_colors()
         stdscr.bkgd(" ", curses.color_pair(0))
+        # перерисовываем только изменившиеся строки
+        renderer = DiffRenderer(stdscr)
         idx = 0
         n = len(stream_descriptions)
         while True:
-            stdscr.clear()
-            stdscr.addstr(0, 0, "Select a stream (↑↓ to move, ENTER to select):")
             h, w = stdscr.getmaxyx()
             win_size = h - 2
             start = max(0, idx - win_size // 2)
             end = min(n, start + win_size)
+            lines = [("Select a stream (↑↓ to move, ENTER to select):", 0)]
             for i, key in enumerate(stream_descriptions[start:end], start):
                 if i == idx:
-                    stdscr.attron(curses.A_REVERSE)
-                    stdscr.addstr(i - start + 1, 0, f"> {key}")
-                    stdscr.attroff(curses.A_REVERSE)
+                    lines.append((f"> {key}", curses.A_REVERSE))
                 else:
-                    stdscr.addstr(i - start + 1, 0, f"  {key}")
-            stdscr.refresh()
+                    lines.append((f"  {key}", 0))
+            renderer.render(lines)
             ch = stdscr.getch()
             if ch in (curses.KEY_UP, ord("k")) and idx > 0:
                 idx -= 1
@@ -54,9 +73,8 @@ def interactive_select(stream_descriptions: List[str]) -> int:
                 idx += 1
             elif ch in (curses.KEY_ENTER, 10, 13):
                 return idx
-            else:
-                # немного ждем, чтобы не нагружать процессор
-                time.sleep(0.01)
+            elif ch == curses.KEY_RESIZE:
+                renderer.invalidate()
 
     return curses.wrapper(_inner)
 
@@ -67,8 +85,39 @@ def cli():
     pass
 
 
+# Опции publish, которые относятся к одному потоку и с --manifest не действуют
+_PER_STREAM_OPTIONS = [
+    "stream_key",
+    "input_file",
+    "device",
+    "input_rtmp",
+    "input_rtsp",
+    "input_udp",
+    "input_http",
+    "prepared",
+    "original",
+    "variants",
+    "no_audio",
+    "no_loop",
+    "auto_ladder",
+    "bandwidths",
+    "codec",
+    "codec_below",
+    "admission",
+    "max_load",
+    "cache",
+    "cache_max_size",
+]
+
+
 @cli.command()
-@click.option("--stream-key", "-s", required=True, help="Base stream key")
+@click.option("--stream-key", "-s", help="Base stream key")
+@click.option(
+    "--manifest",
+    "-m",
+    type=click.Path(exists=True, dir_okay=False),
+    help="YAML/JSON file declaring many streams to publish at once",
+)
 @click.option(
     "--input-file", "-i", type=click.Path(exists=True), help="Path to local video file"
 )
@@ -77,30 +126,213 @@ def cli():
 @click.option("--input-rtsp", help="RTSP source URL")
 @click.option("--input-udp", help="UDP source (e.g. 127.0.0.1:1234)")
 @click.option("--input-http", help="HTTP/HTTPS source URL")
+@click.option(
+    "--prepared",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory from msconv transcode: publish its variants with -c copy",
+)
 @click.option("--original", "-o", is_flag=True, help="Stream original without variants")
 @click.option("--variants", "-v", help="Custom variants (label:bitrate:width:height)")
 @click.option("--no-audio", is_flag=True, help="Disable audio encoding")
 @click.option("--no-loop", is_flag=True, help="Don't loop input file")
+@click.option(
+    "--ladder",
+    is_flag=True,
+    help="Cascade scaling between variants with aligned keyframes",
+)
+@click.option(
+    "--auto-ladder",
+    is_flag=True,
+    help="Generate variants from the probed source and --bandwidths",
+)
+@click.option(
+    "--bandwidths",
+    help="Viewer bandwidths in kbit/s for --auto-ladder (e.g. 6000,3000,1200)",
+)
+@click.option(
+    "--codec",
+    help="Video codec of the variants: x264 (nginx-rtmp accepts H.264 only)",
+)
+@click.option(
+    "--codec-below",
+    type=int,
+    help="Use --codec only for variants at most this tall (e.g. 480)",
+)
+@click.option(
+    "--cpu-budget",
+    type=float,
+    help="CPU cores available to this stream in ladder mode (default: all)",
+)
+@click.option(
+    "--no-passthrough",
+    is_flag=True,
+    help="Re-encode variants even if the source already matches them",
+)
+@click.option(
+    "--profile",
+    type=click.Choice(PROFILES),
+    default=PROFILE_DEFAULT,
+    show_default=True,
+    help="Encoding profile (lowlatency: zerolatency tune, 1s GOP, no B-frames)",
+)
+@click.option(
+    "--loglevel",
+    type=click.Choice(FFMPEG_LOGLEVELS),
+    help="ffmpeg log level for this stream (default: ffmpeg's own, info)",
+)
+@click.option(
+    "--admission",
+    type=click.Choice(["degrade", "refuse", "off"]),
+    default="degrade",
+    show_default=True,
+    help="What to do when the host can't sustain the ladder (needs calibrate)",
+)
+@click.option(
+    "--max-load",
+    type=float,
+    help="Host CPU budget in cores for admission (default: 85% of cores)",
+)
+@click.option(
+    "--record",
+    is_flag=True,
+    help="Also record every variant to local segments (see play --at)",
+)
+@click.option(
+    "--segment-time",
+    default=SEGMENT_SECONDS,
+    show_default=True,
+    help="Length of recorded segments in seconds",
+)
+@click.option(
+    "--cache",
+    is_flag=True,
+    help="Cache the ladder of a looped file and publish it with -c copy",
+)
+@click.option(
+    "--cache-max-size",
+    type=float,
+    help="Disk budget of the ladder cache in GB (default: 20)",
+)
 @click.option(
     "--nginx-rtmp-url",
     default="rtmp://localhost:1935/live",
     help="RTMP output URL (default: rtmp://localhost:1935/live)",
 )
+@click.option(
+    "--concurrency",
+    default=8,
+    show_default=True,
+    help="Manifest: inputs probed in parallel",
+)
+@click.option(
+    "--stagger",
+    default=0.2,
+    show_default=True,
+    help="Manifest: seconds between consecutive stream starts",
+)
+@click.option(
+    "--live-timeout",
+    default=30.0,
+    show_default=True,
+    help="Manifest: seconds to wait for all streams to go live (0 to skip)",
+)
+@click.option(
+    "--no-fanout",
+    is_flag=True,
+    help="Manifest: run one ffmpeg per stream even if streams share an input",
+)
+@click.option("--nginx-host", default="localhost", help="nginx-rtmp host (manifest)")
+@click.option("--nginx-stat-port", default="8080", help="nginx-rtmp stat port")
 def publish(
     stream_key,
+    manifest,
     input_file,
     device,
     input_rtmp,
     input_rtsp,
     input_udp,
     input_http,
+    prepared,
     original,
     variants,
     no_audio,
     no_loop,
+    ladder,
+    auto_ladder,
+    bandwidths,
+    codec,
+    codec_below,
+    cpu_budget,
+    no_passthrough,
+    profile,
+    loglevel,
+    admission,
+    max_load,
+    record,
+    segment_time,
+    cache,
+    cache_max_size,
     nginx_rtmp_url,
+    concurrency,
+    stagger,
+    live_timeout,
+    no_fanout,
+    nginx_host,
+    nginx_stat_port,
 ):
-    """Publish a new stream."""
+    """Publish a new stream (or many, with --manifest)."""
+    from .adaptive import StreamSpec
+    from .backends import FFmpegBackend
+    from .codecs import apply_codec, check_rtmp_codecs
+    from .capacity import (
+        AdmissionController,
+        CapacityProfile,
+        get_profile_path,
+        measure_cpu_load,
+    )
+    from .ladder import generate_ladder, parse_bandwidths
+    from .ladder_cache import LADDER_CACHE_BYTES, LadderCache
+    from .manifest import build_input_source
+    from .models import InputType
+
+    record_dir = get_record_dir() if record else None
+    if manifest:
+        # настройки отдельного потока задаются в самом манифесте; молча их
+        # не применять хуже, чем отказать
+        context = click.get_current_context()
+        per_stream = [
+            param.opts[0]
+            for param in context.command.params
+            if param.name in _PER_STREAM_OPTIONS
+            and context.get_parameter_source(param.name)
+            != click.core.ParameterSource.DEFAULT
+        ]
+        if per_stream:
+            raise click.UsageError(
+                f"{', '.join(per_stream)} can't be combined with --manifest"
+            )
+        publish_manifest(
+            manifest,
+            ladder=ladder,
+            cpu_budget=cpu_budget,
+            passthrough=not no_passthrough,
+            profile=profile,
+            loglevel=loglevel,
+            record_dir=record_dir,
+            segment_seconds=segment_time,
+            nginx_rtmp_url=nginx_rtmp_url,
+            concurrency=concurrency,
+            stagger=stagger,
+            live_timeout=live_timeout,
+            fanout=not no_fanout,
+            nginx_host=nginx_host,
+            nginx_stat_port=nginx_stat_port,
+        )
+        return
+
+    if not stream_key:
+        click.echo("Error: --stream-key is required without --manifest", err=True)
+        sys.exit(1)
 
     # Если stream_key уже активен, выводим ошибку
     if is_stream_active(stream_key):
@@ -108,50 +340,278 @@ def publish(
         sys.exit(1)
 
     inputs = [
-        bool(input_file),
-        bool(device),
-        bool(input_rtmp),
-        bool(input_rtsp),
-        bool(input_udp),
-        bool(input_http),
+        (InputType.FILE, input_file),
+        (InputType.DEVICE, device),
+        (InputType.RTMP, input_rtmp),
+        (InputType.RTSP, input_rtsp),
+        (InputType.UDP, input_udp),
+        (InputType.HTTP, input_http),
     ]
-    if sum(inputs) != 1:
+    inputs = [(input_type, value) for input_type, value in inputs if value]
+    if len(inputs) + bool(prepared) != 1:
         click.echo("Error: specify exactly one input source", err=True)
         sys.exit(1)
 
-    if input_file:
-        input_source = InputSource(
-            InputType.FILE, os.path.abspath(input_file), not no_loop
+    if prepared:
+        publish_prepared(
+            stream_key,
+            Path(prepared),
+            loop=not no_loop,
+            loglevel=loglevel,
+            record_dir=record_dir,
+            segment_seconds=segment_time,
+            nginx_rtmp_url=nginx_rtmp_url,
         )
-    elif device:
-        input_source = InputSource(InputType.DEVICE, device)
-    elif input_rtmp:
-        input_source = InputSource(InputType.RTMP, input_rtmp)
-    elif input_rtsp:
-        input_source = InputSource(InputType.RTSP, input_rtsp)
-    elif input_udp:
-        input_source = InputSource(InputType.UDP, input_udp)
-    elif input_http:
-        input_source = InputSource(InputType.HTTP, input_http)
+        return
+
+    input_source = build_input_source(*inputs[0], loop=not no_loop)
 
     # парсим варианты
     stream_variants = get_default_variants()
     if variants:
         stream_variants = parse_variants(variants)
+    stream_variants, input_source = apply_profile(
+        profile, stream_variants, input_source
+    )
 
     # билдим команду для ffmpeg
-    backend = FFmpegBackend()
-    command = backend.build_command(
-        stream_key=stream_key,
-        input_source=input_source,
-        variants=stream_variants,
-        output_base_url=nginx_rtmp_url,
-        original_only=original,
-        audio_enabled=not no_audio,
+    # Демону нужны метрики прогресса ffmpeg в stdout
+    client = DaemonClient()
+    use_daemon = client.is_available()
+    backend = FFmpegBackend(
+        ladder=ladder,
+        cpu_budget=cpu_budget,
+        passthrough=not no_passthrough,
+        progress_url="pipe:1" if use_daemon else None,
+        loglevel=loglevel,
+        record_dir=record_dir,
+        segment_seconds=segment_time,
     )
+    media_info = None
+    if not original:
+        media_info = backend.prober.probe(input_source)
+        if media_info is not None and auto_ladder and media_info.width:
+            stream_variants, _ = apply_profile(
+                profile,
+                generate_ladder(
+                    media_info,
+                    parse_bandwidths(bandwidths) if bandwidths else None,
+                    audio=not no_audio,
+                ),
+                input_source,
+            )
+            click.echo(
+                "Generated ladder: "
+                + ", ".join(
+                    f"{v.label} {v.width}x{v.height} {v.bitrate} ({v.preset})"
+                    for v in stream_variants
+                )
+            )
+        elif auto_ladder:
+            click.echo(
+                "Warning: source resolution unknown, using default variants", err=True
+            )
+
+        if media_info is None:
+            click.echo("Warning: failed to probe input, using all variants", err=True)
+        else:
+            selected = backend.select_variants(stream_variants, media_info)
+            skipped = [v.label for v in stream_variants if v not in selected]
+            if skipped:
+                click.echo(
+                    f"Source is {media_info.width}x{media_info.height}, "
+                    f"skipping upscaled variants: {', '.join(skipped)}"
+                )
+            copied = [
+                v.label for v in selected if backend.can_copy_video(v, media_info)
+            ]
+            if copied:
+                click.echo(
+                    f"Source matches variants, copying video: {', '.join(copied)}"
+                )
+
+    if not original:
+        try:
+            if codec:
+                stream_variants = apply_codec(stream_variants, codec, codec_below)
+            check_rtmp_codecs(stream_variants)
+        except ValueError as e:
+            click.echo(f"Error: {e}", err=True)
+            sys.exit(1)
+
+    # проверяем, потянет ли хост еще одну лесенку
+    capacity_profile = CapacityProfile.load(get_profile_path())
+    if not original and admission != "off" and capacity_profile is not None:
+        controller = AdmissionController(capacity_profile, max_load)
+        result = controller.check(
+            backend.select_variants(stream_variants, media_info),
+            current_load=measure_cpu_load(),
+            degrade=admission == "degrade",
+            fps=media_info.fps if media_info else 0.0,
+            is_free=lambda v: backend.can_copy_video(v, media_info),
+        )
+        if not result.admitted:
+            click.echo(
+                f"Error: projected load {result.projected_load:.1f} cores exceeds "
+                f"budget {result.budget:.1f} cores.",
+                err=True,
+            )
+            sys.exit(1)
+        if result.degraded:
+            click.echo(
+                "Degraded variants to fit CPU budget: "
+                + ", ".join(f"{v.label} ({v.preset})" for v in result.variants)
+            )
+        stream_variants = result.variants
+
+    next_command = None
+    cache_entry = None
+    cache_hit = False
+    cacheable = input_source.type == InputType.FILE and input_source.loop
+    if cache and cacheable and not original and media_info is not None:
+        # каждый круг зацикленного файла кодируется одинаково: кодируем один
+        # раз, дальше публикуем закодированное копированием
+        ladder_cache = LadderCache(
+            max_bytes=(
+                int(cache_max_size * 1024**3) if cache_max_size else LADDER_CACHE_BYTES
+            ),
+            prober=backend.prober,
+        )
+        cached = ladder_cache.build_commands(
+            backend,
+            stream_key=stream_key,
+            input_source=input_source,
+            variants=stream_variants,
+            output_base_url=nginx_rtmp_url,
+            audio_enabled=not no_audio,
+            media_info=media_info,
+        )
+        command, next_command = cached.command, cached.next_command
+        cache_entry = cached.entry
+        cache_hit = cached.hit
+        if cache_hit:
+            click.echo("Ladder cache hit: publishing cached variants with -c copy")
+        elif next_command is not None:
+            click.echo(
+                "Ladder cache miss: encoding one pass into the cache;"
+                " players reconnect when publishing switches to the cache"
+            )
+    else:
+        command = backend.build_command(
+            stream_key=stream_key,
+            input_source=input_source,
+            variants=stream_variants,
+            output_base_url=nginx_rtmp_url,
+            original_only=original,
+            audio_enabled=not no_audio,
+            media_info=media_info,
+        )
+
+    spec = None
+    # копию из кэша деградировать незачем: она почти не тратит CPU
+    if use_daemon and not original and not cache_hit:
+        # по спецификации демон пересоберет команду при нехватке CPU
+        spec = StreamSpec(
+            stream_key=stream_key,
+            input_source=input_source,
+            variants=stream_variants,
+            output_base_url=nginx_rtmp_url,
+            audio_enabled=not no_audio,
+            media_info=media_info,
+            ladder=ladder,
+            cpu_budget=cpu_budget,
+            passthrough=not no_passthrough,
+            loglevel=loglevel,
+            record_dir=str(record_dir) if record_dir else None,
+            segment_seconds=segment_time,
+        ).to_dict()
+    run_stream(
+        stream_key,
+        command,
+        client if use_daemon else None,
+        spec,
+        record_dir,
+        next_command=next_command,
+        cache_entry=cache_entry,
+    )
+
+
+def publish_prepared(
+    stream_key: str,
+    directory: Path,
+    loop: bool,
+    loglevel: Optional[str],
+    record_dir: Optional[Path],
+    segment_seconds: float,
+    nginx_rtmp_url: str,
+) -> None:
+    """Publish the pre-encoded variants of ``msconv transcode`` without encoding."""
+    from .backends import FFmpegBackend
+    from .transcode import load_prepared
+
+    try:
+        files = load_prepared(directory)
+    except (OSError, ValueError, KeyError) as e:
+        click.echo(f"Error: invalid prepared directory {directory}: {e}", err=True)
+        sys.exit(1)
+
+    client = DaemonClient()
+    use_daemon = client.is_available()
+    backend = FFmpegBackend(
+        progress_url="pipe:1" if use_daemon else None,
+        loglevel=loglevel,
+        record_dir=record_dir,
+        segment_seconds=segment_seconds,
+    )
+    command = backend.build_copy_command(stream_key, files, nginx_rtmp_url, loop=loop)
+    # кодировать нечего, так что и деградировать демону нечего: spec не нужен
+    run_stream(stream_key, command, client if use_daemon else None, None, record_dir)
+
+
+def run_stream(
+    stream_key: str,
+    command: List[str],
+    client: Optional[DaemonClient],
+    spec: Optional[dict],
+    record_dir: Optional[Path],
+    next_command: Optional[List[str]] = None,
+    cache_entry: Optional[dict] = None,
+) -> None:
+    """Hand a stream over to the daemon, or run it here and tail its log.
+
+    ``next_command`` replaces ``command`` once it exits cleanly and the
+    ladder cache entry it copies (``cache_entry``) validates; until then
+    ``command`` is run again.
+    """
+    from .ladder_cache import is_entry_complete
 
     click.echo(f"Starting stream '{stream_key}'...")
-    click.echo(f"Command: {command}")
+    click.echo(f"Command: {shlex.join(command)}")
+
+    # Если запущен демон, отдаем ему процесс и сразу выходим
+    if client is not None:
+        try:
+            client.request(
+                "publish",
+                stream_key=stream_key,
+                command=command,
+                spec=spec,
+                next_command=next_command,
+                cache_entry=cache_entry,
+            )
+        except Exception as e:
+            click.echo(f"Error: {e}", err=True)
+            sys.exit(1)
+        click.echo(f"Stream '{stream_key}' is supervised by msconv daemon.")
+        click.echo(f"Logs: {get_log_file(stream_key)}")
+        return
+
+    if record_dir:
+        # без демона хранение ограничиваем при каждом запуске
+        removed, freed = prune_recordings(root=record_dir)
+        if removed:
+            click.echo(f"Evicted {removed} old segments ({freed / 1024**2:.0f} MB)")
+        click.echo(f"Recording to {record_dir}")
 
     process = start_ffmpeg_process(command, stream_key)
     click.echo(f"FFmpeg started (PID {process.pid}). Press Ctrl+C to stop.")
@@ -160,18 +620,344 @@ def publish(
     log_file = get_log_file(stream_key)
     tail_logs(log_file, stream_key)
 
+    while next_command is not None and process.wait() == 0:
+        if cache_entry is None or is_entry_complete(cache_entry):
+            click.echo(f"Switching to: {shlex.join(next_command)}")
+            command, next_command = next_command, None
+        else:
+            click.echo("Ladder cache entry is incomplete, encoding another pass")
+        # лог продолжает выводить поток, запущенный первым tail_logs
+        process = start_ffmpeg_process(command, stream_key, append=True)
+        click.echo(f"FFmpeg started (PID {process.pid}). Press Ctrl+C to stop.")
+        tail_logs(log_file, stream_key, follow=False)
+
+
+def publish_manifest(
+    manifest_path: str,
+    ladder: bool,
+    cpu_budget: float,
+    passthrough: bool,
+    profile: str,
+    loglevel: Optional[str],
+    record_dir: Optional[Path],
+    segment_seconds: float,
+    nginx_rtmp_url: str,
+    concurrency: int,
+    stagger: float,
+    live_timeout: float,
+    fanout: bool,
+    nginx_host: str,
+    nginx_stat_port: str,
+) -> None:
+    """Publish every stream declared in a manifest."""
+    from .backends import FFmpegBackend
+    from .listers import NginxRtmpLister
+    from .manifest import BatchPublisher, load_manifest
+
+    try:
+        entries = load_manifest(manifest_path, profile=profile)
+    except Exception as e:
+        click.echo(f"Error: invalid manifest: {e}", err=True)
+        sys.exit(1)
+
+    client = DaemonClient()
+    use_daemon = client.is_available()
+
+    # один запрос на все ключи вместо is_stream_active на каждый поток
+    if use_daemon:
+        active = {key for s in client.request("list") for key in s["members"]}
+    else:
+        active = {
+            key for group in list_local_streams() for key in split_group_key(group)
+        }
+    already = [e.stream_key for e in entries if e.stream_key in active]
+    if already:
+        click.echo(f"Skipping already active streams: {', '.join(already)}")
+        entries = [e for e in entries if e.stream_key not in active]
+    if not entries:
+        click.echo("Nothing to publish.")
+        return
+
+    backend = FFmpegBackend(
+        ladder=ladder,
+        cpu_budget=cpu_budget,
+        passthrough=passthrough,
+        progress_url="pipe:1" if use_daemon else None,
+        loglevel=loglevel,
+        record_dir=record_dir,
+        segment_seconds=segment_seconds,
+    )
+    if record_dir and not use_daemon:
+        prune_recordings(root=record_dir)
+    publisher = BatchPublisher(
+        backend,
+        nginx_rtmp_url,
+        client=client if use_daemon else None,
+        concurrency=concurrency,
+        stagger=stagger,
+        fanout=fanout,
+    )
+
+    started = time.monotonic()
+    click.echo(f"Probing {len(entries)} inputs ({concurrency} in parallel)...")
+    streams = publisher.prepare(entries)
+    click.echo(f"Prepared in {time.monotonic() - started:.1f}s")
+
+    def on_launch(stream) -> None:
+        if stream.error:
+            click.echo(f"  ✗ {stream.entry.stream_key}: {stream.error}", err=True)
+        else:
+            shared = stream.process_key != stream.entry.stream_key
+            suffix = f"  (shared process {stream.process_key})" if shared else ""
+            click.echo(f"  ▶ {stream.entry.stream_key}{suffix}")
+
+    for stream in streams:
+        if stream.error:
+            click.echo(f"  ✗ {stream.entry.stream_key}: {stream.error}", err=True)
+    publisher.launch(streams, on_launch=on_launch)
+
+    launched = [s for s in streams if s.launched_at is not None]
+    if not launched:
+        sys.exit(1)
+    if live_timeout <= 0:
+        click.echo(f"Launched {len(launched)} streams.")
+        return
+
+    click.echo(f"Waiting for {len(launched)} streams to go live...")
+    lister = NginxRtmpLister(nginx_host, nginx_stat_port, cache_ttl=0)
+    all_live = publisher.wait_live(launched, lister, timeout=live_timeout)
+
+    click.echo(f"  {'STREAM':15s} {'PROBE':>7s} {'STARTUP':>8s}")
+    for stream in launched:
+        latency = stream.startup_latency
+        click.echo(
+            f"  {stream.entry.stream_key:15s} {stream.probe_time:6.2f}s "
+            + (f"{latency:7.2f}s" if latency is not None else "  not live")
+        )
+    if all_live:
+        total = max(s.live_at for s in launched) - started
+        click.echo(f"All {len(launched)} streams live in {total:.1f}s")
+    else:
+        missing = sum(1 for s in launched if s.live_at is None)
+        click.echo(
+            f"Error: {missing} streams not live after {live_timeout:.0f}s", err=True
+        )
+        sys.exit(1)
+
+
+@cli.command()
+@click.option("--variants", "-v", help="Variants to calibrate (default: built-in)")
+@click.option(
+    "--presets",
+    default="ultrafast,superfast,veryfast,faster,fast",
+    show_default=True,
+    help="Comma-separated x264 presets to measure",
+)
+@click.option(
+    "--duration", default=5, show_default=True, help="Seconds of video per point"
+)
+def calibrate(variants, presets, duration):
+    """Measure per-variant encode cost on this host."""
+    from .capacity import calibrate as run_calibration, get_profile_path
+
+    stream_variants = parse_variants(variants) if variants else get_default_variants()
+    preset_list = [p.strip() for p in presets.split(",") if p.strip()]
+
+    click.echo("Calibrating encode cost (cores per realtime stream)...")
+    try:
+        profile = run_calibration(
+            stream_variants,
+            preset_list,
+            duration=duration,
+            on_result=lambda key, cost: click.echo(f"  {key:24s} {cost:6.2f}"),
+        )
+    except Exception as e:
+        click.echo(f"Error: calibration failed: {e}", err=True)
+        sys.exit(1)
+
+    profile_path = get_profile_path()
+    profile.save(profile_path)
+    click.echo(f"Profile for {profile.cores} cores saved to {profile_path}")
+
 
 @cli.command()
-@click.option("--stream-key", "-s", required=True, help="Stream key to stop")
-def stop(stream_key):
-    """Stop a stream."""
+@click.argument("input_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(file_okay=False),
+    help="Output directory (default: <input name>_ladder next to the input)",
+)
+@click.option("--variants", "-v", help="Custom variants (label:bitrate:width:height)")
+@click.option("--codec", help="Video codec of the variants: x264, x265, svtav1 or vp9")
+@click.option(
+    "--codec-below",
+    type=int,
+    help="Use --codec only for variants at most this tall (e.g. 480)",
+)
+@click.option("--chunk-time", type=float, help="Chunk length in seconds (default: 30)")
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    help="Chunks encoded in parallel (default: cores / variants)",
+)
+@click.option("--no-audio", is_flag=True, help="Drop the audio track")
+def transcode(
+    input_file, output, variants, codec, codec_below, chunk_time, jobs, no_audio
+):
+    """Pre-encode a file's ladder in parallel for publish --prepared."""
+    from .codecs import apply_codec
+    from .transcode import CHUNK_SECONDS, ChunkedTranscoder
+
+    stream_variants = parse_variants(variants) if variants else get_default_variants()
+    if codec:
+        try:
+            stream_variants = apply_codec(stream_variants, codec, codec_below)
+        except ValueError as e:
+            click.echo(f"Error: {e}", err=True)
+            sys.exit(1)
+    source = Path(input_file)
+    out_dir = Path(output) if output else source.with_name(f"{source.stem}_ladder")
+
+    transcoder = ChunkedTranscoder(
+        stream_variants, chunk_seconds=chunk_time or CHUNK_SECONDS, jobs=jobs
+    )
+    click.echo(f"Transcoding {source} with {transcoder.jobs} jobs...")
+    try:
+        result = transcoder.transcode(
+            str(source),
+            out_dir,
+            audio=not no_audio,
+            on_progress=lambda done, total: click.echo(
+                f"\r  {done}/{total} jobs done", nl=False
+            ),
+        )
+    except Exception as e:
+        click.echo(f"\nError: transcoding failed: {e}", err=True)
+        sys.exit(1)
+
+    click.echo()
+    for label, path in result.files.items():
+        click.echo(f"  {label:8s} {path} ({path.stat().st_size / 1024**2:.1f} MB)")
+    click.echo(
+        f"{result.duration:.0f}s of video in {result.chunks} chunks: "
+        f"{result.wall_seconds:.1f}s wall ({result.speed:.1f}x realtime), "
+        f"{result.cpu_seconds / result.wall_seconds:.1f} cores busy"
+    )
+    click.echo(f"Publish with: msconv publish -s <key> --prepared {out_dir}")
+
+
+@cli.command()
+@click.option("--stream-key", "-s", help="Stream key to stop")
+@click.option("--all", "stop_all", is_flag=True, help="Stop every local stream")
+@click.option(
+    "--pattern", "-p", help="Stop streams whose key matches a glob (e.g. 'cam*')"
+)
+@click.option(
+    "--timeout",
+    default=STOP_TIMEOUT,
+    show_default=True,
+    help="Seconds to wait for ffmpeg to exit cleanly before SIGKILL",
+)
+def stop(stream_key, stop_all, pattern, timeout):
+    """Stop a stream, or many at once with --all/--pattern."""
+
+    if sum(bool(x) for x in (stream_key, stop_all, pattern)) != 1:
+        click.echo(
+            "Error: pass exactly one of --stream-key, --all, --pattern", err=True
+        )
+        sys.exit(1)
+
     try:
-        stop_stream_process(stream_key)
+        client = DaemonClient(timeout=timeout + KILL_TIMEOUT + 10)
+        # процесс, запущенный без демона, останавливаем сами, даже если демон есть
+        record = find_local_stream(stream_key) if stream_key else None
+        local = record is not None and record.owner != "daemon"
+        if stream_key and not local and client.is_available():
+            result = client.request("stop", stream_key=stream_key, timeout=timeout)
+            click.echo(
+                f"Stream '{result['stream_key']}' stopped in {result['seconds']:.1f}s."
+            )
+        elif stream_key:
+            stop_stream_process(stream_key, timeout)
+        else:
+            stop_many(client, stop_all, pattern, timeout)
     except Exception as e:
         click.echo(f"Error: {e}", err=True)
         sys.exit(1)
 
 
+def stop_many(
+    client: DaemonClient, stop_all: bool, pattern: Optional[str], timeout: float
+) -> None:
+    """Stop all matching streams concurrently and report their shutdown times.
+
+    Streams the daemon supervises are stopped by the daemon, streams started
+    without it are stopped here.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    use_daemon = client.is_available()
+    records = list_local_streams()
+    groups = {}
+    if use_daemon:
+        groups = {s["stream_key"]: s["members"] for s in client.request("list")}
+        # процессы демона он останавливает сам, остальные -- мы
+        records = {
+            key: record
+            for key, record in records.items()
+            if record.owner != "daemon" and key not in groups
+        }
+    daemon_keys = set(groups)
+    groups.update({key: split_group_key(key) for key in records})
+
+    # общий процесс останавливается целиком, если совпал любой его ключ
+    selected = [
+        key
+        for key, members in groups.items()
+        if stop_all or any(fnmatch.fnmatchcase(m, pattern) for m in members)
+    ]
+    if not selected:
+        click.echo("No matching streams found.")
+        return
+
+    click.echo(f"Stopping {len(selected)} streams (timeout {timeout:g}s)...")
+    started = time.monotonic()
+    daemon_selected = [key for key in selected if key in daemon_keys]
+    local_records = [records[key] for key in selected if key not in daemon_keys]
+    results = {}
+    # свои процессы гасим параллельно с запросом к демону
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        local_stop = executor.submit(stop_processes, local_records, timeout)
+        if daemon_selected:
+            for r in client.request(
+                "stop", stream_keys=daemon_selected, timeout=timeout
+            ):
+                results[r["stream_key"]] = (
+                    r.get("seconds"),
+                    r.get("killed"),
+                    r.get("error"),
+                )
+        for key, (seconds, killed) in local_stop.result().items():
+            results[key] = (seconds, killed, None)
+
+    failed = 0
+    for key in selected:
+        seconds, killed, error = results[key]
+        if error:
+            failed += 1
+            click.echo(f"  ✗ {key:20s} {error}", err=True)
+        else:
+            status = "KILLED" if killed else "clean"
+            click.echo(f"  ■ {key:20s} {seconds:6.2f}s  {status}")
+    click.echo(
+        f"Stopped {len(selected) - failed} streams in {time.monotonic() - started:.1f}s"
+    )
+    if failed:
+        sys.exit(1)
+
+
 @cli.command("list")
 @click.option(
     "--nginx-host",
@@ -199,53 +985,467 @@ def stop(stream_key):
 )
 @click.option(
     "--source",
-    # можно дополнить другими источниками монитроинга на выбор, главное чтобы была имлпементация
-    # которая реализует StreamLister, в данном случае захардкодил только nginx
-    type=click.Choice(["nginx"]),
-    default="nginx",
+    # источники опрашиваются параллельно и сливаются в одно представление,
+    # можно дополнить другими, главное чтобы была имплементация StreamLister
+    type=click.Choice(["all", "nginx", "mediamtx"]),
+    default="all",
     show_default=True,
     help="Source to list streams from",
 )
-def list_streams(nginx_host, nginx_stat_port, media_host, media_api_port, source):
+@click.option(
+    "--local",
+    is_flag=True,
+    help="List ffmpeg processes started on this host instead",
+)
+def list_streams(
+    nginx_host, nginx_stat_port, media_host, media_api_port, source, local
+):
     """List all active streams."""
 
-    combined_streams = {}
-
-    if source in ["nginx"]:
-        try:
-            nginx_lister = NginxRtmpLister(nginx_host, nginx_stat_port)
-            nginx_streams = nginx_lister.get_active_streams()
-
-            for stream_key, info in nginx_streams.items():
-                if stream_key not in combined_streams:
-                    combined_streams[stream_key] = info
-                else:
-                    combined_streams[stream_key]["variants"].update(info["variants"])
-                    combined_streams[stream_key]["live"] = True
+    if local:
+        list_local()
+        return
 
-        except Exception as e:
-            click.echo(f"Warning: Failed to get nginx streams: {e}", err=True)
+    combined_streams = get_streams(
+        source, nginx_host, nginx_stat_port, media_host, media_api_port
+    )
 
     if not combined_streams:
         click.echo("No active streams found.")
         return
 
     click.echo("Available streams:")
-    for base, data in combined_streams.items():
-        variants = sorted(list(data["variants"]))
-        live_status = "LIVE" if data.get("live", False) else "AVAILABLE"
-
-        readers_info = ""
-        if "readers" in data and data["readers"]:
-            readers_list = [
-                f"{v}: {data['readers'].get(v, 0)} viewers" for v in variants
-            ]
-            readers_info = f"  ({', '.join(readers_list)})"
+    for base in sorted(combined_streams):
+        click.echo(describe_stream(base, combined_streams[base]))
+
+
+def get_streams(
+    source: str,
+    nginx_host: str,
+    nginx_stat_port: str,
+    media_host: str,
+    media_api_port: str,
+) -> dict:
+    """Fetch streams from the selected sources concurrently and merge them."""
+    from .listers import MediaMTXLister, NginxRtmpLister, fetch_streams
+
+    listers = {}
+    if source in ["all", "nginx"]:
+        listers["nginx"] = NginxRtmpLister(nginx_host, nginx_stat_port)
+    if source in ["all", "mediamtx"]:
+        listers["MediaMTX"] = MediaMTXLister(media_host, media_api_port)
+
+    streams, errors = fetch_streams(listers)
+    for name, error in errors.items():
+        click.echo(f"Warning: Failed to get {name} streams: {error}", err=True)
+    return streams
+
+
+def describe_stream(base: str, data: dict) -> str:
+    """Format one merged stream entry for listing."""
+    variants = sorted(list(data["variants"]))
+    live_status = "LIVE" if data.get("live", False) else "AVAILABLE"
+
+    readers_info = ""
+    if data.get("readers") or data.get("bitrates"):
+        readers_list = []
+        for v in variants or [""]:
+            details = f"{data.get('readers', {}).get(v, 0)} viewers"
+            bitrate = data.get("bitrates", {}).get(v)
+            if bitrate:
+                details += f", {bitrate} kbit/s"
+            readers_list.append(f"{v or 'original'}: {details}")
+        readers_info = f"  ({'; '.join(readers_list)})"
+
+    return f"  • {base:15s} [{live_status}]  variants: [{', '.join(variants)}]{readers_info}"
+
+
+def list_local() -> None:
+    """Print streams published from this host."""
+
+    client = DaemonClient()
+    if client.is_available():
+        streams = client.request("list")
+        if not streams:
+            click.echo("No local streams found.")
+            return
+        click.echo("Supervised streams:")
+        for info in streams:
+            pid = info["pid"] or "-"
+            click.echo(
+                f"  • {info['stream_key']:15s} [{info['state'].upper()}]  "
+                f"PID {pid}  uptime {info['uptime']:.0f}s  "
+                f"restarts {info['restarts']}"
+                + (
+                    f"  degraded x{info['degrade_level']}"
+                    if info.get("degrade_level")
+                    else ""
+                )
+            )
+        return
+
+    streams = list_local_streams()
+    if not streams:
+        click.echo("No local streams found.")
+        return
+    click.echo("Local streams:")
+    for stream_key, record in streams.items():
+        click.echo(
+            f"  • {stream_key:15s} PID {record.pid}  uptime {record.uptime:.0f}s"
+        )
+
+
+@cli.command()
+@click.option(
+    "--stream-key",
+    "-s",
+    multiple=True,
+    help="Stream key, can be repeated (default: all streams)",
+)
+@click.option("--follow", "-f", is_flag=True, help="Keep printing new lines")
+@click.option("--lines", "-n", default=20, show_default=True, help="Lines to show")
+def logs(stream_key, follow, lines):
+    """Show (and follow) ffmpeg logs of one or many streams."""
+    from .logs import LogFollower
+
+    if stream_key:
+        paths = {key: get_log_file(key) for key in stream_key}
+    else:
+        log_dir = get_log_file("_").parent
+        paths = {path.stem: path for path in sorted(log_dir.glob("*.log"))}
+    if not paths:
+        click.echo("No logs found.")
+        return
+
+    # с несколькими потоками помечаем каждую строку ключом
+    prefixed = len(paths) > 1
+
+    def echo(key: str, line: str) -> None:
+        click.echo(f"[{key}] {line}" if prefixed else line)
+
+    follower = LogFollower(paths)
+    for key, tail in follower.tail(lines).items():
+        for line in tail:
+            echo(key, line)
+    if follow:
+        try:
+            follower.follow(echo)
+        except KeyboardInterrupt:
+            pass
+
+
+@cli.command()
+@click.option("--no-restart", is_flag=True, help="Don't restart ffmpeg when it exits")
+@click.option(
+    "--metrics-port",
+    type=int,
+    help="Serve Prometheus metrics on this port (e.g. 9100)",
+)
+@click.option(
+    "--metrics-host", default="127.0.0.1", show_default=True, help="Metrics bind host"
+)
+@click.option(
+    "--no-adaptive",
+    is_flag=True,
+    help="Don't degrade ladders of streams that fall below realtime",
+)
+@click.option(
+    "--max-load",
+    type=float,
+    help="CPU cores the host may use before degraded ladders are restored",
+)
+@click.option(
+    "--log-max-size",
+    default=LOG_MAX_BYTES // 1024 // 1024,
+    show_default=True,
+    help="Rotate a stream's log after this many MB (0 to disable)",
+)
+@click.option(
+    "--log-max-age",
+    type=float,
+    help="Also rotate logs older than this many hours",
+)
+@click.option(
+    "--log-backups",
+    default=LOG_BACKUPS,
+    show_default=True,
+    help="Compressed rotated logs to keep per stream",
+)
+@click.option(
+    "--record-max-age",
+    default=RECORD_MAX_AGE / 3600,
+    show_default=True,
+    help="Delete recorded segments older than this many hours",
+)
+@click.option(
+    "--record-max-size",
+    default=RECORD_MAX_BYTES / 1024**3,
+    show_default=True,
+    help="Keep all recordings under this many GB, oldest go first",
+)
+def daemon(
+    no_restart,
+    metrics_port,
+    metrics_host,
+    no_adaptive,
+    max_load,
+    log_max_size,
+    log_max_age,
+    log_backups,
+    record_max_age,
+    record_max_size,
+):
+    """Run the supervisor that owns all ffmpeg processes."""
+    import asyncio
+    import logging
+    from .adaptive import AdaptivePolicy
+    from .capacity import CapacityProfile, get_profile_path
+    from .daemon import StreamSupervisor
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    client = DaemonClient()
+    if client.is_available():
+        click.echo(f"Error: daemon already running on {client.socket_path}", err=True)
+        sys.exit(1)
+
+    policy = None
+    if not no_adaptive:
+        policy = AdaptivePolicy(
+            os.cpu_count() or 1, CapacityProfile.load(get_profile_path()), max_load
+        )
+    supervisor = StreamSupervisor(
+        restart=not no_restart,
+        metrics_port=metrics_port,
+        metrics_host=metrics_host,
+        adaptive=policy,
+        log_max_bytes=log_max_size * 1024 * 1024,
+        log_max_age=log_max_age * 3600 if log_max_age else None,
+        log_backups=log_backups,
+        record_max_age=record_max_age * 3600,
+        record_max_bytes=int(record_max_size * 1024**3),
+    )
+    asyncio.run(supervisor.serve())
+
+
+@cli.command()
+@click.option(
+    "--interval",
+    default=2.0,
+    show_default=True,
+    help="Seconds between polls of listers and daemon telemetry",
+)
+@click.option(
+    "--sort",
+    "sort_by",
+    type=click.Choice(["bitrate", "viewers", "speed", "name"]),
+    default="bitrate",
+    show_default=True,
+    help="Initial sort column",
+)
+@click.option("--nginx-host", default="localhost", help="nginx-rtmp host")
+@click.option("--nginx-stat-port", default="8080", help="nginx-rtmp stat port")
+@click.option("--media-host", default="localhost", help="MediaMTX host")
+@click.option("--media-api-port", default="9997", help="MediaMTX API port")
+def top(interval, sort_by, nginx_host, nginx_stat_port, media_host, media_api_port):
+    """Live dashboard of all streams."""
+    from .dashboard import FleetPoller, run_top
+    from .listers import MediaMTXLister, NginxRtmpLister
+
+    listers = {
+        "nginx": NginxRtmpLister(nginx_host, nginx_stat_port),
+        "MediaMTX": MediaMTXLister(media_host, media_api_port),
+    }
+    poller = FleetPoller(listers, DaemonClient(), interval=interval)
+    sort_fields = {
+        "bitrate": "bitrate_kbps",
+        "viewers": "viewers",
+        "speed": "speed",
+        "name": "stream_key",
+    }
+    run_top(poller, sort_key=sort_fields[sort_by])
+
+
+@cli.command()
+@click.option("--publishers", "-n", default=4, show_default=True, help="Publishers")
+@click.option(
+    "--readers", "-m", default=8, show_default=True, help="RTSP readers in total"
+)
+@click.option(
+    "--duration", default=30.0, show_default=True, help="Seconds per ramp step"
+)
+@click.option(
+    "--ramp-step",
+    default=0,
+    show_default=True,
+    help="Add this many publishers per step until failure (0: all at once)",
+)
+@click.option("--interval", default=1.0, show_default=True, help="Sampling period")
+@click.option("--variants", "-v", help="Variants to publish (default: built-in)")
+@click.option("--ladder", is_flag=True, help="Publish with the cascaded ladder graph")
+@click.option(
+    "--size", default="1920x1080", show_default=True, help="Synthetic source size"
+)
+@click.option("--rate", default=30, show_default=True, help="Synthetic source fps")
+@click.option("--nginx-rtmp-url", default="rtmp://localhost:1935/live")
+@click.option("--rtsp-url", default="rtsp://localhost:8554", help="MediaMTX RTSP base")
+@click.option("--nginx-host", default="localhost", help="nginx-rtmp host")
+@click.option("--nginx-stat-port", default="8080", help="nginx-rtmp stat port")
+@click.option(
+    "--start-stack",
+    is_flag=True,
+    help="Start the docker compose stack first and stop it afterwards",
+)
+@click.option("--json", "json_path", type=click.Path(), help="Write JSON report here")
+@click.option("--csv", "csv_path", type=click.Path(), help="Write samples as CSV here")
+def bench(
+    publishers,
+    readers,
+    duration,
+    ramp_step,
+    interval,
+    variants,
+    ladder,
+    size,
+    rate,
+    nginx_rtmp_url,
+    rtsp_url,
+    nginx_host,
+    nginx_stat_port,
+    start_stack,
+    json_path,
+    csv_path,
+):
+    """Load-test N synthetic publishers x M RTSP readers."""
+    import json
+    import subprocess
+    from .bench import BenchConfig, LoadBench, compose_command, wait_for_port, write_csv
+
+    try:
+        width, height = (int(x) for x in size.lower().split("x"))
+    except ValueError:
+        click.echo(f"Error: invalid --size '{size}'", err=True)
+        sys.exit(1)
+
+    config = BenchConfig(
+        publishers=publishers,
+        readers=readers,
+        variants=parse_variants(variants) if variants else get_default_variants(),
+        duration=duration,
+        interval=interval,
+        ramp_step=ramp_step,
+        ladder=ladder,
+        width=width,
+        height=height,
+        rate=rate,
+        nginx_rtmp_url=nginx_rtmp_url,
+        rtsp_url=rtsp_url,
+        nginx_host=nginx_host,
+        nginx_stat_port=nginx_stat_port,
+    )
+
+    if start_stack:
+        click.echo("Starting docker compose stack...")
+        subprocess.run(compose_command() + ["up", "-d"], check=True)
+        for port in (1935, int(nginx_stat_port), 8554):
+            if not wait_for_port(nginx_host, port, timeout=60):
+                click.echo(f"Error: port {port} did not open", err=True)
+                sys.exit(1)
+
+    def on_sample(stage, sample) -> None:
+        speed = (
+            f"{sample.publish_speed_min:.2f}x"
+            if sample.publish_speed_min is not None
+            else "-"
+        )
+        click.echo(
+            f"[{sample.time:7.1f}s] pub {sample.publishers_alive}/{sample.publishers} "
+            f"read {sample.readers_alive}/{sample.readers}  cpu "
+            f"{sample.cpu_cores:5.1f} cores  mem {sample.memory_mb:7.0f} MiB  "
+            f"min speed {speed}  out {sample.publish_kbps:8.0f} kbit/s  "
+            f"in {sample.read_kbps:8.0f} kbit/s"
+        )
+
+    load_bench = LoadBench(config)
+    try:
+        report = load_bench.run(on_sample)
+    finally:
+        if start_stack:
+            subprocess.run(compose_command() + ["down"])
+
+    if json_path:
+        Path(json_path).write_text(json.dumps(report, indent=2))
+        click.echo(f"Report written to {json_path}")
+    if csv_path:
+        write_csv(load_bench.samples, Path(csv_path))
+        click.echo(f"Samples written to {csv_path}")
+
+    click.echo("\nStages:")
+    for stage in report["stages"]:
+        status = "OK" if stage["ok"] else f"FAIL: {stage['failure']}"
+        speed = stage["publish_speed_min"]
+        click.echo(
+            f"  {stage['publishers']:4d} pub x {stage['readers']:4d} read  "
+            f"cpu {stage['cpu_cores']:5.1f}  "
+            f"speed {speed if speed is None else f'{speed:.2f}x'}  {status}"
+        )
+    sustained = report["max_sustained"]
+    if sustained:
+        click.echo(
+            f"Max sustained: {sustained['publishers']} publishers x "
+            f"{sustained['readers']} readers"
+        )
+    if report["failure_point"]:
+        sys.exit(2)
+
+
+@cli.command()
+@click.option(
+    "--below-realtime",
+    is_flag=True,
+    help="Show only streams encoding slower than realtime (exit code 2 if any)",
+)
+def stats(below_realtime):
+    """Show live ffmpeg telemetry of supervised streams."""
+
+    client = DaemonClient()
+    if not client.is_available():
+        click.echo("Error: msconv daemon is not running.", err=True)
+        sys.exit(1)
+
+    samples = client.request("stats")
+    rows = []
+    for stream_key, sample in sorted(samples.items()):
+        # speed None: ffmpeg еще не знает скорость (N/A), это не отставание
+        if below_realtime and (
+            sample is None or sample["speed"] is None or sample["speed"] >= 1.0
+        ):
+            continue
+        rows.append((stream_key, sample))
 
+    if not rows:
+        click.echo("No streams to show.")
+        return
+
+    click.echo(
+        f"  {'STREAM':15s} {'FPS':>7s} {'SPEED':>7s} {'KBIT/S':>9s} "
+        f"{'DROP':>6s} {'DUP':>6s} {'OUT TIME':>9s}"
+    )
+    for stream_key, sample in rows:
+        if sample is None:
+            click.echo(f"  {stream_key:15s} (no progress yet)")
+            continue
+        speed = "-" if sample["speed"] is None else f"{sample['speed']:.2f}x"
         click.echo(
-            f"  • {base:15s} [{live_status}]  variants: [{', '.join(variants)}{readers_info}]"
+            f"  {stream_key:15s} {sample['fps']:7.1f} {speed:>7s} "
+            f"{sample['bitrate_kbps']:9.1f} {sample['drop_frames']:6d} "
+            f"{sample['dup_frames']:6d} {sample['out_time']:8.0f}s"
         )
 
+    if below_realtime:
+        sys.exit(2)
+
 
 @cli.command()
 @click.option(
@@ -267,44 +1467,47 @@ def list_streams(nginx_host, nginx_stat_port, media_host, media_api_port, source
     default="vlc",
     help="Player to use",
 )
-def play(stream_key, do_list, original, variant, media_host, media_rtsp_port, player):
+@click.option(
+    "--profile",
+    type=click.Choice(PROFILES),
+    default=PROFILE_DEFAULT,
+    show_default=True,
+    help="lowlatency disables player-side buffering",
+)
+@click.option(
+    "--at",
+    help="Replay the recording from a time ('-5m', '14:30', ISO datetime)",
+)
+def play(
+    stream_key,
+    do_list,
+    original,
+    variant,
+    media_host,
+    media_rtsp_port,
+    player,
+    profile,
+    at,
+):
     """Play a stream.
 
     If --list is provided, shows an interactive menu of active streams
     and lets you pick one. Otherwise you must pass --stream-key.
     """
+    from .players import VLCPlayer, FFplayPlayer
+
     print("Playing a stream...")
     # Выбираем интерактивно из списка
     if do_list:
-        streams = {}
-
-        try:
-            nginx_lister = NginxRtmpLister("localhost", "8080")
-            nginx_streams = nginx_lister.get_active_streams()
-            for key, info in nginx_streams.items():
-                streams.setdefault(key, info)
-        except Exception:
-            pass
+        streams = get_streams("all", "localhost", "8080", media_host, "9997")
 
         if not streams:
             click.echo("No active streams found.")
             sys.exit(1)
 
-        stream_descriptions = []
-        for base, data in streams.items():
-            variants = sorted(list(data["variants"]))
-            live_status = "LIVE" if data.get("live", False) else "AVAILABLE"
-
-            readers_info = ""
-            if "readers" in data and data["readers"]:
-                readers_list = [
-                    f"{v}: {data['readers'].get(v, 0)} viewers" for v in variants
-                ]
-                readers_info = f"  ({', '.join(readers_list)})"
-
-            stream_descriptions.append(
-                f"  • {base:15s} [{live_status}]  variants: [{', '.join(variants)}{readers_info}]"
-            )
+        stream_descriptions = [
+            describe_stream(base, streams[base]) for base in sorted(streams)
+        ]
 
         keys = sorted(streams.keys())
         chosen_id = interactive_select(stream_descriptions)
@@ -320,14 +1523,81 @@ def play(stream_key, do_list, original, variant, media_host, media_rtsp_port, pl
         stream_key = f"{stream_key}_{variant}"
 
     rtsp_url = f"rtsp://{media_host}:{media_rtsp_port}/{stream_key}"
+    start = 0.0
+    if at:
+        try:
+            rtsp_url, start = replay_playlist(stream_key, at)
+        except ValueError as e:
+            click.echo(f"Error: {e}", err=True)
+            sys.exit(1)
 
+    low_latency = profile == PROFILE_LOW_LATENCY and not at
     if player == "vlc":
-        player_impl = VLCPlayer()
+        player_impl = VLCPlayer(low_latency)
     else:
-        player_impl = FFplayPlayer()
+        player_impl = FFplayPlayer(low_latency)
 
     try:
-        player_impl.play_stream(rtsp_url)
+        player_impl.play_stream(rtsp_url, start)
     except Exception as e:
         click.echo(f"Error playing stream: {e}", err=True)
         sys.exit(1)
+
+
+def replay_playlist(name: str, at: str) -> Tuple[str, float]:
+    """Find a recorded moment; returns a playlist from its segment and the offset."""
+    from .recorder import RecordingIndex, parse_time
+
+    when = parse_time(at)
+    index = RecordingIndex(get_record_dir() / name)
+    index.sync()
+    segment = index.find(when)
+    if segment is None:
+        raise ValueError(f"No recording of '{name}' at {at}")
+
+    playlist = Path(tempfile.gettempdir()) / f"msconv-{name}-{int(when)}.m3u8"
+    index.write_playlist(segment, playlist)
+    click.echo(
+        f"Replaying '{name}' from {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(when))}"
+    )
+    return str(playlist), max(0.0, when - segment.start)
+
+
+@cli.command()
+@click.option("--prune", is_flag=True, help="Evict segments past the limits below")
+@click.option(
+    "--max-age",
+    default=RECORD_MAX_AGE / 3600,
+    show_default=True,
+    help="Hours of recordings to keep",
+)
+@click.option(
+    "--max-size",
+    default=RECORD_MAX_BYTES / 1024**3,
+    show_default=True,
+    help="GB of recordings to keep in total",
+)
+def recordings(prune, max_age, max_size):
+    """List local recordings (and enforce retention with --prune)."""
+    from .recorder import list_recordings
+
+    if prune:
+        removed, freed = prune_recordings(max_age * 3600, int(max_size * 1024**3))
+        click.echo(f"Evicted {removed} segments ({freed / 1024**2:.0f} MB).")
+
+    found = False
+    for name, index in list_recordings().items():
+        index.sync()
+        segments = index.segments()
+        if not segments:
+            continue
+        found = True
+        size = sum(s.size for s in segments)
+        first = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(segments[0].start))
+        last = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(segments[-1].end))
+        click.echo(
+            f"{name:<24} {first} .. {last}  "
+            f"{len(segments):5d} segments {size / 1024**2:9.1f} MB"
+        )
+    if not found:
+        click.echo("No recordings found.")
@@ -0,0 +1,40 @@
+import json
+import socket
+from pathlib import Path
+from typing import Any, Optional
+from .utils import get_socket_path
+
+
+class DaemonClient:
+    """Thin synchronous client for the supervisor's Unix socket."""
+
+    def __init__(self, socket_path: Optional[Path] = None, timeout: float = 30.0):
+        self.socket_path = socket_path or get_socket_path()
+        self.timeout = timeout
+
+    def is_available(self) -> bool:
+        """Check whether a daemon is listening on the socket."""
+        if not self.socket_path.exists():
+            return False
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(1.0)
+                sock.connect(str(self.socket_path))
+            return True
+        except OSError:
+            return False
+
+    def request(self, action: str, **params: Any) -> Any:
+        """Send a request to the daemon and return its result."""
+        payload = json.dumps({"action": action, **params}).encode() + b"\n"
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(str(self.socket_path))
+            sock.sendall(payload)
+            with sock.makefile("rb") as response_file:
+                response = json.loads(response_file.readline())
+
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "Unknown daemon error"))
+        return response.get("result")
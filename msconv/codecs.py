@@ -0,0 +1,255 @@
+from abc import ABC, abstractmethod
+from dataclasses import replace
+from typing import Dict, List, Optional
+from .models import StreamVariant
+
+# Пресеты x264 от самого быстрого к самому медленному. Это общая шкала:
+# StreamVariant.preset всегда задается ею, а кодек переводит в свои настройки
+X264_PRESETS = [
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+]
+
+# Кодеки, которые nginx-rtmp принимает в FLV; остальные годятся только для
+# файлов (msconv transcode)
+RTMP_CODECS = ["h264"]
+
+
+class VideoCodec(ABC):
+    """A video encoder plugin.
+
+    Translates the codec-neutral settings of a ``StreamVariant`` (preset
+    on the x264 scale, CRF on the x264 scale, bitrate cap, tune, B-frames)
+    into the encoder's own options. ``bitrate_factor`` is the bitrate it
+    needs for the quality x264 reaches at 1.0, ``cpu_factor`` its encode
+    cost relative to x264 at the same preset.
+    """
+
+    encoder: str = ""
+    # имя кодека в ffprobe, для сравнения с источником
+    codec_name: str = ""
+    aliases: List[str] = []
+    bitrate_factor: float = 1.0
+    cpu_factor: float = 1.0
+    # насколько CRF кодека выше CRF x264 при сравнимом качестве
+    crf_offset: int = 0
+
+    @abstractmethod
+    def preset_args(self, preset: str) -> List[str]:
+        """Encoder speed options for a preset on the x264 scale."""
+        pass
+
+    def tune_args(self, tune: str) -> List[str]:
+        return ["-tune", tune] if tune else []
+
+    def bframes_args(self, bframes: int) -> List[str]:
+        return ["-bf", str(bframes)] if bframes >= 0 else []
+
+    def rate_control_args(self, variant: StreamVariant) -> List[str]:
+        """Capped CRF: constant quality limited to the variant's bitrate."""
+        return [
+            "-crf",
+            str(variant.crf + self.crf_offset),
+            "-b:v",
+            variant.bitrate,
+            "-maxrate",
+            variant.bitrate,
+            "-bufsize",
+            variant.buffer_size,
+        ]
+
+    def threads_args(self, threads: int) -> List[str]:
+        return ["-threads", str(threads)]
+
+    def no_scenecut_args(self) -> List[str]:
+        """Disable keyframes on scene cuts, so forced keyframes stay aligned."""
+        return []
+
+    def video_args(self, variant: StreamVariant, preset: str) -> List[str]:
+        """Build the encoder options of a variant as option/value pairs."""
+        return (
+            ["-c:v", self.encoder]
+            + self.preset_args(preset)
+            + self.tune_args(variant.tune)
+            + self.bframes_args(variant.bframes)
+            + self.rate_control_args(variant)
+        )
+
+
+def _preset_index(preset: str) -> int:
+    # неизвестный пресет считаем средним
+    return X264_PRESETS.index(preset) if preset in X264_PRESETS else 5
+
+
+class X264Codec(VideoCodec):
+    encoder = "libx264"
+    codec_name = "h264"
+    aliases = ["x264", "h264", "avc"]
+
+    def preset_args(self, preset: str) -> List[str]:
+        return ["-preset", preset]
+
+    def no_scenecut_args(self) -> List[str]:
+        return ["-sc_threshold", "0"]
+
+
+class X265Codec(VideoCodec):
+    encoder = "libx265"
+    codec_name = "hevc"
+    aliases = ["x265", "hevc", "h265"]
+    bitrate_factor = 0.6
+    cpu_factor = 3.0
+    crf_offset = 5
+
+    def preset_args(self, preset: str) -> List[str]:
+        return ["-preset", preset]
+
+    def no_scenecut_args(self) -> List[str]:
+        return ["-x265-params", "scenecut=0"]
+
+
+class SVTAV1Codec(VideoCodec):
+    encoder = "libsvtav1"
+    codec_name = "av1"
+    aliases = ["svtav1", "av1"]
+    bitrate_factor = 0.5
+    cpu_factor = 2.5
+    crf_offset = 12
+    # ultrafast..veryslow -> -preset SVT-AV1 (0 самый медленный, 13 самый быстрый)
+    PRESETS = [12, 11, 10, 9, 8, 7, 6, 5, 4]
+
+    def preset_args(self, preset: str) -> List[str]:
+        return ["-preset", str(self.PRESETS[_preset_index(preset)])]
+
+    def tune_args(self, tune: str) -> List[str]:
+        # у SVT-AV1 нет tune zerolatency; задержку задает bframes_args
+        return []
+
+    def bframes_args(self, bframes: int) -> List[str]:
+        # без B-кадров -- структура low delay без переупорядочивания кадров
+        return ["-svtav1-params", "pred-struct=1"] if bframes == 0 else []
+
+    def rate_control_args(self, variant: StreamVariant) -> List[str]:
+        # capped CRF: maxrate становится mbr (SVT-AV1 >= 1.5); -b:v включил бы VBR
+        return [
+            "-crf",
+            str(min(63, variant.crf + self.crf_offset)),
+            "-maxrate",
+            variant.bitrate,
+            "-bufsize",
+            variant.buffer_size,
+        ]
+
+
+class VP9Codec(VideoCodec):
+    encoder = "libvpx-vp9"
+    codec_name = "vp9"
+    aliases = ["vp9", "libvpx"]
+    bitrate_factor = 0.65
+    cpu_factor = 2.0
+    crf_offset = 10
+    # ultrafast..veryslow -> -cpu-used в режиме realtime (8 самый быстрый)
+    CPU_USED = [8, 8, 7, 6, 5, 4, 3, 2, 1]
+
+    def preset_args(self, preset: str) -> List[str]:
+        return [
+            "-deadline",
+            "realtime",
+            "-cpu-used",
+            str(self.CPU_USED[_preset_index(preset)]),
+            "-row-mt",
+            "1",
+        ]
+
+    def tune_args(self, tune: str) -> List[str]:
+        return []
+
+    def bframes_args(self, bframes: int) -> List[str]:
+        # у VP9 нет B-кадров, задержку дает lookahead альтернативных кадров
+        return ["-lag-in-frames", "0"] if bframes == 0 else []
+
+    def rate_control_args(self, variant: StreamVariant) -> List[str]:
+        # constrained quality: -crf вместе с -b:v как верхней границей
+        return [
+            "-crf",
+            str(min(63, variant.crf + self.crf_offset)),
+            "-b:v",
+            variant.bitrate,
+            "-maxrate",
+            variant.bitrate,
+            "-bufsize",
+            variant.buffer_size,
+        ]
+
+
+# encoder или псевдоним -> кодек
+_CODECS: Dict[str, VideoCodec] = {}
+
+
+def register_codec(codec: VideoCodec) -> None:
+    """Make a codec available to variants by its encoder name and aliases."""
+    for name in [codec.encoder] + codec.aliases:
+        _CODECS[name] = codec
+
+
+def get_codec(name: str) -> VideoCodec:
+    """Get a codec by encoder name ('libx265') or alias ('x265')."""
+    try:
+        return _CODECS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown video codec '{name}' (known: {', '.join(list_codecs())})"
+        )
+
+
+def list_codecs() -> List[str]:
+    """Get encoder names of all registered codecs."""
+    return sorted({codec.encoder for codec in _CODECS.values()})
+
+
+def check_rtmp_codecs(variants: List[StreamVariant]) -> None:
+    """Raise ValueError if a variant can't be published to nginx-rtmp."""
+    rejected = [
+        f"{v.label} ({get_codec(v.video_codec).encoder})"
+        for v in variants
+        if get_codec(v.video_codec).codec_name not in RTMP_CODECS
+    ]
+    if rejected:
+        raise ValueError(
+            "nginx-rtmp accepts H.264 only, can't publish "
+            f"{', '.join(rejected)}; other codecs are for 'msconv transcode' files only"
+        )
+
+
+def apply_codec(
+    variants: List[StreamVariant], name: str, max_height: Optional[int] = None
+) -> List[StreamVariant]:
+    """Switch variants (at most ``max_height`` tall) to another codec.
+
+    Bitrates are scaled by the codecs' ``bitrate_factor`` ratio, so the
+    quality stays about the same while the bandwidth goes down.
+    """
+    codec = get_codec(name)
+    result = []
+    for variant in variants:
+        current = get_codec(variant.video_codec)
+        if (max_height is None or variant.height <= max_height) and current != codec:
+            bitrate = variant.bitrate_numeric * codec.bitrate_factor
+            variant = replace(
+                variant,
+                video_codec=codec.encoder,
+                bitrate=f"{int(bitrate / current.bitrate_factor)}k",
+            )
+        result.append(variant)
+    return result
+
+
+for _codec in (X264Codec(), X265Codec(), SVTAV1Codec(), VP9Codec()):
+    register_codec(_codec)
@@ -0,0 +1,589 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from .adaptive import AdaptivePolicy, AdaptiveState, StreamSpec
+from .capacity import busy_cores, read_cpu_times
+from .ladder_cache import is_entry_complete
+from .models import StreamVariant
+from .log_options import LOG_BACKUPS, LOG_MAX_BYTES
+from .logs import RotatingLog
+from .recorder import RECORD_MAX_AGE, RECORD_MAX_BYTES, prune_recordings
+from .registry import ProcessRegistry
+from .telemetry import ProgressParser, ProgressSample, render_prometheus
+from .utils import (
+    KILL_TIMEOUT,
+    STOP_TIMEOUT,
+    get_log_file,
+    get_socket_path,
+    resolve_group_key,
+    split_group_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# Задержки перед перезапуском упавшего ffmpeg (экспоненциальный backoff)
+RESTART_BACKOFF_INITIAL = 1.0
+RESTART_BACKOFF_MAX = 30.0
+# Если ffmpeg проработал дольше этого времени, backoff сбрасывается
+HEALTHY_RUNTIME = 60.0
+# Не ругаемся на скорость ниже realtime, пока ffmpeg разгоняется
+SPEED_WARMUP = 5.0
+# Как часто проверять скорость потоков и загрузку хоста для адаптации
+ADAPT_INTERVAL = 2.0
+# Как часто индексировать записи и удалять старые сегменты
+RETENTION_INTERVAL = 30.0
+
+
+@dataclass
+class ManagedStream:
+    """A single ffmpeg child owned by the supervisor."""
+
+    stream_key: str
+    command: List[str]
+    process: Optional[asyncio.subprocess.Process] = None
+    task: Optional["asyncio.Task[None]"] = None
+    started_at: float = 0.0
+    restarts: int = 0
+    stopping: bool = False
+    progress: Optional[ProgressSample] = None
+    below_realtime: bool = False
+    adaptive: Optional[AdaptiveState] = None
+    # ffmpeg перезапускается с новой командой, это не падение
+    reloading: bool = False
+    # команда, которой заменяется command после ее успешного завершения
+    next_command: Optional[List[str]] = None
+    # запись кэша лесенки, которую копирует next_command (CachedCommands.entry)
+    cache_entry: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize stream state for clients."""
+        running = self.process is not None and self.process.returncode is None
+        return {
+            "stream_key": self.stream_key,
+            "members": split_group_key(self.stream_key),
+            "pid": self.process.pid if self.process else None,
+            "state": "running" if running else "restarting",
+            "uptime": time.time() - self.started_at if running else 0.0,
+            "restarts": self.restarts,
+            "speed": self.progress.speed if self.progress else None,
+            "command": self.command,
+            "degrade_level": self.adaptive.level if self.adaptive else 0,
+            "degradations": self.adaptive.degradations if self.adaptive else 0,
+            "recoveries": self.adaptive.recoveries if self.adaptive else 0,
+        }
+
+
+class StreamSupervisor:
+    """Owns all ffmpeg children in a single asyncio event loop.
+
+    Clients talk to it over a Unix socket with one JSON request per
+    connection: ``{"action": "publish" | "stop" | "list" | "stats", ...}``.
+    Commands built with ``-progress pipe:1`` report structured telemetry,
+    optionally exposed for Prometheus on ``metrics_port``.
+
+    Streams published with a ``spec`` are watched by the ``adaptive``
+    policy: a stream that can't keep up is restarted with a cheaper ladder
+    and restored step by step once the host has headroom again.
+
+    Every ``RETENTION_INTERVAL`` seconds recordings are indexed and
+    trimmed to ``record_max_age``/``record_max_bytes``.
+    """
+
+    def __init__(
+        self,
+        socket_path: Optional[Path] = None,
+        restart: bool = True,
+        metrics_port: Optional[int] = None,
+        metrics_host: str = "127.0.0.1",
+        adaptive: Optional[AdaptivePolicy] = None,
+        log_max_bytes: int = LOG_MAX_BYTES,
+        log_max_age: Optional[float] = None,
+        log_backups: int = LOG_BACKUPS,
+        record_max_age: Optional[float] = RECORD_MAX_AGE,
+        record_max_bytes: Optional[int] = RECORD_MAX_BYTES,
+    ):
+        self.socket_path = socket_path or get_socket_path()
+        self.restart = restart
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.adaptive = adaptive
+        self.log_max_bytes = log_max_bytes
+        self.log_max_age = log_max_age
+        self.log_backups = log_backups
+        self.record_max_age = record_max_age
+        self.record_max_bytes = record_max_bytes
+        self.registry = ProcessRegistry()
+        self.streams: Dict[str, ManagedStream] = {}
+
+    async def serve(self) -> None:
+        """Serve client requests until SIGINT/SIGTERM."""
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+        server = await asyncio.start_unix_server(
+            self._handle_client, path=str(self.socket_path)
+        )
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        metrics_server = None
+        if self.metrics_port:
+            metrics_server = await asyncio.start_server(
+                self._handle_metrics, self.metrics_host, self.metrics_port
+            )
+            logger.info(
+                "Prometheus metrics on http://%s:%d/metrics",
+                self.metrics_host,
+                self.metrics_port,
+            )
+
+        adapt_task = None
+        if self.adaptive is not None:
+            adapt_task = asyncio.create_task(self._adapt_loop())
+        retention_task = asyncio.create_task(self._retention_loop())
+
+        logger.info("msconv daemon listening on %s", self.socket_path)
+        try:
+            async with server:
+                await stop_event.wait()
+        finally:
+            if metrics_server is not None:
+                metrics_server.close()
+            if adapt_task is not None:
+                adapt_task.cancel()
+            retention_task.cancel()
+            logger.info("Shutting down, stopping %d streams", len(self.streams))
+            await asyncio.gather(
+                *(self.stop_stream(key) for key in list(self.streams)),
+                return_exceptions=True,
+            )
+            self.registry.close()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        line = await reader.readline()
+        if not line:
+            # Проверка доступности (is_available) без запроса
+            writer.close()
+            return
+
+        try:
+            request = json.loads(line)
+            result = await self.dispatch(request)
+            response = {"ok": True, "result": result}
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+
+        writer.write(json.dumps(response).encode() + b"\n")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request: Dict[str, Any]) -> Any:
+        """Execute a client request and return its result."""
+        action = request.get("action")
+        if action == "publish":
+            return self.publish(
+                request["stream_key"],
+                request["command"],
+                request.get("spec"),
+                request.get("next_command"),
+                request.get("cache_entry"),
+            )
+        elif action == "stop":
+            timeout = request.get("timeout", STOP_TIMEOUT)
+            if "stream_keys" not in request:
+                return await self.stop_stream(request["stream_key"], timeout)
+            # все потоки останавливаются параллельно
+            results = await asyncio.gather(
+                *(self.stop_stream(key, timeout) for key in request["stream_keys"]),
+                return_exceptions=True,
+            )
+            return [
+                {"stream_key": key, "error": str(r)} if isinstance(r, Exception) else r
+                for key, r in zip(request["stream_keys"], results)
+            ]
+        elif action == "list":
+            return [stream.to_dict() for stream in self.streams.values()]
+        elif action == "stats":
+            return {
+                key: stream.progress.to_dict() if stream.progress else None
+                for key, stream in self.streams.items()
+            }
+        else:
+            raise ValueError(f"Unknown action: {action}")
+
+    async def _handle_metrics(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Minimal HTTP handler serving ``GET /metrics``."""
+        try:
+            request_line = (await reader.readline()).decode(errors="replace")
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[1] == "/metrics":
+                adaptive = {
+                    k: s.adaptive for k, s in self.streams.items() if s.adaptive
+                }
+                body = render_prometheus(
+                    {key: s.progress for key, s in self.streams.items()},
+                    {key: s.restarts for key, s in self.streams.items()},
+                    degradations={k: a.degradations for k, a in adaptive.items()},
+                    recoveries={k: a.recoveries for k, a in adaptive.items()},
+                    levels={k: a.level for k, a in adaptive.items()},
+                ).encode()
+                status = "200 OK"
+                content_type = "text/plain; version=0.0.4"
+            else:
+                body, status, content_type = (
+                    b"Not Found\n",
+                    "404 Not Found",
+                    "text/plain",
+                )
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def publish(
+        self,
+        stream_key: str,
+        command: List[str],
+        spec: Optional[Dict[str, Any]] = None,
+        next_command: Optional[List[str]] = None,
+        cache_entry: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Start supervising a new ffmpeg command.
+
+        ``spec`` (a serialized StreamSpec) lets the supervisor rebuild the
+        command with fewer variants under CPU pressure. ``next_command``
+        replaces ``command`` once it exits with status 0 (the first pass
+        that filled the ladder cache, see ``msconv.ladder_cache``) and
+        ``cache_entry`` validates; until then ``command`` runs again.
+        """
+        if isinstance(command, str):
+            raise RuntimeError("Command must be an argv list, not a shell string")
+        active = {member for key in self.streams for member in split_group_key(key)}
+        for member in split_group_key(stream_key):
+            if member in active:
+                raise RuntimeError(f"Stream '{member}' is already active")
+
+        stream = ManagedStream(
+            stream_key=stream_key,
+            command=command,
+            next_command=next_command,
+            cache_entry=cache_entry,
+        )
+        if spec is not None and self.adaptive is not None:
+            stream.adaptive = AdaptiveState(StreamSpec.from_dict(spec))
+        self.streams[stream_key] = stream
+        stream.task = asyncio.create_task(self._run_stream(stream))
+        return stream.to_dict()
+
+    async def stop_stream(
+        self, stream_key: str, timeout: float = STOP_TIMEOUT
+    ) -> Dict[str, Any]:
+        """Terminate a stream and stop restarting it.
+
+        ffmpeg gets ``timeout`` seconds after SIGTERM to finish its outputs
+        before it is killed. Stopping one key of a shared process stops the
+        whole group. Returns how long the shutdown took.
+        """
+        if stream_key not in self.streams:
+            stream_key = resolve_group_key(stream_key, self.streams) or stream_key
+        stream = self.streams.get(stream_key)
+        if stream is None:
+            raise RuntimeError(f"No active stream found for '{stream_key}'")
+
+        stream.stopping = True
+        started = time.monotonic()
+        killed = False
+        process = stream.process
+        if process is not None and process.returncode is None:
+            self._signal(process, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("[%s] ffmpeg ignored SIGTERM, killing", stream_key)
+                self._signal(process, signal.SIGKILL)
+                killed = True
+                try:
+                    await asyncio.wait_for(process.wait(), KILL_TIMEOUT)
+                except asyncio.TimeoutError:
+                    pass
+
+        if stream.task is not None:
+            stream.task.cancel()
+            await asyncio.gather(stream.task, return_exceptions=True)
+
+        self.streams.pop(stream_key, None)
+        self.registry.unregister(stream_key)
+        seconds = time.monotonic() - started
+        logger.info("[%s] stopped in %.1fs", stream_key, seconds)
+        return {"stream_key": stream_key, "seconds": seconds, "killed": killed}
+
+    def _signal(self, process: asyncio.subprocess.Process, sig: int) -> None:
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    async def _run_stream(self, stream: ManagedStream) -> None:
+        """Run ffmpeg, pump its stderr to the log and restart it on exit."""
+        backoff = RESTART_BACKOFF_INITIAL
+        log = RotatingLog(
+            get_log_file(stream.stream_key),
+            max_bytes=self.log_max_bytes,
+            backups=self.log_backups,
+            max_age=self.log_max_age,
+        )
+
+        try:
+            while not stream.stopping:
+                try:
+                    stream.process = await asyncio.create_subprocess_exec(
+                        *stream.command,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE,
+                        start_new_session=True,
+                    )
+                except OSError as e:
+                    # нет ffmpeg или битый argv: пишем в лог потока и ждем,
+                    # как после падения, вместо молчаливого конца задачи
+                    stream.process = None
+                    log.write(f"msconv: failed to start ffmpeg: {e}\n".encode())
+                    if not self.restart:
+                        logger.error(
+                            "[%s] failed to start ffmpeg: %s", stream.stream_key, e
+                        )
+                        break
+                    logger.error(
+                        "[%s] failed to start ffmpeg: %s, retrying in %.0fs",
+                        stream.stream_key,
+                        e,
+                        backoff,
+                    )
+                    stream.restarts += 1
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+                    continue
+                stream.started_at = time.time()
+                stream.progress = None
+                stream.below_realtime = False
+                self.registry.register(
+                    stream.stream_key,
+                    split_group_key(stream.stream_key),
+                    stream.process.pid,
+                    stream.command,
+                    owner="daemon",
+                )
+                logger.info(
+                    "[%s] ffmpeg started (PID %d)",
+                    stream.stream_key,
+                    stream.process.pid,
+                )
+
+                await asyncio.gather(
+                    self._pump_log(stream.process, log),
+                    self._read_progress(stream, stream.process),
+                )
+                returncode = await stream.process.wait()
+
+                if stream.stopping:
+                    break
+                if stream.reloading:
+                    stream.reloading = False
+                    continue
+                if stream.next_command is not None and returncode == 0:
+                    # проход с записью в кэш закончен; если запись не прошла
+                    # проверку (кончилось место, оборвался tee), кодируем еще раз
+                    loop = asyncio.get_running_loop()
+                    complete = stream.cache_entry is None or await loop.run_in_executor(
+                        None, is_entry_complete, stream.cache_entry
+                    )
+                    if not complete:
+                        logger.warning(
+                            "[%s] ladder cache entry is incomplete, encoding again",
+                            stream.stream_key,
+                        )
+                        continue
+                    logger.info("[%s] switching to the next command", stream.stream_key)
+                    stream.command, stream.next_command = stream.next_command, None
+                    stream.adaptive = None
+                    continue
+                if not self.restart:
+                    break
+
+                runtime = time.time() - stream.started_at
+                if runtime >= HEALTHY_RUNTIME:
+                    backoff = RESTART_BACKOFF_INITIAL
+
+                logger.warning(
+                    "[%s] ffmpeg exited with code %s after %.1fs, restarting in %.0fs",
+                    stream.stream_key,
+                    returncode,
+                    runtime,
+                    backoff,
+                )
+                stream.restarts += 1
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+        finally:
+            log.close()
+
+        if not stream.stopping:
+            # ffmpeg завершился сам и перезапуск выключен
+            self.streams.pop(stream.stream_key, None)
+            self.registry.unregister(stream.stream_key)
+
+    async def _retention_loop(self) -> None:
+        """Periodically index recordings and evict old segments."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(RETENTION_INTERVAL)
+            try:
+                removed, freed = await loop.run_in_executor(
+                    None,
+                    prune_recordings,
+                    self.record_max_age,
+                    self.record_max_bytes,
+                )
+            except OSError as e:
+                logger.warning("Failed to prune recordings: %s", e)
+                continue
+            if removed:
+                logger.info(
+                    "Evicted %d recorded segments (%.0f MB)", removed, freed / 1024**2
+                )
+
+    async def _adapt_loop(self) -> None:
+        """Periodically degrade or restore streams per the adaptive policy."""
+        assert self.adaptive is not None
+        cpu_before = read_cpu_times()
+        while True:
+            await asyncio.sleep(ADAPT_INTERVAL)
+            cpu_after = read_cpu_times()
+            if cpu_before and cpu_after:
+                host_load = busy_cores(cpu_before, cpu_after)
+            else:
+                host_load = os.getloadavg()[0]
+            cpu_before = cpu_after
+
+            now = time.monotonic()
+            for stream in list(self.streams.values()):
+                state = stream.adaptive
+                if state is None or stream.stopping or stream.reloading:
+                    continue
+                sample = stream.progress
+                if sample is not None and sample.out_time < SPEED_WARMUP:
+                    sample = None
+                decision = self.adaptive.decide(state, sample, host_load, now)
+                if decision is None:
+                    continue
+
+                previous = state.variants
+                self.adaptive.apply(state, decision, now)
+                log = logger.warning if decision == "degrade" else logger.info
+                log(
+                    "[%s] %s to level %d (speed %.2fx, host load %.1f cores): %s -> %s",
+                    stream.stream_key,
+                    "degrading" if decision == "degrade" else "recovering",
+                    state.level,
+                    sample.speed if sample else 0.0,
+                    host_load,
+                    _describe_variants(previous),
+                    _describe_variants(state.variants),
+                )
+                try:
+                    await self._reload(stream, state)
+                except Exception as e:
+                    logger.error(
+                        "[%s] failed to rebuild command: %s", stream.stream_key, e
+                    )
+
+    async def _reload(self, stream: ManagedStream, state: AdaptiveState) -> None:
+        """Restart a stream's ffmpeg with the ladder of its current level."""
+        loop = asyncio.get_running_loop()
+        # build_command может вызвать ffprobe, не блокируем цикл событий
+        stream.command = await loop.run_in_executor(
+            None, state.spec.build_command, state.variants
+        )
+        # урезанная лесенка кодируется в цикле, кэш она не заполнит
+        stream.next_command = None
+        stream.cache_entry = None
+        process = stream.process
+        if process is None or process.returncode is not None:
+            return
+        stream.reloading = True
+        self._signal(process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._signal(process, signal.SIGKILL)
+
+    async def _pump_log(
+        self, process: asyncio.subprocess.Process, log: RotatingLog
+    ) -> None:
+        # ffmpeg пишет статистику через '\r', поэтому читаем блоками
+        assert process.stderr is not None
+        while True:
+            chunk = await process.stderr.read(4096)
+            if not chunk:
+                break
+            log.write(chunk)
+
+    async def _read_progress(
+        self, stream: ManagedStream, process: asyncio.subprocess.Process
+    ) -> None:
+        """Parse ``-progress pipe:1`` output into stream telemetry."""
+        assert process.stdout is not None
+        parser = ProgressParser()
+        async for line in process.stdout:
+            sample = parser.feed(line.decode(errors="replace"))
+            if sample is None:
+                continue
+
+            stream.progress = sample
+            if sample.ended or sample.out_time < SPEED_WARMUP or sample.speed is None:
+                continue
+            if not sample.realtime and not stream.below_realtime:
+                stream.below_realtime = True
+                logger.warning(
+                    "[%s] encoding below realtime: speed %.2fx",
+                    stream.stream_key,
+                    sample.speed,
+                )
+            elif sample.realtime and stream.below_realtime:
+                stream.below_realtime = False
+                logger.info(
+                    "[%s] back to realtime: speed %.2fx",
+                    stream.stream_key,
+                    sample.speed,
+                )
+
+
+def _describe_variants(variants: List[StreamVariant]) -> str:
+    return ",".join(f"{v.label}/{v.preset}" for v in variants)
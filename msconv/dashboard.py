@@ -0,0 +1,234 @@
+import curses
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from .client import DaemonClient
+from .listers import StreamLister, fetch_streams
+from .utils import split_group_key
+
+# Клавиша -> (поле сортировки, по убыванию)
+SORT_KEYS = {
+    ord("n"): ("stream_key", False),
+    ord("b"): ("bitrate_kbps", True),
+    ord("v"): ("viewers", True),
+    ord("s"): ("speed", False),
+}
+
+
+@dataclass
+class FleetRow:
+    """One stream in the fleet view."""
+
+    stream_key: str
+    live: bool = False
+    variants: int = 0
+    viewers: int = 0
+    bitrate_kbps: int = 0
+    speed: Optional[float] = None
+    fps: Optional[float] = None
+    restarts: int = 0
+
+    def format(self, width: int) -> str:
+        status = "LIVE" if self.live else "----"
+        speed = f"{self.speed:5.2f}x" if self.speed is not None else "     -"
+        fps = f"{self.fps:6.1f}" if self.fps is not None else "     -"
+        line = (
+            f"{self.stream_key[:24]:24s} {status:4s} {self.variants:3d} "
+            f"{self.viewers:7d} {self.bitrate_kbps:9d} {speed} {fps} {self.restarts:4d}"
+        )
+        return line[:width]
+
+
+HEADER = (
+    f"{'STREAM':24s} {'STAT':4s} {'VAR':>3s} {'VIEWERS':>7s} "
+    f"{'KBIT/S':>9s} {'SPEED':>6s} {'FPS':>6s} {'RST':>4s}"
+)
+
+
+class FleetPoller(threading.Thread):
+    """Poll listers and daemon telemetry in the background."""
+
+    def __init__(
+        self,
+        listers: Dict[str, StreamLister],
+        client: Optional[DaemonClient],
+        interval: float = 2.0,
+    ):
+        super().__init__(daemon=True)
+        self.listers = listers
+        self.client = client
+        self.interval = interval
+
+        self.version = 0
+        self.rows: List[FleetRow] = []
+        self.errors: Dict[str, str] = {}
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def snapshot(self) -> Tuple[int, List[FleetRow], Dict[str, str], float]:
+        with self._lock:
+            return self.version, self.rows, self.errors, self.updated_at
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            rows, errors = self._poll()
+            with self._lock:
+                self.rows, self.errors = rows, errors
+                self.updated_at = time.time()
+                self.version += 1
+            self._stop_event.wait(self.interval)
+
+    def _poll(self) -> Tuple[List[FleetRow], Dict[str, str]]:
+        streams, lister_errors = fetch_streams(self.listers)
+        errors = {name: str(e) for name, e in lister_errors.items()}
+
+        # демон отдает процессы (общий процесс — "a+b"), листеры — потоки
+        supervised: Dict[str, Dict[str, Any]] = {}
+        samples: Dict[str, Any] = {}
+        if self.client is not None and self.client.is_available():
+            try:
+                for process in self.client.request("list"):
+                    for stream_key in split_group_key(process["stream_key"]):
+                        supervised[stream_key] = process
+                for key, sample in self.client.request("stats").items():
+                    for stream_key in split_group_key(key):
+                        samples[stream_key] = sample
+            except Exception as e:
+                errors["daemon"] = str(e)
+
+        rows = []
+        for stream_key in set(streams) | set(supervised):
+            info = streams.get(stream_key, {})
+            row = FleetRow(
+                stream_key=stream_key,
+                live=info.get("live", False),
+                variants=len(info.get("variants", ())),
+                viewers=sum(info.get("readers", {}).values()),
+                bitrate_kbps=sum(info.get("bitrates", {}).values()),
+            )
+            if stream_key in supervised:
+                row.restarts = supervised[stream_key]["restarts"]
+            sample = samples.get(stream_key)
+            if sample:
+                row.speed = sample["speed"]
+                row.fps = sample["fps"]
+            rows.append(row)
+        return rows, errors
+
+
+class DiffRenderer:
+    """Write only screen rows whose text changed since the last frame."""
+
+    def __init__(self, stdscr: Any):
+        self.stdscr = stdscr
+        self._lines: List[Optional[str]] = []
+        self._attrs: List[int] = []
+
+    def invalidate(self) -> None:
+        """Force a full redraw (e.g. after a terminal resize)."""
+        self._lines = []
+        self._attrs = []
+        self.stdscr.erase()
+
+    def render(self, lines: List[Tuple[str, int]]) -> None:
+        height, width = self.stdscr.getmaxyx()
+        if len(self._lines) != height:
+            self._lines = [None] * height
+            self._attrs = [0] * height
+
+        for y in range(height):
+            text, attr = lines[y] if y < len(lines) else ("", 0)
+            text = text[: width - 1]
+            if self._lines[y] == text and self._attrs[y] == attr:
+                continue
+            self.stdscr.move(y, 0)
+            self.stdscr.clrtoeol()
+            if text:
+                self.stdscr.addstr(y, 0, text, attr)
+            self._lines[y] = text
+            self._attrs[y] = attr
+
+        self.stdscr.noutrefresh()
+        curses.doupdate()
+
+
+def run_top(poller: FleetPoller, sort_key: str = "bitrate_kbps") -> None:
+    """Run the interactive fleet dashboard until 'q' is pressed."""
+
+    def _inner(stdscr: Any) -> None:
+        curses.curs_set(0)
+        curses.use_default_colors()
+        # getch ждет ввод не дольше 250 мс, поэтому без активного ожидания
+        stdscr.timeout(250)
+        renderer = DiffRenderer(stdscr)
+
+        field, descending = next((f, d) for f, d in SORT_KEYS.values() if f == sort_key)
+        offset = 0
+        sorted_rows: List[FleetRow] = []
+        sorted_for: Tuple[int, str, bool] = (-1, "", False)
+
+        while True:
+            version, rows, errors, updated_at = poller.snapshot()
+            if sorted_for != (version, field, descending):
+                sorted_rows = _sort_rows(rows, field, descending)
+                sorted_for = (version, field, descending)
+
+            height, width = stdscr.getmaxyx()
+            page = max(height - (4 if errors else 3), 1)
+            offset = max(0, min(offset, len(sorted_rows) - page))
+
+            age = f"{time.time() - updated_at:.0f}s ago" if updated_at else "polling"
+            status = (
+                f"msconv top — {len(sorted_rows)} streams, sort: {field}"
+                f"{' desc' if descending else ''}, updated {age}  "
+                f"[n/b/v/s sort, r reverse, ↑↓ PgUp/PgDn scroll, q quit]"
+            )
+            lines = [(status, curses.A_BOLD), (HEADER, curses.A_REVERSE)]
+            lines += [
+                (row.format(width), 0) for row in sorted_rows[offset : offset + page]
+            ]
+            if errors:
+                lines.append(
+                    ("; ".join(f"{k}: {v}" for k, v in errors.items()), curses.A_DIM)
+                )
+            renderer.render(lines)
+
+            ch = stdscr.getch()
+            if ch == ord("q"):
+                return
+            elif ch in SORT_KEYS:
+                field, descending = SORT_KEYS[ch]
+            elif ch == ord("r"):
+                descending = not descending
+            elif ch in (curses.KEY_DOWN, ord("j")):
+                offset += 1
+            elif ch in (curses.KEY_UP, ord("k")):
+                offset -= 1
+            elif ch == curses.KEY_NPAGE:
+                offset += page
+            elif ch == curses.KEY_PPAGE:
+                offset -= page
+            elif ch == curses.KEY_RESIZE:
+                renderer.invalidate()
+
+    poller.start()
+    try:
+        curses.wrapper(_inner)
+    finally:
+        poller.stop()
+
+
+def _sort_rows(rows: List[FleetRow], field: str, descending: bool) -> List[FleetRow]:
+    def key(row: FleetRow) -> Any:
+        value = getattr(row, field)
+        # Потоки без телеметрии всегда в конце
+        if value is None:
+            return (1, 0)
+        return (0, -value if descending and field != "stream_key" else value)
+
+    return sorted(rows, key=key, reverse=descending and field == "stream_key")
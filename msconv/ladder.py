@@ -0,0 +1,120 @@
+import math
+from typing import List, Optional
+from .models import MediaInfo, StreamVariant
+
+# Пропускная способность зрителей по умолчанию, кбит/с: для 1080p30 дает
+# 4 ступени (1080/708/448/284), не больше, чем get_default_variants
+DEFAULT_BANDWIDTHS = [8000, 3500, 1500, 700]
+# Доля канала зрителя, которую может занять поток (остальное -- запас на колебания)
+BANDWIDTH_HEADROOM = 0.8
+# Бит на пиксель для H.264 при "хорошем" качестве; больше -- бесполезно
+TARGET_BPP = 0.1
+MAX_BPP = 0.15
+# Соседние ступени должны отличаться по высоте хотя бы во столько раз
+MIN_RUNG_STEP = 1.4
+MIN_HEIGHT = 144
+MIN_BITRATE = 100
+DEFAULT_FPS = 30.0
+
+# Большие ступени стоят больше всего CPU, им более быстрый пресет
+_PRESET_BY_HEIGHT = [(1080, "veryfast"), (720, "faster"), (0, "fast")]
+
+
+def _even(value: float) -> int:
+    # libx264 требует четные размеры кадра
+    return max(2, int(round(value / 2)) * 2)
+
+
+def rung_preset(height: int) -> str:
+    """Pick the x264 preset for a rung of the given height (short side)."""
+    for min_height, preset in _PRESET_BY_HEIGHT:
+        if height >= min_height:
+            return preset
+    return _PRESET_BY_HEIGHT[-1][1]
+
+
+def generate_ladder(
+    media_info: MediaInfo,
+    bandwidths: Optional[List[int]] = None,
+    audio_bitrate: int = 128,
+    audio: bool = True,
+) -> List[StreamVariant]:
+    """Compute a variant ladder for a source and viewer bandwidths (kbit/s).
+
+    Each bandwidth gets the largest rung whose bits-per-pixel at the source
+    fps reaches ``TARGET_BPP`` within ``BANDWIDTH_HEADROOM`` of the link
+    (minus audio). Rungs keep the source aspect ratio, have even
+    dimensions and never upscale; rungs capped at the source resolution
+    don't get more than ``MAX_BPP``. A rung less than ``MIN_RUNG_STEP``
+    smaller than the previous one is dropped, so small or low-fps sources
+    end up with fewer rungs. Heights, labels and presets refer to the short
+    side, so portrait sources get the same ladder as landscape ones.
+    """
+    if not media_info.width or not media_info.height:
+        raise ValueError("Source resolution is unknown, can't generate a ladder")
+
+    fps = media_info.fps or DEFAULT_FPS
+    # длинная сторона к короткой; для вертикального видео ширина короче
+    portrait = media_info.height > media_info.width
+    short_side = min(media_info.width, media_info.height)
+    aspect = max(media_info.width, media_info.height) / short_side
+    source_pixels = media_info.width * media_info.height
+    audio_kbps = audio_bitrate if audio and media_info.has_audio else 0
+
+    rungs: List[StreamVariant] = []
+    last_short = 0
+    for bandwidth in sorted(bandwidths or DEFAULT_BANDWIDTHS, reverse=True):
+        video_kbps = bandwidth * BANDWIDTH_HEADROOM - audio_kbps
+        if video_kbps <= 0:
+            continue
+
+        pixels = video_kbps * 1000 / (fps * TARGET_BPP)
+        if pixels >= source_pixels:
+            short = short_side
+            video_kbps = min(video_kbps, source_pixels * fps * MAX_BPP / 1000)
+        else:
+            short = _even(math.sqrt(pixels / aspect))
+        if short < MIN_HEIGHT:
+            continue
+        if rungs and last_short / short < MIN_RUNG_STEP:
+            # Слишком близко к предыдущей (большей) ступени
+            continue
+        rungs.append(_rung(short, aspect, portrait, video_kbps, audio_bitrate))
+        last_short = short
+
+    if not rungs:
+        # Канал не тянет даже минимальную ступень: отдаем ее на том, что есть
+        bandwidth = min(bandwidths or DEFAULT_BANDWIDTHS)
+        short = min(MIN_HEIGHT, _even(short_side))
+        pixels = short * short * aspect
+        video_kbps = min(
+            bandwidth * BANDWIDTH_HEADROOM - audio_kbps, pixels * fps * MAX_BPP / 1000
+        )
+        video_kbps = max(video_kbps, MIN_BITRATE)
+        rungs.append(_rung(short, aspect, portrait, video_kbps, audio_bitrate))
+    return rungs
+
+
+def _rung(
+    short: int, aspect: float, portrait: bool, video_kbps: float, audio_bitrate: int
+) -> StreamVariant:
+    long = _even(short * aspect)
+    width, height = (short, long) if portrait else (long, short)
+    return StreamVariant(
+        label=f"{short}p",
+        bitrate=f"{int(video_kbps)}k",
+        width=width,
+        height=height,
+        audio_bitrate=f"{audio_bitrate}k",
+        preset=rung_preset(short),
+    )
+
+
+def parse_bandwidths(value: str) -> List[int]:
+    """Parse a comma-separated list of kbit/s values ('6000,3000,1200k')."""
+    bandwidths = []
+    for part in value.split(","):
+        part = part.strip().lower().rstrip("k")
+        if part:
+            bandwidths.append(int(part))
+    return bandwidths
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from .backends import FFmpegBackend
+from .models import InputSource, InputType, MediaInfo, StreamVariant
+from .probe import InputProber
+
+# Сколько места на диске могут занимать все закодированные лесенки
+LADDER_CACHE_BYTES = 20 * 1024**3
+# Запись с файлами моложе этого, скорее всего, еще пишет другой ffmpeg
+WRITING_GRACE = 60.0
+# Допустимое расхождение длительности закэшированного варианта и источника
+DURATION_TOLERANCE = 1.0
+
+_HASHES_NAME = "hashes.json"
+_HASH_BLOCK = 1024 * 1024
+
+
+def get_ladder_cache_dir() -> Path:
+    """Get the directory holding cached ladders, one subdirectory per key."""
+    return Path(os.environ.get("MSCONV_LADDER_CACHE_DIR", "cache/ladder")).absolute()
+
+
+@dataclass
+class CachedCommands:
+    """Commands publishing a looped file through the ladder cache.
+
+    ``next_command`` replaces ``command`` once it exits cleanly: on a miss
+    ``command`` encodes one pass of the file while writing the entry and
+    ``next_command`` loops the entry with ``-c copy``. ``entry`` describes
+    the entry for ``is_entry_complete``, which must pass before switching.
+    """
+
+    command: List[str]
+    next_command: Optional[List[str]] = None
+    hit: bool = False
+    entry: Optional[Dict[str, Any]] = None
+
+
+class LadderCache:
+    """Content-addressed store of encoded variants of looped file inputs.
+
+    An entry is keyed by the hash of the file's content and of the
+    encoding command (``FFmpegBackend.cache_signature``), and holds one
+    ``<label>.mp4`` per variant. A miss publishes one pass of the file
+    while ``tee`` also writes the entry; every later loop, and every later
+    publish of the same file, copies the entry with ``-c copy``. Switching
+    from the encoding pass to the copy restarts ffmpeg, so the RTMP
+    publish reconnects once. Entries are evicted least recently used first
+    once they exceed ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        root: Optional[Path] = None,
+        max_bytes: Optional[int] = LADDER_CACHE_BYTES,
+        prober: Optional[InputProber] = None,
+    ):
+        self.root = root or get_ladder_cache_dir()
+        self.max_bytes = max_bytes
+        self.prober = prober or InputProber()
+
+    def key(self, path: str, signature: str) -> str:
+        """Get the entry key of a file encoded as ``signature`` describes."""
+        raw = f"{self.file_hash(path)}:{signature}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+    def file_hash(self, path: str) -> str:
+        """Hash a file's content; remembered until the file changes."""
+        stat = os.stat(path)
+        memo_key = f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+        hashes_path = self.root / _HASHES_NAME
+        try:
+            hashes = json.loads(hashes_path.read_text())
+        except (OSError, ValueError):
+            hashes = {}
+        if memo_key in hashes:
+            return hashes[memo_key]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+                digest.update(block)
+        # старые версии файла больше не нужны
+        prefix = f"{os.path.abspath(path)}:"
+        hashes = {k: v for k, v in hashes.items() if not k.startswith(prefix)}
+        hashes[memo_key] = digest.hexdigest()
+        tmp = None
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            # свой временный файл: хэши могут писать несколько publish сразу
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(hashes, f)
+            os.replace(tmp, hashes_path)
+        except OSError:
+            if tmp is not None:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+        return hashes[memo_key]
+
+    def files(self, key: str, labels: List[str]) -> Dict[str, str]:
+        """Get the variant files of an entry (label -> path)."""
+        return {label: str(self.root / key / f"{label}.mp4") for label in labels}
+
+    def lookup(
+        self, key: str, labels: List[str], duration: float = 0.0
+    ) -> Optional[Dict[str, str]]:
+        """Get the files of a complete entry and mark it as recently used.
+
+        An entry counts only if every variant probes fine and is as long
+        as the source: ffmpeg writes the mp4 index last, so a pass that was
+        interrupted leaves files that fail here.
+        """
+        files = self.files(key, labels)
+        if not all(os.path.isfile(path) for path in files.values()):
+            return None
+        for path in files.values():
+            info = self.prober.probe(
+                InputSource(InputType.FILE, path, loop=False, realtime=False)
+            )
+            if info is None or not info.has_video:
+                return None
+            if duration and abs(info.duration - duration) > DURATION_TOLERANCE:
+                return None
+        os.utime(self.root / key)
+        return files
+
+    def claim(self, key: str, reserve: int = 0) -> Optional[Path]:
+        """Get the directory to write a new entry into, making room for it.
+
+        Returns None while another publish is still writing the entry.
+        """
+        entry = self.root / key
+        if entry.is_dir():
+            newest = max((p.stat().st_mtime for p in entry.iterdir()), default=0.0)
+            if time.time() - newest < WRITING_GRACE:
+                return None
+            # недописанная запись прерванного прохода
+            shutil.rmtree(entry, ignore_errors=True)
+        self.evict(reserve)
+        entry.mkdir(parents=True)
+        return entry
+
+    def evict(self, reserve: int = 0) -> Tuple[int, int]:
+        """Remove least recently used entries until ``reserve`` more bytes fit.
+
+        Returns the number of entries and bytes removed.
+        """
+        if self.max_bytes is None or not self.root.is_dir():
+            return 0, 0
+        entries = []
+        for entry in self.root.iterdir():
+            if entry.is_dir():
+                size = sum(p.stat().st_size for p in entry.iterdir() if p.is_file())
+                entries.append((entry.stat().st_mtime, size, entry))
+        total = sum(size for _, size, _ in entries)
+
+        removed = freed = 0
+        for _, size, entry in sorted(entries):
+            if total + reserve <= self.max_bytes:
+                break
+            # файлы, которые сейчас публикуются, ffmpeg держит открытыми
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def build_commands(
+        self,
+        backend: FFmpegBackend,
+        stream_key: str,
+        input_source: InputSource,
+        variants: List[StreamVariant],
+        output_base_url: str,
+        audio_enabled: bool = True,
+        media_info: Optional[MediaInfo] = None,
+    ) -> CachedCommands:
+        """Build the commands publishing a looped file through the cache.
+
+        If the entry is being written by another publish right now, the
+        file is encoded on every loop as without the cache.
+        """
+        variants = backend.select_variants(variants, media_info)
+        labels = [v.label for v in variants]
+        signature = backend.cache_signature(variants, audio_enabled, media_info)
+        key = self.key(input_source.path, signature)
+        duration = media_info.duration if media_info else 0.0
+
+        files = self.lookup(key, labels, duration)
+        if files is not None:
+            return CachedCommands(
+                backend.build_copy_command(stream_key, files, output_base_url),
+                hit=True,
+            )
+
+        # оценка размера записи: битрейты вариантов за один проход
+        kbps = sum(
+            v.bitrate_numeric
+            + (int(v.audio_bitrate.rstrip("k")) if audio_enabled else 0)
+            for v in variants
+        )
+        entry = self.claim(key, reserve=int(kbps * 1000 / 8 * duration))
+        if entry is None:
+            return CachedCommands(
+                backend.build_command(
+                    stream_key=stream_key,
+                    input_source=input_source,
+                    variants=variants,
+                    output_base_url=output_base_url,
+                    audio_enabled=audio_enabled,
+                    media_info=media_info,
+                )
+            )
+        first_pass = backend.build_command(
+            stream_key=stream_key,
+            input_source=replace(input_source, loop=False),
+            variants=variants,
+            output_base_url=output_base_url,
+            audio_enabled=audio_enabled,
+            media_info=media_info,
+            cache_dir=entry,
+        )
+        copy = backend.build_copy_command(
+            stream_key, self.files(key, labels), output_base_url
+        )
+        # запрос демону сериализуется в JSON, поэтому описание, а не объект
+        description = {
+            "root": str(self.root),
+            "key": key,
+            "labels": labels,
+            "duration": duration,
+        }
+        return CachedCommands(first_pass, copy, entry=description)
+
+
+def is_entry_complete(entry: Dict[str, Any]) -> bool:
+    """Check an entry described by ``CachedCommands.entry`` without evicting."""
+    cache = LadderCache(Path(entry["root"]), max_bytes=None)
+    return cache.lookup(entry["key"], entry["labels"], entry["duration"]) is not None
@@ -1,7 +1,10 @@
+import time
 import requests
 import xml.etree.ElementTree as ET
 from abc import ABC, abstractmethod
-from typing import Dict, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Any
+from requests.adapters import HTTPAdapter
 
 
 class StreamLister(ABC):
@@ -12,61 +15,245 @@ class StreamLister(ABC):
         """Get information about active streams."""
         pass
 
+    def _parse_stream_name(self, stream_name: str) -> Tuple[str, str]:
+        """Parse stream name into base key and variant."""
+        if "_" in stream_name:
+            lst = stream_name.rsplit("_", 1)
+            return lst[0], lst[1]
+        return stream_name, ""
+
+
+def _new_stream_info(live: bool = True) -> Dict[str, Any]:
+    """Create an empty per-stream view.
+
+    ``readers`` and ``bitrates`` (kbit/s) are keyed by variant label, an
+    empty label stands for the original (non-variant) stream.
+    """
+    return {"variants": set(), "live": live, "readers": {}, "bitrates": {}}
+
+
+def _copy_streams(streams: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Copy a streams view so callers can merge into it freely."""
+    return {
+        key: {
+            **info,
+            "variants": set(info["variants"]),
+            "readers": dict(info["readers"]),
+            "bitrates": dict(info.get("bitrates", {})),
+        }
+        for key, info in streams.items()
+    }
+
+
+def merge_stream_views(
+    views: List[Dict[str, Dict[str, Any]]],
+) -> Dict[str, Dict[str, Any]]:
+    """Merge stream views of several listers into one."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for view in views:
+        for stream_key, info in view.items():
+            if stream_key not in merged:
+                merged[stream_key] = _new_stream_info(live=False)
+            target = merged[stream_key]
+            target["variants"].update(info["variants"])
+            target["live"] = target["live"] or info.get("live", False)
+            target["readers"].update(info.get("readers", {}))
+            target["bitrates"].update(info.get("bitrates", {}))
+    return merged
+
+
+def fetch_streams(
+    listers: Dict[str, StreamLister],
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Exception]]:
+    """Query all listers concurrently and merge their views.
+
+    Returns the merged view and errors by lister name, so one unreachable
+    source doesn't hide the others. Latency is that of the slowest lister.
+    """
+    views = []
+    errors: Dict[str, Exception] = {}
+    if not listers:
+        return {}, errors
+
+    with ThreadPoolExecutor(max_workers=len(listers)) as executor:
+        futures = {
+            name: executor.submit(lister.get_active_streams)
+            for name, lister in listers.items()
+        }
+        for name, future in futures.items():
+            try:
+                views.append(future.result())
+            except Exception as e:
+                errors[name] = e
+
+    return merge_stream_views(views), errors
+
 
 class NginxRtmpLister(StreamLister):
-    """List streams from nginx-rtmp statistics."""
+    """List streams from nginx-rtmp statistics.
+
+    Uses a keep-alive session, parses ``/stat`` incrementally so only the
+    ``live`` application's streams are materialised, and reuses the last
+    result for ``cache_ttl`` seconds (or on ``304 Not Modified``).
+    """
 
-    def __init__(self, nginx_host: str, nginx_stat_port: str):
+    def __init__(
+        self,
+        nginx_host: str,
+        nginx_stat_port: str,
+        cache_ttl: float = 1.0,
+        timeout: float = 5.0,
+    ):
         self.nginx_host = nginx_host
         self.nginx_stat_port = nginx_stat_port
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+        self._cached: Optional[Dict[str, Dict[str, Any]]] = None
+        self._cached_at = 0.0
+        self._validators: Dict[str, str] = {}
 
     def get_active_streams(self) -> Dict[str, Dict[str, Any]]:
         """Get active streams from nginx-rtmp statistics."""
+        if (
+            self._cached is not None
+            and time.monotonic() - self._cached_at < self.cache_ttl
+        ):
+            return _copy_streams(self._cached)
+
         stat_url = f"http://{self.nginx_host}:{self.nginx_stat_port}/stat"
+        headers = {}
+        if self._cached is not None:
+            if "etag" in self._validators:
+                headers["If-None-Match"] = self._validators["etag"]
+            if "last-modified" in self._validators:
+                headers["If-Modified-Since"] = self._validators["last-modified"]
 
         try:
-            response = requests.get(stat_url, timeout=5)
-            response.raise_for_status()
-            xml_root = ET.fromstring(response.text)
+            with self.session.get(
+                stat_url, headers=headers, timeout=self.timeout, stream=True
+            ) as response:
+                if response.status_code == 304 and self._cached is not None:
+                    streams = self._cached
+                else:
+                    response.raise_for_status()
+                    response.raw.decode_content = True
+                    streams = self._parse_stat(response.raw)
+                    self._validators = {
+                        key: response.headers[key]
+                        for key in ("etag", "last-modified")
+                        if key in response.headers
+                    }
         except Exception as e:
             raise RuntimeError(f"Failed to fetch nginx-rtmp stats: {e}")
 
-        streams = {}
-        for app in xml_root.findall("server/application"):
-            app_name_el = app.find("name")
-            app_name = app_name_el.text if (app_name_el is not None) else "(no-name)"
-
-            live_block = app.find("live")
-            if live_block is None:
-                continue
+        self._cached = streams
+        self._cached_at = time.monotonic()
+        return _copy_streams(streams)
 
-            streams_els = live_block.findall("stream")
-            if not streams_els:
-                continue
+    def _parse_stat(self, source: Any) -> Dict[str, Dict[str, Any]]:
+        """Incrementally parse ``/stat`` XML from a file-like object.
 
-            if app_name == "live":
-                for stream in streams_els:
-                    name_el = stream.find("name")
+        Only ``end`` events are requested to halve the event count. Stream
+        names are collected per ``<live>`` block and kept only once the
+        enclosing application turns out to be ``live``; every processed
+        subtree is cleared right away.
+        """
+        streams: Dict[str, Dict[str, Any]] = {}
+        # (имя потока, входящий битрейт в kbit/s)
+        stream_names: List[Tuple[str, int]] = []
+        live_names: List[Tuple[str, int]] = []
 
-                    if name_el is not None and name_el.text:
-                        stream_name = name_el.text
+        for _, elem in ET.iterparse(source, events=("end",)):
+            tag = elem.tag
+            if tag == "stream":
+                name = elem.findtext("name")
+                if name:
+                    bw_in = elem.findtext("bw_in") or "0"
+                    stream_names.append((name, int(bw_in) // 1000))
+                elem.clear()
+            elif tag == "client":
+                elem.clear()
+            elif tag == "live":
+                live_names, stream_names = stream_names, []
+                elem.clear()
+            elif tag == "play":
+                stream_names = []
+                elem.clear()
+            elif tag == "application":
+                if elem.findtext("name") == "live":
+                    for stream_name, bitrate in live_names:
                         base_key, variant = self._parse_stream_name(stream_name)
-
                         if base_key not in streams:
-                            streams[base_key] = {
-                                "variants": set(),
-                                "live": True,
-                                "readers": {},
-                            }
-
+                            streams[base_key] = _new_stream_info()
                         if variant:
                             streams[base_key]["variants"].add(variant)
+                        streams[base_key]["bitrates"][variant] = bitrate
+                live_names, stream_names = [], []
+                elem.clear()
 
         return streams
 
-    def _parse_stream_name(self, stream_name: str) -> Tuple[str, str]:
-        """Parse stream name into base key and variant."""
-        if "_" in stream_name:
-            lst = stream_name.rsplit("_", 1)
-            return lst[0], lst[1]
-        return stream_name, ""
+
+class MediaMTXLister(StreamLister):
+    """List streams from the MediaMTX v3 control API (``/v3/paths/list``)."""
+
+    def __init__(
+        self,
+        media_host: str,
+        media_api_port: str,
+        page_size: int = 100,
+        timeout: float = 5.0,
+    ):
+        self.media_host = media_host
+        self.media_api_port = media_api_port
+        self.page_size = page_size
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+    def get_active_streams(self) -> Dict[str, Dict[str, Any]]:
+        """Get paths and their readers from MediaMTX, following pagination."""
+        list_url = f"http://{self.media_host}:{self.media_api_port}/v3/paths/list"
+
+        streams: Dict[str, Dict[str, Any]] = {}
+        page = 0
+        page_count = 1
+        try:
+            while page < page_count:
+                response = self.session.get(
+                    list_url,
+                    params={"page": page, "itemsPerPage": self.page_size},
+                    timeout=self.timeout,
+                )
+                response.raise_for_status()
+                data = response.json()
+                for item in data.get("items") or []:
+                    self._add_path(streams, item)
+                page_count = data.get("pageCount", 0)
+                page += 1
+        except Exception as e:
+            raise RuntimeError(f"Failed to fetch MediaMTX paths: {e}")
+
+        return streams
+
+    def _add_path(
+        self, streams: Dict[str, Dict[str, Any]], item: Dict[str, Any]
+    ) -> None:
+        name = item.get("name")
+        if not name:
+            return
+
+        base_key, variant = self._parse_stream_name(name)
+        ready = bool(item.get("ready"))
+        if base_key not in streams:
+            streams[base_key] = _new_stream_info(live=ready)
+        info = streams[base_key]
+        info["live"] = info["live"] or ready
+        if variant:
+            info["variants"].add(variant)
+        info["readers"][variant] = len(item.get("readers") or [])
@@ -0,0 +1,18 @@
+# Настройки логов ffmpeg отдельно от msconv.logs: CLI нужны только они, а
+# ctypes, gzip и threading самого модуля логов при запуске не нужны
+
+# Лог ротируется, когда вырастает больше этого размера
+LOG_MAX_BYTES = 10 * 1024 * 1024
+# Сколько сжатых архивов <key>.log.N.gz хранить
+LOG_BACKUPS = 5
+
+FFMPEG_LOGLEVELS = [
+    "quiet",
+    "panic",
+    "fatal",
+    "error",
+    "warning",
+    "info",
+    "verbose",
+    "debug",
+]
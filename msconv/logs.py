@@ -0,0 +1,237 @@
+import ctypes
+import ctypes.util
+import gzip
+import os
+import shutil
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+from .log_options import LOG_BACKUPS, LOG_MAX_BYTES
+
+# Интервал опроса, если inotify недоступен (не Linux)
+FOLLOW_POLL_INTERVAL = 0.5
+
+_IN_MODIFY = 0x002
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+class RotatingLog:
+    """Append-only log file rotated by size and age.
+
+    When the file exceeds ``max_bytes`` or is older than ``max_age``
+    seconds, it is renamed to ``<name>.1`` and gzipped in a background
+    thread; older archives shift to ``.2.gz`` and so on, keeping at most
+    ``backups`` of them.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = LOG_MAX_BYTES,
+        backups: int = LOG_BACKUPS,
+        max_age: Optional[float] = None,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_age = max_age
+        self._compressor: Optional[threading.Thread] = None
+        self._open()
+
+    def write(self, data: bytes) -> None:
+        self._fd.write(data)
+        self._fd.flush()
+        self._size += len(data)
+        if (self.max_bytes and self._size >= self.max_bytes) or (
+            self.max_age and time.time() - self._opened_at >= self.max_age
+        ):
+            self.rotate()
+
+    def rotate(self) -> None:
+        """Archive the current file and start a new one."""
+        self._fd.close()
+        if self._compressor is not None:
+            self._compressor.join()
+
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                older = self._archive(i)
+                if older.exists():
+                    older.replace(self._archive(i + 1))
+            rotated = self.path.with_name(f"{self.path.name}.1")
+            self.path.replace(rotated)
+            # Сжатие 10 МБ занимает заметное время, не держим пишущего
+            self._compressor = threading.Thread(
+                target=_compress, args=(rotated, self._archive(1)), daemon=True
+            )
+            self._compressor.start()
+        else:
+            self.path.unlink(missing_ok=True)
+        self._open()
+
+    def close(self) -> None:
+        self._fd.close()
+        if self._compressor is not None:
+            self._compressor.join()
+
+    def _archive(self, index: int) -> Path:
+        return self.path.with_name(f"{self.path.name}.{index}.gz")
+
+    def _open(self) -> None:
+        self._fd: BinaryIO = open(self.path, "ab")
+        self._size = self._fd.tell()
+        self._opened_at = time.time()
+
+
+def _compress(source: Path, target: Path) -> None:
+    with open(source, "rb") as src, gzip.open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    source.unlink()
+
+
+class _Inotify:
+    """Minimal inotify binding over ctypes."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self.fd = libc.inotify_init1(_IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def watch(self, directory: Path, mask: int) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {directory} failed")
+        return wd
+
+    def read(self) -> List[tuple]:
+        """Block for events, return (wd, mask, name) tuples."""
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class LogFollower:
+    """Follow several log files like ``tail -F``, without polling.
+
+    Watches the files' directories with inotify, so writes, rotation and
+    files created later are all picked up as they happen. Falls back to
+    polling every ``FOLLOW_POLL_INTERVAL`` seconds where inotify is not
+    available.
+    """
+
+    def __init__(self, paths: Dict[str, Path]):
+        # метка (ключ потока) -> путь
+        self.paths = paths
+        self._files: Dict[str, BinaryIO] = {}
+        self._partial: Dict[str, bytes] = {}
+
+    def tail(self, lines: int) -> Dict[str, List[str]]:
+        """Get the last ``lines`` lines of each file."""
+        result = {}
+        for label, path in self.paths.items():
+            try:
+                with open(path, "rb") as f:
+                    offset = max(0, os.fstat(f.fileno()).st_size - lines * 256)
+                    f.seek(offset)
+                    data = f.read()
+            except OSError:
+                offset, data = 0, b""
+            if offset:
+                # первая строка, скорее всего, обрезана
+                data = data[data.find(b"\n") + 1 :]
+            result[label] = _split_lines(data)[-lines:] if lines else []
+        return result
+
+    def follow(self, on_line: Callable[[str, str], None]) -> None:
+        """Call ``on_line(label, line)`` for every new line, forever."""
+        for label, path in self.paths.items():
+            self._reopen(label, path, at_end=True)
+        try:
+            inotify = _Inotify()
+        except (OSError, AttributeError):
+            self._poll(on_line)
+            return
+
+        try:
+            by_dir: Dict[int, Dict[str, str]] = {}
+            for label, path in self.paths.items():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                wd = inotify.watch(
+                    path.parent, _IN_MODIFY | _IN_CREATE | _IN_MOVED_TO | _IN_MOVED_FROM
+                )
+                by_dir.setdefault(wd, {})[path.name] = label
+            while True:
+                for wd, mask, name in inotify.read():
+                    label = by_dir.get(wd, {}).get(name)
+                    if label is None:
+                        continue
+                    # Дочитываем старый файл, даже если его уже переименовали
+                    self._read(label, on_line)
+                    if mask & (_IN_CREATE | _IN_MOVED_TO):
+                        self._reopen(label, self.paths[label], at_end=False)
+                        self._read(label, on_line)
+        finally:
+            inotify.close()
+
+    def _poll(self, on_line: Callable[[str, str], None]) -> None:
+        while True:
+            for label, path in self.paths.items():
+                self._read(label, on_line)
+                try:
+                    inode = path.stat().st_ino
+                except OSError:
+                    continue
+                current = self._files.get(label)
+                if current is None or os.fstat(current.fileno()).st_ino != inode:
+                    self._reopen(label, path, at_end=False)
+                    self._read(label, on_line)
+            time.sleep(FOLLOW_POLL_INTERVAL)
+
+    def _reopen(self, label: str, path: Path, at_end: bool) -> None:
+        old = self._files.pop(label, None)
+        if old is not None:
+            old.close()
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return
+        if at_end:
+            f.seek(0, os.SEEK_END)
+        self._files[label] = f
+
+    def _read(self, label: str, on_line: Callable[[str, str], None]) -> None:
+        f = self._files.get(label)
+        if f is None:
+            return
+        data = self._partial.pop(label, b"") + f.read()
+        # Последняя строка может быть дописана позже
+        end = max(data.rfind(b"\n"), data.rfind(b"\r")) + 1
+        if end < len(data):
+            self._partial[label] = data[end:]
+        for line in _split_lines(data[:end]):
+            on_line(label, line)
+
+
+def _split_lines(data: bytes) -> List[str]:
+    # ffmpeg разделяет строки статистики '\r'
+    text = data.decode(errors="replace").replace("\r", "\n")
+    return [line for line in text.split("\n") if line.strip()]
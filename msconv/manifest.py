@@ -0,0 +1,350 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .adaptive import StreamSpec
+from .backends import FFmpegBackend
+from .client import DaemonClient
+from .codecs import check_rtmp_codecs
+from .listers import StreamLister
+from .models import InputSource, InputType, MediaInfo, PublishTarget, StreamVariant
+from .profiles import PROFILE_DEFAULT, apply_profile
+from .utils import (
+    get_default_variants,
+    get_group_key,
+    parse_variants,
+    start_ffmpeg_process,
+)
+
+# Ключ манифеста -> тип входа
+INPUT_KEYS = {
+    "file": InputType.FILE,
+    "device": InputType.DEVICE,
+    "rtmp": InputType.RTMP,
+    "rtsp": InputType.RTSP,
+    "udp": InputType.UDP,
+    "http": InputType.HTTP,
+    "lavfi": InputType.LAVFI,
+}
+
+
+def build_input_source(
+    input_type: InputType, value: str, loop: bool = True
+) -> InputSource:
+    """Create an InputSource, resolving local file paths."""
+    if input_type == InputType.FILE:
+        if not os.path.exists(value):
+            raise ValueError(f"Input file not found: {value}")
+        return InputSource(InputType.FILE, os.path.abspath(value), loop)
+    return InputSource(input_type, value)
+
+
+@dataclass
+class ManifestEntry:
+    """One stream declared in a publish manifest."""
+
+    stream_key: str
+    input_source: InputSource
+    variants: List[StreamVariant]
+    original: bool = False
+    audio: bool = True
+
+
+@dataclass
+class BatchStream:
+    """Startup state of one stream of a batch."""
+
+    entry: ManifestEntry
+    command: List[str] = field(default_factory=list)
+    # ключ процесса ffmpeg; у потоков с общим входом он общий
+    process_key: str = ""
+    media_info: Optional[MediaInfo] = None
+    expected_variants: List[str] = field(default_factory=list)
+    probe_time: float = 0.0
+    launched_at: Optional[float] = None
+    live_at: Optional[float] = None
+    error: Optional[str] = None
+    # для адаптивной деградации в демоне; у общих процессов ее нет
+    spec: Optional[StreamSpec] = None
+
+    @property
+    def startup_latency(self) -> Optional[float]:
+        """Seconds from launch until every output was seen live."""
+        if self.launched_at is None or self.live_at is None:
+            return None
+        return self.live_at - self.launched_at
+
+
+def _parse_manifest_variants(value: Any) -> List[StreamVariant]:
+    if isinstance(value, str):
+        return parse_variants(value)
+    if isinstance(value, list):
+        return [StreamVariant(**v) for v in value]
+    raise ValueError(f"Invalid variants: {value!r}")
+
+
+def load_manifest(path: Path, profile: str = PROFILE_DEFAULT) -> List[ManifestEntry]:
+    """Load stream declarations from a YAML or JSON manifest.
+
+    The manifest holds a ``streams`` list and optional ``defaults`` merged
+    into every stream. Each stream needs ``stream_key`` and exactly one
+    input key (``file``, ``device``, ``rtmp``, ``rtsp``, ``udp``, ``http``
+    or ``lavfi``); ``variants`` is either a ``label:bitrate:width:height``
+    string or a list of StreamVariant fields. ``profile`` overrides the
+    given default publish profile.
+    """
+    text = Path(path).read_text()
+    if Path(path).suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("PyYAML is required for YAML manifests")
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+
+    if isinstance(data, list):
+        data = {"streams": data}
+    if not isinstance(data, dict) or not isinstance(data.get("streams"), list):
+        raise ValueError("Manifest must contain a 'streams' list")
+
+    defaults = data.get("defaults") or {}
+    entries = []
+    seen = set()
+    for index, raw in enumerate(data["streams"]):
+        spec = {**defaults, **raw}
+        stream_key = spec.get("stream_key")
+        if not stream_key:
+            raise ValueError(f"Stream #{index} has no stream_key")
+        if stream_key in seen:
+            raise ValueError(f"Duplicate stream_key '{stream_key}'")
+        seen.add(stream_key)
+
+        inputs = [key for key in INPUT_KEYS if key in raw]
+        if not inputs:
+            # вход может быть задан в defaults, например общий lavfi-источник
+            inputs = [key for key in INPUT_KEYS if key in spec]
+        if len(inputs) != 1:
+            raise ValueError(f"Stream '{stream_key}': specify exactly one input")
+        input_source = build_input_source(
+            INPUT_KEYS[inputs[0]], str(spec[inputs[0]]), spec.get("loop", True)
+        )
+
+        variants = (
+            _parse_manifest_variants(spec["variants"])
+            if "variants" in spec
+            else get_default_variants()
+        )
+        variants, input_source = apply_profile(
+            spec.get("profile", profile), variants, input_source
+        )
+        if not spec.get("original", False):
+            try:
+                check_rtmp_codecs(variants)
+            except ValueError as e:
+                raise ValueError(f"Stream '{stream_key}': {e}")
+        entries.append(
+            ManifestEntry(
+                stream_key=stream_key,
+                input_source=input_source,
+                variants=variants,
+                original=spec.get("original", False),
+                audio=spec.get("audio", True),
+            )
+        )
+    return entries
+
+
+class BatchPublisher:
+    """Start many streams at once.
+
+    Inputs are probed concurrently by at most ``concurrency`` threads, all
+    commands are built up front, then processes are started ``stagger``
+    seconds apart so nginx-rtmp doesn't get every publish handshake at the
+    same moment. Startup is tracked until each stream's outputs show up
+    as live in ``lister``.
+
+    With ``fanout`` enabled, streams reading the same input are published
+    by one ffmpeg process (see ``FFmpegBackend.build_fanout_command``).
+    """
+
+    def __init__(
+        self,
+        backend: FFmpegBackend,
+        output_base_url: str,
+        client: Optional[DaemonClient] = None,
+        concurrency: int = 8,
+        stagger: float = 0.2,
+        fanout: bool = True,
+    ):
+        self.backend = backend
+        self.output_base_url = output_base_url
+        self.client = client
+        self.concurrency = concurrency
+        self.stagger = stagger
+        self.fanout = fanout
+
+    def group_entries(self, entries: List[ManifestEntry]) -> List[List[ManifestEntry]]:
+        """Group entries that can share one ffmpeg process."""
+        if not self.fanout:
+            return [[entry] for entry in entries]
+
+        groups: Dict[Tuple, List[ManifestEntry]] = {}
+        for entry in entries:
+            groups.setdefault(astuple(entry.input_source), []).append(entry)
+        return list(groups.values())
+
+    def prepare(self, entries: List[ManifestEntry]) -> List[BatchStream]:
+        """Probe inputs in parallel and build every command."""
+
+        def build(group: List[ManifestEntry]) -> List[BatchStream]:
+            streams = [BatchStream(entry=entry) for entry in group]
+            input_source = group[0].input_source
+            started = time.monotonic()
+            try:
+                media_info = None
+                if not all(entry.original for entry in group):
+                    media_info = self.backend.prober.probe(input_source)
+                probe_time = time.monotonic() - started
+
+                if len(group) == 1:
+                    entry = group[0]
+                    process_key = entry.stream_key
+                    command = self.backend.build_command(
+                        stream_key=entry.stream_key,
+                        input_source=input_source,
+                        variants=entry.variants,
+                        output_base_url=self.output_base_url,
+                        original_only=entry.original,
+                        audio_enabled=entry.audio,
+                        media_info=media_info,
+                    )
+                    if not entry.original:
+                        streams[0].spec = StreamSpec(
+                            stream_key=entry.stream_key,
+                            input_source=input_source,
+                            variants=entry.variants,
+                            output_base_url=self.output_base_url,
+                            audio_enabled=entry.audio,
+                            media_info=media_info,
+                            ladder=self.backend.ladder,
+                            cpu_budget=self.backend.cpu_budget,
+                            passthrough=self.backend.passthrough,
+                            loglevel=self.backend.loglevel,
+                            record_dir=(
+                                str(self.backend.record_dir)
+                                if self.backend.record_dir
+                                else None
+                            ),
+                            segment_seconds=self.backend.segment_seconds,
+                        )
+                else:
+                    process_key = get_group_key([e.stream_key for e in group])
+                    command = self.backend.build_fanout_command(
+                        input_source,
+                        [
+                            PublishTarget(
+                                stream_key=e.stream_key,
+                                variants=e.variants,
+                                output_base_url=self.output_base_url,
+                                original_only=e.original,
+                                audio_enabled=e.audio,
+                            )
+                            for e in group
+                        ],
+                        media_info=media_info,
+                    )
+
+                for stream in streams:
+                    stream.media_info = media_info
+                    stream.probe_time = probe_time
+                    stream.command = command
+                    stream.process_key = process_key
+                    if not stream.entry.original:
+                        selected = self.backend.select_variants(
+                            stream.entry.variants, media_info
+                        )
+                        stream.expected_variants = [v.label for v in selected]
+            except Exception as e:
+                for stream in streams:
+                    stream.error = f"build failed: {e}"
+            return streams
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = executor.map(build, self.group_entries(entries))
+            by_key = {s.entry.stream_key: s for group in results for s in group}
+        # сохраняем порядок манифеста
+        return [by_key[entry.stream_key] for entry in entries]
+
+    def launch(
+        self,
+        streams: List[BatchStream],
+        on_launch: Optional[Callable[[BatchStream], None]] = None,
+    ) -> None:
+        """Start prepared processes one by one, ``stagger`` seconds apart."""
+        processes: Dict[str, List[BatchStream]] = {}
+        for stream in streams:
+            if not stream.error:
+                processes.setdefault(stream.process_key, []).append(stream)
+
+        first = True
+        for key, members in processes.items():
+            if not first and self.stagger > 0:
+                time.sleep(self.stagger)
+            first = False
+
+            command = members[0].command
+            launched_at, error = None, None
+            try:
+                if self.client is not None:
+                    spec = members[0].spec
+                    self.client.request(
+                        "publish",
+                        stream_key=key,
+                        command=command,
+                        spec=spec.to_dict() if spec else None,
+                    )
+                else:
+                    start_ffmpeg_process(command, key)
+                launched_at = time.monotonic()
+            except Exception as e:
+                error = f"launch failed: {e}"
+
+            for stream in members:
+                stream.launched_at, stream.error = launched_at, error
+                if on_launch:
+                    on_launch(stream)
+
+    def wait_live(
+        self,
+        streams: List[BatchStream],
+        lister: StreamLister,
+        timeout: float = 30.0,
+        interval: float = 0.5,
+    ) -> bool:
+        """Poll ``lister`` until all launched streams are live.
+
+        A stream counts as live once all its expected variants (or, for
+        original-only streams, the stream itself) are published.
+        """
+        pending = [s for s in streams if s.launched_at is not None]
+        deadline = time.monotonic() + timeout
+        while pending and time.monotonic() < deadline:
+            try:
+                active = lister.get_active_streams()
+            except Exception:
+                active = {}
+            now = time.monotonic()
+            for stream in list(pending):
+                info = active.get(stream.entry.stream_key)
+                if info is None or not info.get("live", True):
+                    continue
+                if set(stream.expected_variants) <= info["variants"]:
+                    stream.live_at = now
+                    pending.remove(stream)
+            if pending:
+                time.sleep(interval)
+        return not pending
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from enum import Enum
+from typing import List
 
 
 class InputType(Enum):
@@ -9,6 +10,7 @@ class InputType(Enum):
     RTSP = "rtsp"
     UDP = "udp"
     HTTP = "http"
+    LAVFI = "lavfi"
 
 
 @dataclass
@@ -24,6 +26,11 @@ class StreamVariant:
     audio_bitrate: str = "128k"
     preset: str = "fast"
     crf: int = 23
+    # Пустые/отрицательные значения -- настройки энкодера по умолчанию
+    tune: str = ""
+    bframes: int = -1
+    keyframe_interval: float = 0.0
+    bufsize_factor: float = 2.0
 
     @property
     def bitrate_numeric(self) -> int:
@@ -33,7 +40,31 @@ class StreamVariant:
     @property
     def buffer_size(self) -> str:
         """Calculate buffer size based on bitrate."""
-        return f"{self.bitrate_numeric * 2}k"
+        return f"{int(self.bitrate_numeric * self.bufsize_factor)}k"
+
+
+@dataclass
+class MediaInfo:
+    """Probed properties of an input source (bitrates in kbit/s)."""
+
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    video_codec: str = ""
+    video_bitrate: int = 0
+    audio_codec: str = ""
+    audio_bitrate: int = 0
+    duration: float = 0.0
+    # время первого кадра; -ss на входе отсчитывается от него
+    start_time: float = 0.0
+
+    @property
+    def has_video(self) -> bool:
+        return bool(self.video_codec)
+
+    @property
+    def has_audio(self) -> bool:
+        return bool(self.audio_codec)
 
 
 @dataclass
@@ -43,18 +74,45 @@ class InputSource:
     type: InputType
     path: str
     loop: bool = True
+    realtime: bool = True
+    low_latency: bool = False
+    # Фрагмент файла: начало и длительность в секундах (0 -- весь файл)
+    start: float = 0.0
+    duration: float = 0.0
 
-    def to_ffmpeg_input(self) -> str:
-        """Convert to FFmpeg input specification."""
+    def to_ffmpeg_input(self) -> List[str]:
+        """Convert to FFmpeg input arguments."""
+        realtime_flag = ["-re"] if self.realtime else []
+        # Для живых источников не буферизуем вход в демуксере
+        live_flags = ["-fflags", "nobuffer", "-flags", "low_delay"]
+        if not self.low_latency:
+            live_flags = []
         if self.type == InputType.FILE:
-            loop_flag = "-stream_loop -1" if self.loop else ""
-            return f"-re {loop_flag} -i {self.path}"
+            loop_flag = ["-stream_loop", "-1"] if self.loop else []
+            # -ss до -i: быстрый поиск по индексу, дальше точное декодирование
+            clip = ["-ss", str(round(self.start, 6))] if self.start else []
+            if self.duration:
+                clip += ["-t", str(round(self.duration, 6))]
+            return realtime_flag + loop_flag + clip + ["-i", self.path]
         elif self.type == InputType.DEVICE:
             device_path = f"/dev/video{self.path}" if self.path.isdigit() else self.path
-            return f"-f v4l2 -i {device_path}"
+            return live_flags + ["-f", "v4l2", "-i", device_path]
         elif self.type in [InputType.RTMP, InputType.RTSP, InputType.HTTP]:
-            return f"-i {self.path}"
+            return live_flags + ["-i", self.path]
         elif self.type == InputType.UDP:
-            return f"-f mpegts -i udp://{self.path}"
+            return live_flags + ["-f", "mpegts", "-i", f"udp://{self.path}"]
+        elif self.type == InputType.LAVFI:
+            return realtime_flag + ["-f", "lavfi", "-i", self.path]
         else:
             raise ValueError(f"Unsupported input type: {self.type}")
+
+
+@dataclass
+class PublishTarget:
+    """A stream key to publish, possibly sharing its input with others."""
+
+    stream_key: str
+    variants: List[StreamVariant]
+    output_base_url: str
+    original_only: bool = False
+    audio_enabled: bool = True
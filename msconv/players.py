@@ -6,25 +6,47 @@ from abc import ABC, abstractmethod
 class StreamPlayer(ABC):
     """Abstract base class for stream players."""
 
+    def __init__(self, low_latency: bool = False):
+        self.low_latency = low_latency
+
     @abstractmethod
-    def play_stream(self, stream_url: str) -> None:
-        """Play a stream at the given URL."""
+    def play_stream(self, stream_url: str, start: float = 0.0) -> None:
+        """Play a stream at the given URL, from ``start`` seconds in."""
         pass
 
 
 class VLCPlayer(StreamPlayer):
     """VLC-based stream player."""
 
-    def play_stream(self, stream_url: str) -> None:
+    def play_stream(self, stream_url: str, start: float = 0.0) -> None:
         """Play stream using VLC."""
         click.echo(f"Playing {stream_url} with VLC...")
-        os.execvp("vlc", ["vlc", stream_url])
+        args = ["vlc"]
+        if self.low_latency:
+            # по умолчанию VLC буферизует сетевой поток на 1 секунду
+            args += ["--network-caching=150", "--clock-jitter=0"]
+        if start:
+            args.append(f"--start-time={start:.1f}")
+        os.execvp("vlc", args + [stream_url])
 
 
 class FFplayPlayer(StreamPlayer):
     """FFplay-based stream player."""
 
-    def play_stream(self, stream_url: str) -> None:
+    def play_stream(self, stream_url: str, start: float = 0.0) -> None:
         """Play stream using FFplay."""
         click.echo(f"Playing {stream_url} with FFplay...")
-        os.execvp("ffplay", ["ffplay", stream_url])
+        args = ["ffplay"]
+        if self.low_latency:
+            args += [
+                "-fflags",
+                "nobuffer",
+                "-flags",
+                "low_delay",
+                "-framedrop",
+                "-sync",
+                "ext",
+            ]
+        if start:
+            args += ["-ss", f"{start:.1f}"]
+        os.execvp("ffplay", args + [stream_url])
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from .models import InputSource, InputType, MediaInfo
+
+PROBE_TIMEOUT = 5
+# Сетевые источники и устройства могут поменяться, поэтому кэшируем их ненадолго
+NETWORK_CACHE_TTL = 300.0
+
+
+def _parse_rate(rate: str) -> float:
+    """Parse ffprobe frame rate ('30000/1001') into fps."""
+    try:
+        num, _, den = rate.partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _kbps(value: Any) -> int:
+    try:
+        return int(value) // 1000
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_ffprobe_output(data: Dict[str, Any]) -> MediaInfo:
+    """Convert ffprobe JSON (-show_format -show_streams) into MediaInfo."""
+    info = MediaInfo()
+    fmt = data.get("format", {})
+
+    for stream in data.get("streams", []):
+        codec_type = stream.get("codec_type")
+        if codec_type == "video" and not info.has_video:
+            info.video_codec = stream.get("codec_name", "")
+            info.width = int(stream.get("width", 0))
+            info.height = int(stream.get("height", 0))
+            info.fps = _parse_rate(stream.get("avg_frame_rate", "0/0")) or _parse_rate(
+                stream.get("r_frame_rate", "0/0")
+            )
+            info.video_bitrate = _kbps(stream.get("bit_rate"))
+        elif codec_type == "audio" and not info.has_audio:
+            info.audio_codec = stream.get("codec_name", "")
+            info.audio_bitrate = _kbps(stream.get("bit_rate"))
+
+    # Многие контейнеры (mkv, live) не сообщают битрейт видео отдельно
+    if info.has_video and not info.video_bitrate:
+        total = _kbps(fmt.get("bit_rate"))
+        if total:
+            info.video_bitrate = max(total - info.audio_bitrate, 0)
+
+    try:
+        info.duration = float(fmt.get("duration", 0.0))
+    except (TypeError, ValueError):
+        info.duration = 0.0
+    try:
+        info.start_time = float(fmt.get("start_time", 0.0))
+    except (TypeError, ValueError):
+        info.start_time = 0.0
+
+    return info
+
+
+class InputProber:
+    """Probe inputs with a single JSON ffprobe call and cache results on disk.
+
+    Local files are keyed by path, mtime and size, so a cached result stays
+    valid until the file changes; everything else expires after ``ttl``.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        ttl: float = NETWORK_CACHE_TTL,
+        timeout: float = PROBE_TIMEOUT,
+    ):
+        self.cache_dir = cache_dir or Path("cache/probe")
+        self.ttl = ttl
+        self.timeout = timeout
+
+    def probe(self, input_source: InputSource) -> Optional[MediaInfo]:
+        """Get media info for an input, or None if it can't be probed."""
+        cache_key, ttl = self._cache_key(input_source)
+        cached = self._load_cached(cache_key, ttl)
+        if cached is not None:
+            return cached
+
+        try:
+            result = subprocess.run(
+                self._build_command(input_source),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=self.timeout,
+            )
+            if result.returncode != 0:
+                return None
+            info = parse_ffprobe_output(json.loads(result.stdout))
+        except Exception:
+            return None
+
+        self._store(cache_key, info)
+        return info
+
+    def _build_command(self, input_source: InputSource) -> List[str]:
+        """Build ffprobe argv for an input source."""
+        cmd = [
+            "ffprobe",
+            "-v",
+            "error",
+            "-print_format",
+            "json",
+            "-show_format",
+            "-show_streams",
+        ]
+        if input_source.type == InputType.DEVICE:
+            path = input_source.path
+            device_path = f"/dev/video{path}" if path.isdigit() else path
+            return cmd + ["-f", "v4l2", device_path]
+        elif input_source.type == InputType.UDP:
+            return cmd + ["-f", "mpegts", f"udp://{input_source.path}"]
+        elif input_source.type == InputType.LAVFI:
+            return cmd + ["-f", "lavfi", input_source.path]
+        return cmd + [input_source.path]
+
+    def _cache_key(self, input_source: InputSource) -> Tuple[str, Optional[float]]:
+        """Get cache key and TTL (None means valid until the file changes)."""
+        if input_source.type == InputType.FILE:
+            try:
+                stat = os.stat(input_source.path)
+                raw = f"file:{input_source.path}:{stat.st_mtime_ns}:{stat.st_size}"
+                return hashlib.sha1(raw.encode()).hexdigest(), None
+            except OSError:
+                pass
+        raw = f"{input_source.type.value}:{input_source.path}"
+        return hashlib.sha1(raw.encode()).hexdigest(), self.ttl
+
+    def _load_cached(self, cache_key: str, ttl: Optional[float]) -> Optional[MediaInfo]:
+        cache_file = self.cache_dir / f"{cache_key}.json"
+        try:
+            entry = json.loads(cache_file.read_text())
+        except (OSError, ValueError):
+            return None
+
+        if ttl is not None and time.time() - entry.get("probed_at", 0) > ttl:
+            return None
+        try:
+            return MediaInfo(**entry["info"])
+        except (KeyError, TypeError):
+            return None
+
+    def _store(self, cache_key: str, info: MediaInfo) -> None:
+        tmp = None
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # у каждого писателя свой временный файл: параллельные probe одного
+            # входа (batch publish) не перетирают друг друга
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"probed_at": time.time(), "info": asdict(info)}, f)
+            os.replace(tmp, self.cache_dir / f"{cache_key}.json")
+        except OSError:
+            if tmp is not None:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
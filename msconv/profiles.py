@@ -0,0 +1,40 @@
+from dataclasses import replace
+from typing import List, Tuple
+from .models import InputSource, StreamVariant
+
+PROFILE_DEFAULT = "default"
+PROFILE_LOW_LATENCY = "lowlatency"
+PROFILES = [PROFILE_DEFAULT, PROFILE_LOW_LATENCY]
+
+# Новый зритель ждет ключевой кадр не дольше секунды
+LOW_LATENCY_KEYFRAME_INTERVAL = 1.0
+# Буфер VBV в полсекунды битрейта вместо двух
+LOW_LATENCY_BUFSIZE_FACTOR = 0.5
+
+
+def apply_profile(
+    profile: str, variants: List[StreamVariant], input_source: InputSource
+) -> Tuple[List[StreamVariant], InputSource]:
+    """Adjust variants and input for a publish profile.
+
+    ``lowlatency`` trades compression efficiency for glass-to-glass delay:
+    ``-tune zerolatency`` (no lookahead, no frame threading delay), no
+    B-frames, a one second GOP, a small VBV buffer and no demuxer
+    buffering on live inputs.
+    """
+    if profile == PROFILE_DEFAULT:
+        return variants, input_source
+    if profile != PROFILE_LOW_LATENCY:
+        raise ValueError(f"Unknown profile: {profile}")
+
+    variants = [
+        replace(
+            v,
+            tune="zerolatency",
+            bframes=0,
+            keyframe_interval=LOW_LATENCY_KEYFRAME_INTERVAL,
+            bufsize_factor=LOW_LATENCY_BUFSIZE_FACTOR,
+        )
+        for v in variants
+    ]
+    return variants, replace(input_source, low_latency=True)
@@ -0,0 +1,361 @@
+import bisect
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Длительность одного сегмента записи, секунд (режется по ключевым кадрам)
+SEGMENT_SECONDS = 6.0
+# Ограничения хранения по умолчанию: сутки и 20 ГБ на все записи
+RECORD_MAX_AGE = 24 * 3600.0
+RECORD_MAX_BYTES = 20 * 1024**3
+# Сколько последних сегментов ffmpeg держит в segments.m3u8
+SEGMENT_LIST_SIZE = 1000
+
+INDEX_NAME = "index.bin"
+SEGMENT_LIST_NAME = "segments.m3u8"
+_LOCK_NAME = ".lock"
+# начало (unix time), длительность, размер, смещение от начала записи, номер
+_ENTRY = struct.Struct("<dfIQI")
+
+
+def get_record_dir() -> Path:
+    """Get the directory holding recordings, one subdirectory per variant."""
+    return Path(os.environ.get("MSCONV_RECORD_DIR", "recordings")).absolute()
+
+
+def segment_slave(directory: Path, segment_seconds: float, select: str = "") -> str:
+    """Build a ``tee`` slave recording into fixed-duration MPEG-TS segments.
+
+    Segments are named ``<start>_<sequence>.ts``: the wall-clock start
+    (``%s`` of strftime) and a sequence number, so segments starting within
+    the same second don't overwrite each other. The sequence starts at the
+    unix time ffmpeg started, so it keeps growing across restarts. ffmpeg
+    lists the segments with exact durations in ``segments.m3u8``;
+    ``onfail=ignore`` keeps a full disk from taking the live outputs down.
+    """
+    # hls не создает каталоги сам
+    directory.mkdir(parents=True, exist_ok=True)
+    # у segment нельзя сочетать strftime с номером сегмента, у hls можно:
+    # strftime превращает %%d в %d, и туда подставляется номер
+    options = [
+        "f=hls",
+        f"hls_time={segment_seconds:g}",
+        f"hls_list_size={SEGMENT_LIST_SIZE}",
+        "hls_segment_type=mpegts",
+        "hls_start_number_source=epoch",
+        "strftime=1",
+        "hls_flags=second_level_segment_index",
+        f"hls_segment_filename={directory / '%s_%%d.ts'}",
+        "onfail=ignore",
+    ]
+    if select:
+        options.append(f"select={select}")
+    return f"[{':'.join(options)}]{directory / SEGMENT_LIST_NAME}"
+
+
+@dataclass
+class Segment:
+    """One recorded segment; ``offset`` is its byte position in the recording."""
+
+    start: float
+    duration: float
+    size: int
+    offset: int
+    sequence: int
+    path: Path
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+
+class _Starts:
+    # последовательность времен начала поверх mmap для bisect
+    def __init__(self, data: mmap.mmap):
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data) // _ENTRY.size
+
+    def __getitem__(self, i: int) -> float:
+        return _ENTRY.unpack_from(self.data, i * _ENTRY.size)[0]
+
+
+class RecordingIndex:
+    """Time index of one recorded variant.
+
+    ``index.bin`` is an array of fixed-size records (start time, duration,
+    size, byte offset) ordered by start time, so a lookup maps the file and
+    binary searches it without parsing. ``sync`` appends segments ffmpeg
+    has finished; ``evict`` drops the oldest ones and rewrites the index
+    atomically, so readers never see a torn file.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.path = directory / INDEX_NAME
+
+    def __len__(self) -> int:
+        try:
+            return self.path.stat().st_size // _ENTRY.size
+        except OSError:
+            return 0
+
+    def sync(self) -> int:
+        """Index segments completed since the last sync; returns how many."""
+        with self._lock():
+            segments = self.segments()
+            last_sequence = segments[-1].sequence if segments else -1
+            offset = segments[-1].offset + segments[-1].size if segments else 0
+
+            durations = self._listed_durations()
+            files = []
+            for path in self.directory.glob("*.ts"):
+                start, _, sequence = path.stem.partition("_")
+                if start.isdigit() and sequence.isdigit():
+                    files.append((int(sequence), int(start), path))
+            # номера растут и между перезапусками ffmpeg, порядок тот же, что
+            # по времени начала
+            files.sort()
+            added = []
+            for i, (sequence, start, path) in enumerate(files):
+                if sequence <= last_sequence:
+                    continue
+                duration = durations.get(path.name)
+                if duration is None:
+                    if i + 1 == len(files):
+                        # ffmpeg еще пишет последний сегмент
+                        break
+                    # сегмента нет в segments.m3u8: sync не вызывали дольше
+                    # SEGMENT_LIST_SIZE сегментов, или ffmpeg перезапустился и
+                    # начал список заново. Длительность берем по началу
+                    # следующего, но после перезапуска до него может быть
+                    # пауза, поэтому ограничиваем
+                    duration = min(
+                        files[i + 1][1] - start,
+                        max(durations.values(), default=SEGMENT_SECONDS),
+                    )
+                size = path.stat().st_size
+                added.append(_ENTRY.pack(start, duration, size, offset, sequence))
+                offset += size
+            if added:
+                with open(self.path, "ab") as f:
+                    f.write(b"".join(added))
+            return len(added)
+
+    def segments(self, since: Optional[float] = None) -> List[Segment]:
+        """Get indexed segments, optionally only those starting at ``since`` or later."""
+        with self._map() as data:
+            if data is None:
+                return []
+            first = 0 if since is None else bisect.bisect_left(_Starts(data), since)
+            return [self._segment(data, i) for i in range(first, len(_Starts(data)))]
+
+    def find(self, at: float) -> Optional[Segment]:
+        """Get the segment playing at unix time ``at``.
+
+        A time in a gap (while ffmpeg was restarting) gives the next
+        segment; a time before or after the recording gives None.
+        """
+        with self._map() as data:
+            if data is None:
+                return None
+            starts = _Starts(data)
+            i = bisect.bisect_right(starts, at) - 1
+            if i < 0:
+                return None
+            segment = self._segment(data, i)
+            if at < segment.end:
+                return segment
+            if i + 1 < len(starts):
+                return self._segment(data, i + 1)
+            return None
+
+    def evict(self, count: int) -> int:
+        """Delete the ``count`` oldest segments; returns the bytes freed."""
+        with self._lock():
+            segments = self.segments()
+            dropped, kept = segments[:count], segments[count:]
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(
+                    b"".join(
+                        _ENTRY.pack(s.start, s.duration, s.size, s.offset, s.sequence)
+                        for s in kept
+                    )
+                )
+            # Сначала индекс, потом файлы: читатель не найдет удаленный сегмент
+            os.replace(tmp, self.path)
+            for segment in dropped:
+                segment.path.unlink(missing_ok=True)
+            return sum(s.size for s in dropped)
+
+    def write_playlist(self, start: Segment, path: Path) -> Path:
+        """Write an HLS playlist from ``start`` to the last indexed segment."""
+        segments = self.segments(since=start.start)
+        target = max((s.duration for s in segments), default=SEGMENT_SECONDS)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:VOD",
+            f"#EXT-X-TARGETDURATION:{int(target + 0.999)}",
+        ]
+        previous = None
+        for segment in segments:
+            # начала сегментов округлены до секунды
+            if previous is not None and segment.start - previous.end > 2.0:
+                # ffmpeg перезапускался, метки времени начинаются заново
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines += [f"#EXTINF:{segment.duration:.3f},", str(segment.path)]
+            previous = segment
+        lines.append("#EXT-X-ENDLIST")
+        path.write_text("\n".join(lines) + "\n")
+        return path
+
+    def _segment(self, data: mmap.mmap, i: int) -> Segment:
+        start, duration, size, offset, sequence = _ENTRY.unpack_from(
+            data, i * _ENTRY.size
+        )
+        path = self.directory / f"{int(start)}_{sequence}.ts"
+        return Segment(start, duration, size, offset, sequence, path)
+
+    def _listed_durations(self) -> Dict[str, float]:
+        # segments.m3u8: строка #EXTINF:<длительность>, затем имя файла
+        durations = {}
+        duration = None
+        try:
+            with open(self.directory / SEGMENT_LIST_NAME) as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith("#EXTINF:"):
+                        duration = float(line[len("#EXTINF:") :].split(",")[0])
+                    elif line and not line.startswith("#") and duration is not None:
+                        durations[Path(line).name] = duration
+                        duration = None
+        except (OSError, ValueError):
+            pass
+        return durations
+
+    def _lock(self) -> "_FileLock":
+        return _FileLock(self.directory / _LOCK_NAME)
+
+    def _map(self) -> "_IndexMap":
+        return _IndexMap(self.path)
+
+
+class _FileLock:
+    # индекс могут обновлять одновременно демон и CLI
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __enter__(self) -> None:
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        os.close(self.fd)
+
+
+class _IndexMap:
+    def __init__(self, path: Path):
+        self.path = path
+        self.data: Optional[mmap.mmap] = None
+
+    def __enter__(self) -> Optional[mmap.mmap]:
+        try:
+            with open(self.path, "rb") as f:
+                # хвост мог быть дописан не целиком, берем только полные записи
+                length = os.fstat(f.fileno()).st_size // _ENTRY.size * _ENTRY.size
+                if length:
+                    self.data = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ)
+        except OSError:
+            return None
+        return self.data
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.data is not None:
+            self.data.close()
+
+
+def list_recordings(root: Optional[Path] = None) -> Dict[str, RecordingIndex]:
+    """Get the index of every recorded variant, keyed by ``<stream>_<variant>``."""
+    root = root or get_record_dir()
+    if not root.is_dir():
+        return {}
+    return {d.name: RecordingIndex(d) for d in sorted(root.iterdir()) if d.is_dir()}
+
+
+def prune_recordings(
+    max_age: Optional[float] = RECORD_MAX_AGE,
+    max_bytes: Optional[int] = RECORD_MAX_BYTES,
+    root: Optional[Path] = None,
+    now: Optional[float] = None,
+) -> Tuple[int, int]:
+    """Evict the oldest segments of all recordings past the age or size limit.
+
+    The size limit applies to all recordings together, so the oldest
+    footage goes first regardless of which stream it belongs to. Returns
+    the number of segments and bytes removed.
+    """
+    now = time.time() if now is None else now
+    indexes = list(list_recordings(root).values())
+    for index in indexes:
+        index.sync()
+
+    by_index = {id(index): index.segments() for index in indexes}
+    ordered = sorted(
+        ((segment, index) for index in indexes for segment in by_index[id(index)]),
+        key=lambda item: item[0].start,
+    )
+    total = sum(segment.size for segment, _ in ordered)
+
+    evict: Dict[int, int] = {}
+    for segment, index in ordered:
+        expired = max_age is not None and segment.end < now - max_age
+        oversized = max_bytes is not None and total > max_bytes
+        if not (expired or oversized):
+            break
+        evict[id(index)] = evict.get(id(index), 0) + 1
+        total -= segment.size
+
+    removed = freed = 0
+    for index in indexes:
+        count = evict.get(id(index), 0)
+        if count:
+            freed += index.evict(count)
+            removed += count
+    return removed, freed
+
+
+def parse_time(value: str, now: Optional[datetime] = None) -> float:
+    """Parse a replay time into unix time.
+
+    Accepts an offset into the past ('-90s', '-5m', '-2h'), a time of day
+    ('14:30', '14:30:15', today), an ISO datetime or a unix timestamp.
+    """
+    now = now or datetime.now()
+    value = value.strip()
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value.startswith("-") and value[-1] in units:
+        return (
+            now - timedelta(seconds=float(value[1:-1]) * units[value[-1]])
+        ).timestamp()
+    if value.replace(".", "", 1).isdigit() and len(value) >= 9:
+        return float(value)
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            moment = datetime.strptime(value, fmt).time()
+        except ValueError:
+            continue
+        return datetime.combine(now.date(), moment).timestamp()
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}'")
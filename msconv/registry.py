@@ -0,0 +1,296 @@
+import json
+import os
+import select
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import sqlite3
+
+# Сколько ждать блокировку базы, если в нее пишет другой процесс msconv
+REGISTRY_LOCK_TIMEOUT = 10.0
+# Интервал опроса /proc, если pidfd недоступен (ядро старше 5.3)
+WAIT_POLL_INTERVAL = 0.2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processes (
+    process_key TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    start_ticks INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    command TEXT NOT NULL,
+    owner TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    stream_key TEXT PRIMARY KEY,
+    process_key TEXT NOT NULL
+);
+"""
+
+
+def get_state_dir() -> Path:
+    """Get the directory holding the process registry and daemon socket."""
+    state_dir = Path(os.environ.get("MSCONV_STATE_DIR", "pids"))
+    state_dir.mkdir(parents=True, exist_ok=True)
+    return state_dir
+
+
+def process_start_ticks(pid: int) -> Optional[int]:
+    """Get a running process's start time (clock ticks since boot).
+
+    Together with the PID this fingerprints a process: a reused PID has a
+    different start time. Zombies and missing processes give None.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # comm может содержать пробелы и скобки, поля идут после последней ')'
+    fields = stat[stat.rfind(b")") + 2 :].split()
+    if len(fields) < 20 or fields[0] in (b"Z", b"X"):
+        return None
+    return int(fields[19])
+
+
+@dataclass
+class ProcessRecord:
+    """A registered ffmpeg process and the stream keys it publishes."""
+
+    process_key: str
+    pid: int
+    start_ticks: int
+    started_at: float
+    command: List[str] = field(default_factory=list)
+    # "local" для publish без демона, "daemon" для супервизора
+    owner: str = "local"
+
+    @property
+    def alive(self) -> bool:
+        return process_start_ticks(self.pid) == self.start_ticks
+
+    @property
+    def uptime(self) -> float:
+        return time.time() - self.started_at
+
+
+class ProcessRegistry:
+    """SQLite registry of running ffmpeg processes.
+
+    Replaces per-stream PID files: every process is stored with its start
+    time fingerprint, so liveness is checked against ``/proc`` rather than
+    trusted, and entries of processes that died without cleaning up are
+    reaped on read. SQLite's locking makes concurrent CLI invocations and
+    the daemon safe to share one file.
+
+    Each instance holds its own connection; ``close`` it, or use the
+    registry as a context manager.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        # sqlite3 грузится только при обращении к реестру, не при запуске CLI
+        import sqlite3
+
+        self.path = path or get_state_dir() / "registry.db"
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=REGISTRY_LOCK_TIMEOUT, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self) -> "ProcessRegistry":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+    def register(
+        self,
+        process_key: str,
+        members: List[str],
+        pid: int,
+        command: List[str],
+        owner: str = "local",
+    ) -> ProcessRecord:
+        """Record a started process publishing ``members``."""
+        record = ProcessRecord(
+            process_key=process_key,
+            pid=pid,
+            start_ticks=process_start_ticks(pid) or 0,
+            started_at=time.time(),
+            command=command,
+            owner=owner,
+        )
+        with self._transaction():
+            self._delete(process_key)
+            self._conn.execute(
+                "INSERT INTO processes VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    record.process_key,
+                    record.pid,
+                    record.start_ticks,
+                    record.started_at,
+                    json.dumps(record.command),
+                    record.owner,
+                ),
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO members VALUES (?, ?)",
+                [(member, process_key) for member in members],
+            )
+        return record
+
+    def unregister(self, process_key: str, pid: Optional[int] = None) -> None:
+        """Forget a process; with ``pid``, only if it is still that process."""
+        with self._transaction():
+            self._delete(process_key, pid)
+
+    def get(self, process_key: str) -> Optional[ProcessRecord]:
+        """Get a live process by its own key."""
+        row = self._conn.execute(
+            "SELECT * FROM processes WHERE process_key = ?", (process_key,)
+        ).fetchone()
+        return self._live(row)
+
+    def find(self, stream_key: str) -> Optional[ProcessRecord]:
+        """Get the live process publishing ``stream_key``, alone or shared."""
+        row = self._conn.execute(
+            "SELECT p.* FROM members m JOIN processes p USING (process_key) "
+            "WHERE m.stream_key = ?",
+            (stream_key,),
+        ).fetchone()
+        return self._live(row)
+
+    def list(self) -> Dict[str, ProcessRecord]:
+        """Get all live processes by key, reaping dead ones."""
+        records = {}
+        stale = []
+        for row in self._conn.execute("SELECT * FROM processes ORDER BY process_key"):
+            record = self._record(row)
+            if record.alive:
+                records[record.process_key] = record
+            else:
+                stale.append(record)
+        if stale:
+            with self._transaction():
+                for record in stale:
+                    self._delete(record.process_key, record.pid)
+        return records
+
+    def _live(self, row: Optional[tuple]) -> Optional[ProcessRecord]:
+        if row is None:
+            return None
+        record = self._record(row)
+        if record.alive:
+            return record
+        self.unregister(record.process_key, record.pid)
+        return None
+
+    def _record(self, row: tuple) -> ProcessRecord:
+        process_key, pid, start_ticks, started_at, command, owner = row
+        return ProcessRecord(
+            process_key, pid, start_ticks, started_at, json.loads(command), owner
+        )
+
+    def _delete(self, process_key: str, pid: Optional[int] = None) -> None:
+        if pid is not None:
+            # Запись могла уже смениться новым процессом с тем же ключом
+            row = self._conn.execute(
+                "SELECT pid FROM processes WHERE process_key = ?", (process_key,)
+            ).fetchone()
+            if row is None or row[0] != pid:
+                return
+        self._conn.execute(
+            "DELETE FROM processes WHERE process_key = ?", (process_key,)
+        )
+        self._conn.execute("DELETE FROM members WHERE process_key = ?", (process_key,))
+
+    def _transaction(self) -> "_Transaction":
+        return _Transaction(self._conn)
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE берет блокировку на запись сразу, а не при первом UPDATE
+    def __init__(self, conn: "sqlite3.Connection"):
+        self.conn = conn
+
+    def __enter__(self) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def wait_for_exit(record: ProcessRecord, timeout: Optional[float] = None) -> bool:
+    """Block until a registered process exits; False on timeout."""
+    return record.process_key in wait_for_exits([record], timeout)
+
+
+def wait_for_exits(
+    records: List[ProcessRecord], timeout: Optional[float] = None
+) -> Dict[str, float]:
+    """Wait for several processes at once.
+
+    Returns the seconds it took each process to exit, keyed by process
+    key; processes still running at the deadline are missing. Uses one
+    poll over pidfds where available, so waiting doesn't poll ``/proc``
+    and works for processes that aren't our children.
+    """
+    started = time.monotonic()
+    deadline = None if timeout is None else started + timeout
+    exited: Dict[str, float] = {}
+    pidfds: Dict[int, ProcessRecord] = {}
+    polled: List[ProcessRecord] = []
+    poller = select.poll()
+
+    for record in records:
+        if not record.alive:
+            exited[record.process_key] = 0.0
+            continue
+        try:
+            pidfd = os.pidfd_open(record.pid)
+        except (AttributeError, OSError):
+            polled.append(record)
+            continue
+        # PID мог быть переиспользован до pidfd_open, сверяем отпечаток после
+        if not record.alive:
+            os.close(pidfd)
+            exited[record.process_key] = 0.0
+            continue
+        pidfds[pidfd] = record
+        poller.register(pidfd, select.POLLIN)
+
+    try:
+        while pidfds or polled:
+            wait = None
+            if deadline is not None:
+                wait = max(0.0, deadline - time.monotonic())
+            if polled:
+                wait = (
+                    WAIT_POLL_INTERVAL
+                    if wait is None
+                    else min(wait, WAIT_POLL_INTERVAL)
+                )
+            events = poller.poll(None if wait is None else wait * 1000)
+
+            elapsed = time.monotonic() - started
+            for pidfd, _ in events:
+                poller.unregister(pidfd)
+                os.close(pidfd)
+                exited[pidfds.pop(pidfd).process_key] = elapsed
+            for record in [r for r in polled if not r.alive]:
+                polled.remove(record)
+                exited[record.process_key] = elapsed
+
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+    finally:
+        for pidfd in pidfds:
+            os.close(pidfd)
+    return exited
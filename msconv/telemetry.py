@@ -0,0 +1,164 @@
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class ProgressSample:
+    """One ``-progress`` report of an ffmpeg process."""
+
+    frame: int = 0
+    fps: float = 0.0
+    bitrate_kbps: float = 0.0
+    total_size: int = 0
+    out_time: float = 0.0
+    dup_frames: int = 0
+    drop_frames: int = 0
+    # None, пока ffmpeg пишет speed=N/A (первые секунды после старта)
+    speed: Optional[float] = None
+    timestamp: float = 0.0
+    ended: bool = False
+
+    @property
+    def realtime(self) -> Optional[bool]:
+        """Whether ffmpeg keeps up with the input; None while speed is unknown."""
+        return None if self.speed is None else self.speed >= 1.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _to_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def _to_speed(value: str) -> Optional[float]:
+    # N/A -- скорость неизвестна, а не нулевая
+    try:
+        return float(value.rstrip("x"))
+    except ValueError:
+        return None
+
+
+def _to_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+class ProgressParser:
+    """Turn ffmpeg ``-progress`` key=value lines into samples.
+
+    ffmpeg emits a block of ``key=value`` lines every ``-stats_period``
+    seconds, terminated by ``progress=continue`` (or ``progress=end``).
+    """
+
+    def __init__(self) -> None:
+        self._current: Dict[str, str] = {}
+
+    def feed(self, line: str) -> Optional[ProgressSample]:
+        """Consume one line; return a sample when a block is complete."""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self._current[key] = value.strip()
+            return None
+
+        fields, self._current = self._current, {}
+        sample = ProgressSample(timestamp=time.time(), ended=value == "end")
+        sample.frame = _to_int(fields.get("frame", "0"))
+        sample.fps = _to_float(fields.get("fps", "0"))
+        sample.bitrate_kbps = _to_float(
+            fields.get("bitrate", "0").replace("kbits/s", "")
+        )
+        sample.total_size = _to_int(fields.get("total_size", "0"))
+        # out_time_ms на самом деле в микросекундах, как и out_time_us
+        out_time_us = fields.get("out_time_us", fields.get("out_time_ms", "0"))
+        sample.out_time = _to_int(out_time_us) / 1_000_000
+        sample.dup_frames = _to_int(fields.get("dup_frames", "0"))
+        sample.drop_frames = _to_int(fields.get("drop_frames", "0"))
+        sample.speed = _to_speed(fields.get("speed", "N/A"))
+        return sample
+
+
+# (имя метрики, тип, описание, поле ProgressSample)
+_METRICS = [
+    ("msconv_stream_fps", "gauge", "Encoding frames per second", "fps"),
+    ("msconv_stream_speed", "gauge", "Encoding speed relative to realtime", "speed"),
+    ("msconv_stream_bitrate_kbps", "gauge", "Output bitrate in kbit/s", "bitrate_kbps"),
+    ("msconv_stream_out_time_seconds", "gauge", "Output timestamp", "out_time"),
+    ("msconv_stream_frames_total", "counter", "Frames encoded", "frame"),
+    ("msconv_stream_dropped_frames_total", "counter", "Frames dropped", "drop_frames"),
+    (
+        "msconv_stream_duplicated_frames_total",
+        "counter",
+        "Frames duplicated",
+        "dup_frames",
+    ),
+]
+
+
+def render_prometheus(
+    samples: Dict[str, Optional[ProgressSample]],
+    restarts: Dict[str, int],
+    degradations: Optional[Dict[str, int]] = None,
+    recoveries: Optional[Dict[str, int]] = None,
+    levels: Optional[Dict[str, int]] = None,
+) -> str:
+    """Render per-stream telemetry in Prometheus text exposition format."""
+    lines: List[str] = []
+
+    def add(name: str, kind: str, help_text: str, values: Dict[str, float]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for stream_key, value in sorted(values.items()):
+            lines.append(f'{name}{{stream="{stream_key}"}} {value:g}')
+
+    add(
+        "msconv_stream_up",
+        "gauge",
+        "Whether ffmpeg is reporting progress",
+        {
+            key: 1 if sample and not sample.ended else 0
+            for key, sample in samples.items()
+        },
+    )
+    add(
+        "msconv_stream_restarts_total",
+        "counter",
+        "ffmpeg restarts by the supervisor",
+        dict(restarts),
+    )
+    if levels is not None:
+        add(
+            "msconv_stream_degrade_level",
+            "gauge",
+            "Ladder degradation steps currently applied",
+            levels,
+        )
+        add(
+            "msconv_stream_degradations_total",
+            "counter",
+            "Adaptive ladder degradations",
+            degradations or {},
+        )
+        add(
+            "msconv_stream_recoveries_total",
+            "counter",
+            "Adaptive ladder recoveries",
+            recoveries or {},
+        )
+    for name, kind, help_text, attr in _METRICS:
+        values = {
+            key: getattr(sample, attr)
+            for key, sample in samples.items()
+            if sample and getattr(sample, attr) is not None
+        }
+        add(name, kind, help_text, values)
+
+    return "\n".join(lines) + "\n"
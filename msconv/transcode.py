@@ -0,0 +1,335 @@
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from .backends import FFmpegBackend
+from .capacity import children_cpu_seconds
+from .codecs import check_rtmp_codecs
+from .models import InputSource, InputType, MediaInfo, StreamVariant
+from .probe import InputProber
+
+# Длина одного куска по умолчанию, секунд (режем только по ключевым кадрам)
+CHUNK_SECONDS = 30.0
+# Описание подготовленной лесенки в выходном каталоге
+LADDER_NAME = "ladder.json"
+_WORK_DIR = ".chunks"
+_AUDIO_NAME = "audio.mka"
+# Куски пишем в Matroska: в нее помещается любой кодек, и concat ее склеивает
+_CHUNK_FORMAT = "matroska"
+_CHUNK_SUFFIX = ".mkv"
+
+
+def probe_keyframes(path: str, timeout: Optional[float] = None) -> List[float]:
+    """Get presentation times of the video keyframes of a file.
+
+    Reads packet flags only, so nothing is decoded and even long files
+    take a few seconds.
+    """
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-show_entries",
+            "packet=pts_time,flags",
+            "-of",
+            "csv=p=0",
+            path,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        timeout=timeout,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {result.stderr.strip()}")
+
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            keyframes.append(float(pts))
+    return sorted(keyframes)
+
+
+def plan_chunks(
+    keyframes: List[float], chunk_seconds: float = CHUNK_SECONDS
+) -> List[Tuple[float, float]]:
+    """Group keyframes into chunks of at least ``chunk_seconds``.
+
+    Returns (start, duration) pairs; the first chunk starts at 0 and the
+    last one has duration 0, meaning "until the end of the file".
+    """
+    chunks = []
+    start = 0.0
+    for keyframe in keyframes:
+        if keyframe - start >= chunk_seconds:
+            chunks.append((start, keyframe - start))
+            start = keyframe
+    chunks.append((start, 0.0))
+    return chunks
+
+
+@dataclass
+class TranscodeResult:
+    """Outcome of a chunked transcode; ``cpu_seconds`` covers all ffmpeg runs."""
+
+    files: Dict[str, Path]
+    chunks: int
+    duration: float
+    wall_seconds: float
+    cpu_seconds: float
+
+    @property
+    def speed(self) -> float:
+        """Seconds of video transcoded per second of wall time."""
+        return self.duration / self.wall_seconds if self.wall_seconds else 0.0
+
+
+class ChunkedTranscoder:
+    """Transcode a file's whole ladder in parallel chunks.
+
+    The file is cut at keyframes into chunks of about ``chunk_seconds``;
+    every chunk is encoded to all variants by its own ffmpeg (encoders
+    limited to ``threads`` threads each), ``jobs`` of them at a time, and
+    the audio track is encoded once alongside. By default ``jobs`` keeps
+    the encoder threads of all running chunks within the CPU count. The chunks of every variant
+    are then joined with the concat demuxer into ``<label>.mp4``, which
+    ``FFmpegBackend.build_copy_command`` publishes without re-encoding.
+    """
+
+    def __init__(
+        self,
+        variants: List[StreamVariant],
+        chunk_seconds: float = CHUNK_SECONDS,
+        jobs: Optional[int] = None,
+        threads: int = 1,
+        keyframe_interval: float = 2.0,
+        prober: Optional[InputProber] = None,
+    ):
+        self.variants = variants
+        self.chunk_seconds = chunk_seconds
+        # каждый кусок занимает по threads потоков на вариант
+        self.jobs = jobs or max(1, (os.cpu_count() or 1) // (len(variants) * threads))
+        self.keyframe_interval = keyframe_interval
+        # скопированный вариант не получил бы принудительных ключевых кадров,
+        # и его GOP не совпали бы с остальными вариантами
+        self.backend = FFmpegBackend(
+            threads=threads,
+            loglevel="error",
+            prober=prober,
+            passthrough=False,
+            output_format=_CHUNK_FORMAT,
+        )
+
+    def transcode(
+        self,
+        path: str,
+        out_dir: Path,
+        audio: bool = True,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> TranscodeResult:
+        """Transcode ``path`` into ``out_dir``; ``on_progress(done, total)``."""
+        started = time.monotonic()
+        # concat ищет относительные пути от файла списка
+        out_dir = out_dir.absolute()
+        cpu_before = children_cpu_seconds()
+
+        source = InputSource(InputType.FILE, path, loop=False, realtime=False)
+        media_info = self.backend.prober.probe(source)
+        if media_info is None or not media_info.has_video:
+            raise RuntimeError(f"Failed to probe video of '{path}'")
+        # одинаковый шаг ключевых кадров у всех вариантов, чтобы их можно было
+        # переключать на границах GOP
+        variants = [
+            replace(v, keyframe_interval=v.keyframe_interval or self.keyframe_interval)
+            for v in self.backend.select_variants(self.variants, media_info)
+        ]
+        # -ss отсчитывается от start_time файла, а pts ключевых кадров нет
+        keyframes = [t - media_info.start_time for t in probe_keyframes(path)]
+        chunks = plan_chunks(keyframes, self.chunk_seconds)
+
+        work_dir = out_dir / _WORK_DIR
+        # остатки прерванного прогона
+        shutil.rmtree(work_dir, ignore_errors=True)
+        work_dir.mkdir(parents=True)
+        commands = [
+            self._chunk_command(
+                path, i, start, duration, variants, media_info, work_dir
+            )
+            for i, (start, duration) in enumerate(chunks)
+        ]
+        audio_path = None
+        if audio and media_info.has_audio:
+            audio_path = work_dir / _AUDIO_NAME
+            # звук кодируем целиком: на стыках кусков AAC дал бы щелчки
+            commands.insert(
+                0,
+                self.backend.build_audio_command(
+                    source, variants[0], str(audio_path), media_info
+                ),
+            )
+        _run_parallel(commands, self.jobs, on_progress)
+
+        files = {}
+        concats = []
+        for variant in variants:
+            parts = [
+                work_dir / f"{i:05d}_{variant.label}{_CHUNK_SUFFIX}"
+                for i in range(len(chunks))
+            ]
+            files[variant.label] = out_dir / f"{variant.label}.mp4"
+            concats.append(
+                _concat_command(parts, audio_path, files[variant.label], work_dir)
+            )
+        # склейка только копирует пакеты, упирается в диск, а не в CPU
+        _run_parallel(concats, len(concats))
+
+        self._write_ladder(out_dir, path, variants, files, media_info)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return TranscodeResult(
+            files=files,
+            chunks=len(chunks),
+            duration=media_info.duration,
+            wall_seconds=time.monotonic() - started,
+            cpu_seconds=children_cpu_seconds() - cpu_before,
+        )
+
+    def _chunk_command(
+        self,
+        path: str,
+        index: int,
+        start: float,
+        duration: float,
+        variants: List[StreamVariant],
+        media_info: MediaInfo,
+        work_dir: Path,
+    ) -> List[str]:
+        """Build the command encoding one chunk to ``<index>_<label>.mkv`` files."""
+        clip = InputSource(
+            InputType.FILE,
+            path,
+            loop=False,
+            realtime=False,
+            start=start,
+            duration=duration,
+        )
+        return self.backend.build_command(
+            stream_key=f"{index:05d}",
+            input_source=clip,
+            variants=variants,
+            output_base_url=str(work_dir),
+            audio_enabled=False,
+            media_info=media_info,
+        )
+
+    def _write_ladder(
+        self,
+        out_dir: Path,
+        path: str,
+        variants: List[StreamVariant],
+        files: Dict[str, Path],
+        media_info: MediaInfo,
+    ) -> None:
+        ladder = {
+            "source": os.path.abspath(path),
+            "duration": media_info.duration,
+            "variants": [
+                {
+                    "label": v.label,
+                    "file": files[v.label].name,
+                    "width": v.width,
+                    "height": v.height,
+                    "bitrate": v.bitrate,
+                    "video_codec": v.video_codec,
+                }
+                for v in variants
+            ],
+        }
+        (out_dir / LADDER_NAME).write_text(json.dumps(ladder, indent=2) + "\n")
+
+
+def load_prepared(directory: Path) -> Dict[str, str]:
+    """Get the pre-encoded files of a ``ChunkedTranscoder`` output (label -> path)."""
+    # ffmpeg демона запускается не из текущего каталога
+    directory = directory.absolute()
+    ladder = json.loads((directory / LADDER_NAME).read_text())
+    # транскодировать можно в любой кодек, а публиковать только в H.264
+    check_rtmp_codecs(
+        [
+            StreamVariant(
+                v["label"], v["bitrate"], v["width"], v["height"], v["video_codec"]
+            )
+            for v in ladder["variants"]
+        ]
+    )
+    files = {}
+    for variant in ladder["variants"]:
+        path = directory / variant["file"]
+        if not path.is_file():
+            raise ValueError(f"Missing variant file {path}")
+        files[variant["label"]] = str(path)
+    return files
+
+
+def _concat_command(
+    parts: List[Path], audio_path: Optional[Path], output: Path, work_dir: Path
+) -> List[str]:
+    """Build the command joining chunks (and the audio track) without re-encoding."""
+    list_path = work_dir / f"{output.stem}.txt"
+    list_path.write_text("".join(f"file '{part}'\n" for part in parts))
+    command = ["ffmpeg", "-loglevel", "error", "-f", "concat", "-safe", "0"]
+    command += ["-i", str(list_path)]
+    if audio_path is not None:
+        command += ["-i", str(audio_path), "-map", "0:v:0", "-map", "1:a:0"]
+    # faststart: индекс в начале файла, публикация стартует без поиска по файлу
+    return command + ["-c", "copy", "-movflags", "+faststart", "-y", str(output)]
+
+
+def _run_parallel(
+    commands: List[List[str]],
+    jobs: int,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> None:
+    """Run ffmpeg commands, ``jobs`` at a time; raise on the first failure.
+
+    Every ffmpeg is a separate process, so threads are enough to keep all
+    cores busy.
+    """
+    done = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = {executor.submit(_run, command) for command in commands}
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_EXCEPTION)
+            for future in finished:
+                _raise_failed(future, executor)
+                done += 1
+                if on_progress:
+                    on_progress(done, len(commands))
+
+
+def _raise_failed(future: Future, executor: ThreadPoolExecutor) -> None:
+    if future.exception() is not None:
+        # уже запущенные ffmpeg доработают, новые не стартуют
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise future.exception()
+
+
+def _run(command: List[str]) -> None:
+    result = subprocess.run(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"ffmpeg exited {result.returncode}")
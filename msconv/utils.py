@@ -2,12 +2,25 @@ import os
 import sys
 import signal
 import subprocess
-import time
-import threading
 import click
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
 from pathlib import Path
+from .codecs import get_codec
 from .models import StreamVariant
+from .registry import (
+    ProcessRecord,
+    ProcessRegistry,
+    get_state_dir,
+    wait_for_exit,
+    wait_for_exits,
+)
+
+# Разделитель ключей потоков, которые публикует один общий процесс ffmpeg
+GROUP_SEPARATOR = "+"
+# Сколько ждать завершения ffmpeg после SIGTERM, прежде чем убить
+STOP_TIMEOUT = 10.0
+# Сколько ждать после SIGKILL
+KILL_TIMEOUT = 2.0
 
 
 def get_default_variants() -> List[StreamVariant]:
@@ -27,19 +40,44 @@ def parse_variants(variants_str: str) -> List[StreamVariant]:
         parts = variant_spec.split(":")
         if len(parts) >= 4:
             label, bitrate, width, height = parts[:4]
-            variants.append(
-                StreamVariant(
-                    label=label, bitrate=bitrate, width=int(width), height=int(height)
-                )
+            variant = StreamVariant(
+                label=label, bitrate=bitrate, width=int(width), height=int(height)
             )
+            if len(parts) >= 5 and parts[4]:
+                # пятое поле -- кодек: 360p:400k:640:360:av1
+                variant.video_codec = get_codec(parts[4]).encoder
+            variants.append(variant)
     return variants
 
 
-def get_pid_file(stream_key: str) -> Path:
-    """Get PID file path for a stream."""
-    pid_dir = Path("pids")
-    pid_dir.mkdir(exist_ok=True)
-    return pid_dir / f"{stream_key}.pid"
+def get_group_key(stream_keys: List[str]) -> str:
+    """Name a process publishing several stream keys from one input."""
+    return GROUP_SEPARATOR.join(stream_keys)
+
+
+def split_group_key(group_key: str) -> List[str]:
+    """Get stream keys published by a (possibly shared) process."""
+    return group_key.split(GROUP_SEPARATOR)
+
+
+def get_socket_path() -> Path:
+    """Get Unix socket path of the msconv daemon."""
+    socket_path = os.environ.get("MSCONV_SOCKET")
+    if socket_path:
+        return Path(socket_path)
+    return get_state_dir() / "msconv.sock"
+
+
+def list_local_streams() -> Dict[str, ProcessRecord]:
+    """Get live registered processes by process key."""
+    with ProcessRegistry() as registry:
+        return registry.list()
+
+
+def find_local_stream(stream_key: str) -> Optional[ProcessRecord]:
+    """Get the live registered process publishing a stream key or group."""
+    with ProcessRegistry() as registry:
+        return registry.find(stream_key) or registry.get(stream_key)
 
 
 def get_log_file(stream_key: str) -> Path:
@@ -49,85 +87,129 @@ def get_log_file(stream_key: str) -> Path:
     return log_dir / f"{stream_key}.log"
 
 
+def resolve_group_key(stream_key: str, process_keys: Iterable[str]) -> Optional[str]:
+    """Find the process key publishing ``stream_key``, if any."""
+    for process_key in process_keys:
+        if stream_key in split_group_key(process_key):
+            return process_key
+    return None
+
+
 def is_stream_active(stream_key: str) -> bool:
-    """Check if a stream is currently active."""
-    return get_pid_file(stream_key).exists()
+    """Check if a stream is currently active, alone or in a shared process."""
+    with ProcessRegistry() as registry:
+        return registry.find(stream_key) is not None
 
 
-def start_ffmpeg_process(command: str, stream_key: str) -> subprocess.Popen:
-    """Start FFmpeg process and save PID."""
+def start_ffmpeg_process(
+    command: List[str], stream_key: str, append: bool = False
+) -> subprocess.Popen:
+    """Start FFmpeg process without a shell and register it.
+
+    ffmpeg leads its own session, so its PID is also the process group
+    that ``stop_stream_process`` signals. With ``append`` the stream's log
+    is continued instead of started over.
+    """
     log_file = get_log_file(stream_key)
-    pid_file = get_pid_file(stream_key)
 
-    with open(log_file, "w") as log_fd:
+    with open(log_file, "a" if append else "w") as log_fd:
         process = subprocess.Popen(
             command,
-            shell=True,
             stdout=log_fd,
             stderr=subprocess.STDOUT,
-            preexec_fn=os.setsid,
+            start_new_session=True,
         )
 
-    # Save PID
-    with open(pid_file, "w") as f:
-        f.write(str(process.pid))
-
+    with ProcessRegistry() as registry:
+        registry.register(stream_key, split_group_key(stream_key), process.pid, command)
     return process
 
 
-def stop_stream_process(stream_key: str) -> None:
-    """Stop a stream process by stream key."""
-    pid_file = get_pid_file(stream_key)
+def stop_processes(
+    records: List[ProcessRecord], timeout: float = STOP_TIMEOUT
+) -> Dict[str, Tuple[float, bool]]:
+    """Stop processes concurrently, escalating to SIGKILL after ``timeout``.
+
+    All processes get SIGTERM at once, so ffmpeg can finish its outputs
+    (FLV trailers) in parallel. Returns ``(seconds, killed)`` per process key.
+    """
+    for record in records:
+        try:
+            os.killpg(record.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    exited = wait_for_exits(records, timeout)
+    results = {key: (seconds, False) for key, seconds in exited.items()}
+
+    stuck = [r for r in records if r.process_key not in exited]
+    for record in stuck:
+        try:
+            os.killpg(record.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    killed = wait_for_exits(stuck, KILL_TIMEOUT)
+    for record in stuck:
+        results[record.process_key] = (
+            timeout + killed.get(record.process_key, 0.0),
+            True,
+        )
 
-    if not pid_file.exists():
+    with ProcessRegistry() as registry:
+        for record in records:
+            registry.unregister(record.process_key, record.pid)
+    return results
+
+
+def stop_stream_process(stream_key: str, timeout: float = STOP_TIMEOUT) -> None:
+    """Stop a stream process by stream key and wait for it to exit.
+
+    A key published by a shared process stops the whole group.
+    """
+    record = find_local_stream(stream_key)
+    if record is None:
         raise RuntimeError(f"No active stream found for '{stream_key}'")
+    if record.process_key != stream_key:
+        click.echo(
+            f"'{stream_key}' is published by shared process '{record.process_key}'"
+        )
 
-    with open(pid_file, "r") as f:
-        pid = int(f.read().strip())
+    click.echo(f"Sending SIGTERM to ffmpeg (PID {record.pid})...")
+    seconds, killed = stop_processes([record], timeout)[record.process_key]
+    if killed:
+        click.echo(f"ffmpeg ignored SIGTERM for {timeout:g}s, killed.", err=True)
+    click.echo(f"Stream '{record.process_key}' stopped in {seconds:.1f}s.")
 
-    try:
-        os.killpg(os.getpgid(pid), signal.SIGTERM)
-        click.echo(f"Sent SIGTERM to ffmpeg (PID {pid}).")
-    except ProcessLookupError:
-        click.echo(f"No process with PID {pid} found.", err=True)
-    except Exception as e:
-        click.echo(f"Error killing process {pid}: {e}", err=True)
-    finally:
-        pid_file.unlink()
-        click.echo(f"Stream '{stream_key}' stopped.")
 
+def tail_logs(log_file: Path, stream_key: str, follow: bool = True) -> None:
+    """Tail logs until the stream's process exits; Ctrl+C stops it.
+
+    With ``follow=False`` only waits, for a log an earlier call follows.
+    """
 
-def tail_logs(log_file: Path, stream_key: str) -> None:
-    """Tail logs and handle keyboard interrupt."""
+    import threading
+    from .logs import LogFollower
 
     def tail_logs_thread():
+        follower = LogFollower({stream_key: log_file})
         try:
-            # Ждем пока log_file не появится и что-то в нем не будет записано
-            while True:
-                if log_file.exists() and log_file.stat().st_size > 0:
-                    break
-                time.sleep(0.5)
-
-            with open(log_file, "r") as lf:
-                lf.seek(0, os.SEEK_END)
-                while True:
-                    line = lf.readline()
-                    if not line:
-                        time.sleep(1)
-                        continue
-                    click.echo(line.rstrip())
+            follower.follow(lambda _, line: click.echo(line))
         except Exception:
             pass
 
     # Создаем и запускаем поток для чтения логов
-    t = threading.Thread(target=tail_logs_thread, daemon=True)
-    t.start()
+    if follow:
+        t = threading.Thread(target=tail_logs_thread, daemon=True)
+        t.start()
 
     try:
-        # Ожидаем завершения потока
-        pid_file = get_pid_file(stream_key)
-        while pid_file.exists():
-            time.sleep(1)
+        # Ждем завершения ffmpeg (или его остановки из другого терминала)
+        with ProcessRegistry() as registry:
+            record = registry.get(stream_key)
+        if record is not None:
+            wait_for_exit(record)
+            with ProcessRegistry() as registry:
+                registry.unregister(stream_key, record.pid)
     # Если пользователь прервал выполнение то остановим поток стриминга и выйдем
     except KeyboardInterrupt:
         click.echo(f"\nStopping stream '{stream_key}'...")
@@ -0,0 +1,158 @@
+"""Compare quality per CPU of the video codec plugins on sample content.
+
+Usage:
+    python scripts/bench_codecs.py [--input sample.mp4] [--size 1280x720]
+        [--bitrate 1500k] [--preset fast] [--duration 10]
+        [--codecs x264,x265,svtav1,vp9] [--metric auto|vmaf|psnr] [--json out.json]
+
+The sample (``testsrc2`` by default) is first rendered losslessly at the
+target size as the reference; every codec then encodes the reference with
+the options ``msconv.codecs`` generates for the same variant, and the
+result is scored against the reference with ``libvmaf`` (when ffmpeg has
+it) or ``psnr``. The report shows the bitrate actually produced, the
+score, CPU-seconds per second of video and score points per core.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from msconv.capacity import children_cpu_seconds  # noqa: E402
+from msconv.codecs import get_codec  # noqa: E402
+from msconv.models import StreamVariant  # noqa: E402
+
+
+def ffmpeg(args: List[str]) -> str:
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostdin", "-y"] + args,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return result.stderr
+
+
+def has_filter(name: str) -> bool:
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-filters"], capture_output=True, text=True
+    )
+    return f" {name} " in result.stdout
+
+
+def render_reference(args, path: str) -> None:
+    if args.input:
+        source = ["-i", args.input]
+    else:
+        source = ["-f", "lavfi", "-i", f"testsrc2=size={args.size}:rate={args.rate}"]
+    width, height = args.size.split("x")
+    ffmpeg(
+        source
+        + ["-t", str(args.duration), "-vf", f"scale={width}:{height}", "-an"]
+        + ["-c:v", "ffv1", path]
+    )
+
+
+def score(distorted: str, reference: str, metric: str) -> Optional[float]:
+    if metric == "vmaf":
+        output = ffmpeg(
+            ["-i", distorted, "-i", reference]
+            + ["-lavfi", "[0:v][1:v]libvmaf", "-f", "null", "-"]
+        )
+        match = re.search(r"VMAF score: ([\d.]+)", output)
+    else:
+        output = ffmpeg(
+            ["-i", distorted, "-i", reference]
+            + ["-lavfi", "[0:v][1:v]psnr", "-f", "null", "-"]
+        )
+        match = re.search(r"average:([\d.]+|inf)", output)
+    if match is None or match.group(1) == "inf":
+        return None
+    return float(match.group(1))
+
+
+def run_codec(name: str, args, reference: str, out_dir: str, metric: str) -> dict:
+    codec = get_codec(name)
+    width, height = args.size.split("x")
+    variant = StreamVariant(
+        label=name,
+        bitrate=args.bitrate,
+        width=int(width),
+        height=int(height),
+        video_codec=codec.encoder,
+        preset=args.preset,
+    )
+    output = os.path.join(out_dir, f"{name}.mkv")
+
+    cpu_before = children_cpu_seconds()
+    ffmpeg(["-i", reference] + codec.video_args(variant, args.preset) + [output])
+    cpu = children_cpu_seconds() - cpu_before
+
+    kbps = os.path.getsize(output) * 8 / 1000 / args.duration
+    quality = score(output, reference, metric)
+    cores = cpu / args.duration
+    return {
+        "codec": codec.encoder,
+        "preset": args.preset,
+        "kbps": round(kbps, 1),
+        metric: quality,
+        "cpu_seconds": round(cpu, 2),
+        "cores": round(cores, 3),
+        "score_per_core": round(quality / cores, 2) if quality and cores else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", help="Sample file (default: testsrc2)")
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--rate", type=int, default=30)
+    parser.add_argument("--bitrate", default="1500k")
+    parser.add_argument("--preset", default="fast", help="x264-scale preset")
+    parser.add_argument("--duration", type=int, default=10)
+    parser.add_argument("--codecs", default="x264,x265,svtav1,vp9")
+    parser.add_argument("--metric", choices=["auto", "vmaf", "psnr"], default="auto")
+    parser.add_argument("--json", dest="json_path", help="Write results here")
+    args = parser.parse_args()
+
+    metric = args.metric
+    if metric == "auto":
+        metric = "vmaf" if has_filter("libvmaf") else "psnr"
+
+    results = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        reference = os.path.join(out_dir, "reference.mkv")
+        render_reference(args, reference)
+        print(f"{'codec':<12} {'kbps':>8} {metric:>7} {'cores':>7} {'per core':>9}")
+        for name in args.codecs.split(","):
+            try:
+                result = run_codec(name.strip(), args, reference, out_dir, metric)
+            except (RuntimeError, ValueError) as e:
+                # энкодер может быть не собран в этом ffmpeg
+                print(f"{name:<12} failed: {e}")
+                continue
+            results.append(result)
+            quality = result[metric]
+            per_core = result["score_per_core"]
+            print(
+                f"{result['codec']:<12} {result['kbps']:8.1f} "
+                f"{quality if quality is not None else float('nan'):7.2f} "
+                f"{result['cores']:7.2f} "
+                f"{per_core if per_core is not None else float('nan'):9.2f}"
+            )
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"metric": metric, "results": results}, f, indent=2)
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Measure CLI startup cost and fail when it exceeds a budget.
+
+Usage:
+    python scripts/bench_import.py [--budget-ms 120] [--repeat 5]
+
+Runs ``python -X importtime -c "import msconv.cli"`` several times and
+takes the best cumulative import time of ``msconv.cli``; also times a full
+``python -m msconv --help`` invocation. Prints the heaviest modules and
+exits with status 1 if the import exceeds the budget or a module that
+should only be loaded by its subcommand (requests, curses, asyncio, ...)
+shows up at startup, so it can guard regressions in CI.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Tuple
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Модули, которые должны импортироваться только нужными подкомандами
+LAZY_MODULES = [
+    "requests",
+    "xml.etree.ElementTree",
+    "curses",
+    "asyncio",
+    "threading",
+    "ctypes",
+    "gzip",
+    "sqlite3",
+    "msconv.listers",
+    "msconv.players",
+    "msconv.dashboard",
+    "msconv.daemon",
+    "msconv.bench",
+]
+
+
+def import_profile() -> Tuple[int, Dict[str, int]]:
+    """Import msconv.cli in a fresh interpreter, return (total us, per module)."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import msconv.cli"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.strip() == "site":
+            # все, что выше, грузит сам интерпретатор, а не msconv
+            modules.clear()
+            continue
+        modules[name.strip()] = int(cumulative)
+    return modules.get("msconv.cli", 0), modules
+
+
+def time_help() -> float:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "msconv", "--help"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - started
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=120.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Heaviest modules")
+    args = parser.parse_args()
+
+    # первый прогон прогревает __pycache__ и файловый кэш
+    import_profile()
+    runs = [import_profile() for _ in range(args.repeat)]
+    total, modules = min(runs, key=lambda run: run[0])
+    help_seconds = min(time_help() for _ in range(args.repeat))
+
+    print(f"import msconv.cli: {total / 1000:.1f} ms (best of {args.repeat})")
+    print(f"msconv --help:     {help_seconds * 1000:.1f} ms wall")
+    print("heaviest modules (cumulative):")
+    for name, cumulative in sorted(modules.items(), key=lambda m: -m[1])[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(eager)}")
+        failed = True
+    if total / 1000 > args.budget_ms:
+        print(f"FAIL: import exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
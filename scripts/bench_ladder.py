@@ -0,0 +1,78 @@
+"""Compare encode fps and CPU cost of the default and ladder filter graphs.
+
+Usage:
+    python scripts/bench_ladder.py [--duration 10] [--cpu-budget 4] [--repeat 3]
+
+Both graphs encode the same synthetic ``testsrc`` input (no ``-re``, so the
+encoder runs as fast as it can) into local FLV files; the script reports
+encode fps, wall time, CPU-seconds and CPU-seconds per second of video
+(the cores the ladder of one realtime stream needs).
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from msconv.backends import FFmpegBackend  # noqa: E402
+from msconv.capacity import children_cpu_seconds  # noqa: E402
+from msconv.models import InputSource, InputType  # noqa: E402
+from msconv.utils import get_default_variants  # noqa: E402
+
+
+def run_once(backend: FFmpegBackend, source: InputSource, out_dir: str) -> dict:
+    command = backend.build_command(
+        stream_key="bench",
+        input_source=source,
+        variants=get_default_variants(),
+        output_base_url=out_dir,
+        audio_enabled=False,
+    )
+    cpu_before = children_cpu_seconds()
+    started = time.monotonic()
+    # глобальные опции до входов: после выхода ffmpeg их не применяет
+    subprocess.run(command[:1] + ["-y"] + command[1:], check=True)
+    wall = time.monotonic() - started
+    return {"wall": wall, "cpu": children_cpu_seconds() - cpu_before}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=int, default=10)
+    parser.add_argument("--rate", type=int, default=30)
+    parser.add_argument("--cpu-budget", type=float, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = InputSource(
+        InputType.LAVFI,
+        f"testsrc=size=1920x1080:rate={args.rate}:duration={args.duration}",
+        realtime=False,
+    )
+    frames = args.duration * args.rate
+    backends = {
+        "split": FFmpegBackend(loglevel="error"),
+        "ladder": FFmpegBackend(
+            ladder=True, cpu_budget=args.cpu_budget, loglevel="error"
+        ),
+    }
+
+    print(f"{'graph':8s} {'fps':>8s} {'wall s':>8s} {'cpu s':>8s} {'cpu s/s':>8s}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name, backend in backends.items():
+            runs = [run_once(backend, source, out_dir) for _ in range(args.repeat)]
+            wall = statistics.median(r["wall"] for r in runs)
+            cpu = statistics.median(r["cpu"] for r in runs)
+            print(
+                f"{name:8s} {frames / wall:8.1f} {wall:8.2f} {cpu:8.2f} "
+                f"{cpu / args.duration:8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
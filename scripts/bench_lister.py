@@ -0,0 +1,221 @@
+"""Benchmark stream listers against generated nginx-rtmp and MediaMTX data.
+
+Usage:
+    python scripts/bench_lister.py [--streams 10000] [--clients 2] [--repeat 20]
+
+Serves a synthetic stat XML and a paginated MediaMTX ``/v3/paths/list``
+from local HTTP stubs and compares the old approach (fresh requests.get +
+ET.fromstring of the whole document) with the pooled, incremental lister,
+with and without its short-TTL cache, then sequential vs concurrent
+fetching of both sources. The stubs can be reused to point listers at
+fake servers (``serve_nginx_stat`` / ``serve_mediamtx``).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from msconv.listers import (  # noqa: E402
+    MediaMTXLister,
+    NginxRtmpLister,
+    fetch_streams,
+)
+
+VARIANTS = ["1080p", "720p", "480p", "360p"]
+
+
+def generate_stat(num_streams: int, clients_per_stream: int) -> bytes:
+    """Generate an nginx-rtmp style stat document."""
+    parts = ["<?xml version='1.0'?><rtmp><server>"]
+    for app in ("other", "live"):
+        parts.append(f"<application><name>{app}</name><live>")
+        for i in range(num_streams if app == "live" else num_streams // 10):
+            name = f"stream{i // len(VARIANTS)}_{VARIANTS[i % len(VARIANTS)]}"
+            parts.append(
+                f"<stream><name>{name}</name><time>123456</time>"
+                f"<bw_in>2500000</bw_in><bytes_in>987654321</bytes_in>"
+                f"<bw_out>0</bw_out><bytes_out>0</bytes_out>"
+            )
+            for c in range(clients_per_stream):
+                parts.append(
+                    f"<client><id>{c}</id><address>10.0.0.{c}</address>"
+                    f"<time>1000</time><flashver>FMLE/3.0</flashver>"
+                    f"<dropped>0</dropped><avsync>0</avsync><timestamp>1</timestamp>"
+                    f"{'<publishing/>' if c == 0 else ''}<active/></client>"
+                )
+            parts.append(
+                "<meta><video><width>1280</width><height>720</height>"
+                "<frame_rate>30</frame_rate><codec>H264</codec></video>"
+                "<audio><codec>AAC</codec></audio></meta>"
+                f"<nclients>{clients_per_stream}</nclients><publishing/><active/>"
+                "</stream>"
+            )
+        parts.append(f"<nclients>{num_streams}</nclients></live></application>")
+    parts.append("</server></rtmp>")
+    return "".join(parts).encode()
+
+
+def serve(
+    handler: Callable[[str], Tuple[bytes, str]], delay: float = 0.0
+) -> ThreadingHTTPServer:
+    """Serve ``handler(path) -> (body, content type)`` on a random local port."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(delay)
+            body, content_type = handler(self.path)
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve_nginx_stat(document: bytes, delay: float = 0.0) -> ThreadingHTTPServer:
+    """Stub of the nginx-rtmp ``/stat`` endpoint."""
+    return serve(lambda path: (document, "text/xml"), delay)
+
+
+def serve_mediamtx(
+    num_streams: int, readers_per_path: int, delay: float = 0.0
+) -> ThreadingHTTPServer:
+    """Stub of the paginated MediaMTX ``/v3/paths/list`` endpoint."""
+    names = [
+        f"stream{i // len(VARIANTS)}_{VARIANTS[i % len(VARIANTS)]}"
+        for i in range(num_streams)
+    ]
+
+    def handler(path: str) -> Tuple[bytes, str]:
+        query = parse_qs(urlparse(path).query)
+        page = int(query.get("page", ["0"])[0])
+        per_page = int(query.get("itemsPerPage", ["100"])[0])
+        items = [
+            {
+                "name": name,
+                "ready": True,
+                "tracks": ["H264", "MPEG-4 Audio"],
+                "bytesReceived": 123456,
+                "readers": [
+                    {"type": "rtspSession", "id": str(r)}
+                    for r in range(readers_per_path)
+                ],
+            }
+            for name in names[page * per_page : (page + 1) * per_page]
+        ]
+        body = {
+            "pageCount": (len(names) + per_page - 1) // per_page,
+            "itemCount": len(names),
+            "items": items,
+        }
+        return json.dumps(body).encode(), "application/json"
+
+    return serve(handler, delay)
+
+
+def legacy_get_active_streams(url: str) -> dict:
+    """The previous implementation: no session, whole-document parse."""
+    response = requests.get(url, timeout=5)
+    response.raise_for_status()
+    xml_root = ET.fromstring(response.text)
+    streams = {}
+    for app in xml_root.findall("server/application"):
+        name_el = app.find("name")
+        if name_el is None or name_el.text != "live":
+            continue
+        for stream in app.findall("live/stream"):
+            base, _, variant = stream.find("name").text.rpartition("_")
+            streams.setdefault(base, set()).add(variant)
+    return streams
+
+
+def measure(name: str, func, repeat: int) -> None:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+
+    # Память меряем отдельно: tracemalloc сильно замедляет сам парсинг
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:24s} {statistics.median(timings) * 1000:9.1f} ms "
+        f"{peak / 1024 / 1024:9.1f} MiB  ({len(result)} streams)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.2,
+        help="Simulated server latency for the merge benchmark, seconds",
+    )
+    args = parser.parse_args()
+
+    document = generate_stat(args.streams, args.clients)
+    nginx = serve_nginx_stat(document)
+    host, port = nginx.server_address
+    print(f"stat document: {len(document) / 1024 / 1024:.1f} MiB\n")
+    print(f"{'variant':24s} {'median':>12s} {'peak mem':>13s}")
+
+    url = f"http://{host}:{port}/stat"
+    measure("legacy", lambda: legacy_get_active_streams(url), args.repeat)
+
+    uncached = NginxRtmpLister(host, str(port), cache_ttl=0)
+    measure("pooled+iterparse", uncached.get_active_streams, args.repeat)
+
+    cached = NginxRtmpLister(host, str(port), cache_ttl=1.0)
+    measure("pooled+iterparse+ttl", cached.get_active_streams, args.repeat)
+
+    # Слияние nginx + MediaMTX с задержкой сети: последовательно против параллельно
+    slow_nginx = serve_nginx_stat(document, args.latency)
+    mediamtx = serve_mediamtx(args.streams, args.clients, args.latency)
+    media_host, media_port = mediamtx.server_address
+    listers = {
+        "nginx": NginxRtmpLister(*map(str, slow_nginx.server_address), cache_ttl=0),
+        "MediaMTX": MediaMTXLister(media_host, str(media_port), page_size=1000),
+    }
+    print()
+    measure(
+        "nginx+mediamtx serial",
+        lambda: [lister.get_active_streams() for lister in listers.values()][0],
+        args.repeat,
+    )
+    measure("nginx+mediamtx parallel", lambda: fetch_streams(listers)[0], args.repeat)
+
+    nginx.shutdown()
+    slow_nginx.shutdown()
+    mediamtx.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Measure glass-to-glass latency of the publish -> nginx-rtmp -> MediaMTX path.
+
+Usage:
+    python scripts/measure_latency.py [--profile default --profile lowlatency]
+        [--duration 30] [--read-url rtsp://localhost:8554/{key}]
+
+Publishes a ``testsrc`` pattern with the local time burnt in and a
+full-frame white flash every ``--period`` seconds through FFmpegBackend
+(one variant, the selected profile), and reads it back with ffmpeg. Both
+the publisher (on its input, before encoding) and the reader report the
+average luma of every frame; the time between a flash seen by the
+publisher and the same flash seen by the reader is the end-to-end
+latency. Needs a running stack (``docker-compose up``) and ffmpeg built
+with libfreetype for the burnt-in clock (``--no-clock`` otherwise).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from msconv.backends import FFmpegBackend  # noqa: E402
+from msconv.models import InputSource, InputType, StreamVariant  # noqa: E402
+from msconv.profiles import PROFILES, apply_profile  # noqa: E402
+
+# Средняя яркость кадра выше порога -- вспышка
+FLASH_THRESHOLD = 200.0
+FLASH_DURATION = 0.2
+
+LUMA_FILTER = (
+    "signalstats,metadata=print:key=lavfi.signalstats.YAVG:file=pipe\\:1:direct=1"
+)
+
+
+def source_graph(width: int, height: int, rate: int, period: float, clock: bool) -> str:
+    graph = (
+        f"testsrc=size={width}x{height}:rate={rate},"
+        f"drawbox=x=0:y=0:w=iw:h=ih:color=white:t=fill:"
+        f"enable='lt(mod(t,{period:g}),{FLASH_DURATION:g})'"
+    )
+    if clock:
+        graph += (
+            ",drawtext=text='%{localtime\\:%X}':"
+            "x=20:y=20:fontsize=48:fontcolor=black:box=1:boxcolor=yellow"
+        )
+    return graph
+
+
+class FlashDetector(threading.Thread):
+    """Record the monotonic time of every flash in ffmpeg's luma output."""
+
+    def __init__(self, process: subprocess.Popen):
+        super().__init__(daemon=True)
+        self.process = process
+        self.flashes: List[float] = []
+
+    def run(self) -> None:
+        bright = False
+        assert self.process.stdout is not None
+        for raw in self.process.stdout:
+            line = raw.decode(errors="replace").strip()
+            key, _, value = line.partition("=")
+            if key != "lavfi.signalstats.YAVG":
+                continue
+            now = time.monotonic()
+            is_bright = float(value) >= FLASH_THRESHOLD
+            if is_bright and not bright:
+                self.flashes.append(now)
+            bright = is_bright
+
+
+def pair_latencies(
+    sent: List[float], received: List[float], period: float
+) -> List[float]:
+    """Match every received flash with the latest flash sent before it."""
+    latencies = []
+    for r in received:
+        earlier = [s for s in sent if s <= r]
+        if earlier and r - earlier[-1] < period:
+            latencies.append(r - earlier[-1])
+    return latencies
+
+
+def measure(args: argparse.Namespace, profile: str) -> dict:
+    stream_key = f"latency_{profile}"
+    variant = StreamVariant("src", args.bitrate, args.width, args.height)
+    source = InputSource(
+        InputType.LAVFI,
+        source_graph(args.width, args.height, args.rate, args.period, args.clock),
+    )
+    variants, source = apply_profile(profile, [variant], source)
+
+    backend = FFmpegBackend(passthrough=False, loglevel="error")
+    command = backend.build_command(
+        stream_key=stream_key,
+        input_source=source,
+        variants=variants,
+        output_base_url=args.nginx_rtmp_url,
+        audio_enabled=False,
+    )
+    # Вторым выходом публикатор сообщает яркость входных кадров до кодирования
+    command += ["-map", "0:v", "-vf", LUMA_FILTER, "-f", "null", "-"]
+
+    read_url = args.read_url.format(key=f"{stream_key}_{variant.label}")
+    reader_command = ["ffmpeg", "-v", "error", "-nostdin"]
+    if profile != "default":
+        reader_command += ["-fflags", "nobuffer", "-flags", "low_delay"]
+    if read_url.startswith("rtsp://"):
+        reader_command += ["-rtsp_transport", "tcp"]
+    reader_command += ["-i", read_url, "-an", "-vf", LUMA_FILTER, "-f", "null", "-"]
+
+    publisher = subprocess.Popen(
+        command[:1] + ["-nostdin"] + command[1:],
+        stdout=subprocess.PIPE,
+        start_new_session=True,
+    )
+    sender = FlashDetector(publisher)
+    sender.start()
+
+    # Ждем, пока поток появится на сервере
+    deadline = time.monotonic() + args.startup_timeout
+    receiver = None
+    while time.monotonic() < deadline and publisher.poll() is None:
+        reader = subprocess.Popen(reader_command, stdout=subprocess.PIPE)
+        time.sleep(1)
+        if reader.poll() is None:
+            receiver = FlashDetector(reader)
+            receiver.start()
+            break
+    if receiver is None:
+        publisher.terminate()
+        raise RuntimeError(f"Failed to read {read_url}")
+
+    time.sleep(args.duration)
+    for process in (receiver.process, publisher):
+        process.terminate()
+        process.wait()
+
+    latencies = pair_latencies(sender.flashes, receiver.flashes, args.period)
+    result = {"profile": profile, "url": read_url, "samples": len(latencies)}
+    if latencies:
+        result.update(
+            min=min(latencies),
+            median=statistics.median(latencies),
+            max=max(latencies),
+        )
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--profile",
+        action="append",
+        choices=PROFILES,
+        help="Profile to measure, can be repeated (default: all)",
+    )
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--period", type=float, default=2.0)
+    parser.add_argument("--startup-timeout", type=float, default=20.0)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--rate", type=int, default=30)
+    parser.add_argument("--bitrate", default="2500k")
+    parser.add_argument("--nginx-rtmp-url", default="rtmp://localhost:1935/live")
+    parser.add_argument(
+        "--read-url",
+        default="rtsp://localhost:8554/{key}",
+        help="Where to read the stream back, {key} is the published name "
+        "(e.g. rtmp://localhost:1935/live/{key} to skip MediaMTX)",
+    )
+    parser.add_argument("--no-clock", dest="clock", action="store_false")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = [measure(args, profile) for profile in args.profile or PROFILES]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'profile':12s} {'samples':>7s} {'min':>8s} {'median':>8s} {'max':>8s}")
+    for r in results:
+        if not r["samples"]:
+            print(f"{r['profile']:12s} {0:7d}  no flashes matched ({r['url']})")
+            continue
+        print(
+            f"{r['profile']:12s} {r['samples']:7d} {r['min'] * 1000:6.0f}ms "
+            f"{r['median'] * 1000:6.0f}ms {r['max'] * 1000:6.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()